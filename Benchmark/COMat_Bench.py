@@ -0,0 +1,133 @@
+"""
+Benchmarks for COMat: Input file generator for COncrete damaged plasticity Material model in Abaqus
+
+Author: Youngbin LIM
+Contact: lyb0684@naver.com
+"""
+
+import os
+import sys
+import time
+import subprocess
+import tempfile
+import numpy as np
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(Root, 'CoMatGen'))
+
+import COMat_Generator
+
+def random_table(n, seed=0):
+    # Valid random parameter sets around a nominal concrete
+    rng = np.random.default_rng(seed)
+    E = rng.uniform(20.0, 40.0, n)
+    S_cu = rng.uniform(25.0, 60.0, n)
+    # e_cu inside the (S_cu/E, 2*S_cu/E) window
+    e_cu = S_cu/(E*1000.)*rng.uniform(1.1, 1.9, n)
+    S_tu = rng.uniform(2.0, 6.0, n)
+    return {
+        "E": E, "S_cu": S_cu, "e_cu": e_cu,
+        "e_60": rng.uniform(0.002, 0.01, n), "Alpha": rng.uniform(1.0, 4.0, n),
+        "S_tu": S_tu, "e_end": S_tu/(E*1000.)*rng.uniform(2.0, 20.0, n), "Beta": rng.uniform(1.0, 3.0, n),
+        "Tension_Recovery": np.ones(n), "Compression_Recovory": np.zeros(n),
+        "Ref_Length": rng.uniform(10.0, 100.0, n),
+    }
+
+def bench_batch_generate(n=1000):
+    Table = random_table(n)
+    with tempfile.TemporaryDirectory() as Path:
+        # One generate() call per material
+        start = time.perf_counter()
+        for i in range(n):
+            row = [float(Table[key][i]) for key in COMat_Generator.BATCH_COLUMNS]
+            E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, Ref_Length = row
+            COMat_Generator.generate(Path, False, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta,
+                                     Tension_Recovery, Compression_Recovory, False, Ref_Length)
+        t_loop = time.perf_counter() - start
+
+        # One vectorized pass writing a single library
+        start = time.perf_counter()
+        COMat_Generator.generate_batch(Path, Table, False)
+        t_batch = time.perf_counter() - start
+
+    return {"materials": n, "loop_s": t_loop, "batch_s": t_batch, "speedup": t_loop/t_batch}
+
+def bench_writer(rows=200000, repeat=3):
+    # Throughput of np.savetxt against the one-shot writer on a (rows, 2) table, best of repeat
+    Table = np.random.default_rng(0).uniform(-1E3, 1E3, (rows, 2))
+    with tempfile.TemporaryDirectory() as Path:
+        Saved = os.path.join(Path, "savetxt.inp")
+        Written = os.path.join(Path, "writer.inp")
+        t_savetxt = t_writer = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with open(Saved, 'w') as file:
+                np.savetxt(file, Table, fmt='%.6e', delimiter=",")
+            t_savetxt = min(t_savetxt, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            Writer = COMat_Generator.KeywordWriter()
+            Writer.table(Table)
+            Writer.write(Written)
+            t_writer = min(t_writer, time.perf_counter() - start)
+
+        size = os.path.getsize(Written)
+        with open(Saved, 'rb') as a, open(Written, 'rb') as b:
+            identical = a.read() == b.read()
+
+    MB = size/1E6
+    return {"rows": rows, "bytes": size, "identical": identical,
+            "savetxt_MBps": MB/t_savetxt, "writer_MBps": MB/t_writer, "speedup": t_savetxt/t_writer}
+
+# Timed in a fresh interpreter so that nothing is imported beforehand
+STARTUP_SNIPPETS = {
+    "import_generator_s": "import COMat_Generator",
+    "import_cli_s": "import CoMat_CLI",
+    "import_gui_s": "import CoMat",
+    "first_window_s": ("from PyQt5.QtWidgets import QApplication\n"
+                       "import CoMat\n"
+                       "app = QApplication([])\n"
+                       "window = CoMat.App()\n"
+                       "app.processEvents()"),
+}
+
+def bench_startup(repeat=5):
+    # Best of repeat runs, GUI entries are None when PyQt5 is not installed
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    result = {}
+    for key, snippet in STARTUP_SNIPPETS.items():
+        code = ("import sys, time\n"
+                "start = time.perf_counter()\n"
+                "sys.path.insert(0, {!r})\n".format(os.path.join(Root, 'CoMatGen')) + snippet + "\n"
+                "print(time.perf_counter() - start)")
+        times = []
+        for _ in range(repeat):
+            run = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+            if run.returncode != 0:
+                break
+            times.append(float(run.stdout.split()[-1]))
+        result[key] = min(times) if times else None
+    return result
+
+if __name__ == "__main__":
+    which = sys.argv[1] if len(sys.argv) > 1 else "batch"
+
+    if which == "batch":
+        n = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+        result = bench_batch_generate(n)
+        print("Materials: {}".format(result["materials"]))
+        print("generate() loop : {:.3f} s".format(result["loop_s"]))
+        print("generate_batch(): {:.3f} s".format(result["batch_s"]))
+        print("Speedup         : {:.1f}x".format(result["speedup"]))
+    elif which == "writer":
+        rows = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+        result = bench_writer(rows)
+        print("Rows: {}, file size: {:.2f} MB, identical: {}".format(result["rows"], result["bytes"]/1E6, result["identical"]))
+        print("np.savetxt   : {:.1f} MB/s".format(result["savetxt_MBps"]))
+        print("KeywordWriter: {:.1f} MB/s".format(result["writer_MBps"]))
+        print("Speedup      : {:.1f}x".format(result["speedup"]))
+    elif which == "startup":
+        for key, value in bench_startup().items():
+            print("{:<20}: {}".format(key, "n/a" if value is None else "{:.3f} s".format(value)))
+    else:
+        print("Usage: python COMat_Bench.py [batch [n] | writer [rows] | startup]")
@@ -0,0 +1,211 @@
+"""
+Benchmark suite for COMat: generator, fitter and deck tooling, results stored as JSON
+
+Author: Youngbin LIM
+Contact: lyb0684@naver.com
+
+Run the suite (results go to Benchmark/results/<commit>.json unless --out is given):
+    python COMat_Suite.py
+    python COMat_Suite.py --filter fit --repeat 10
+
+Compare two runs, exit code 1 when a case got slower by more than --threshold:
+    python COMat_Suite.py --compare results/abc1234.json results/def5678.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tempfile
+import statistics
+
+import numpy as np
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(Root, 'CoMatGen'))
+sys.path.insert(0, os.path.join(Root, 'CoMatFit'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import COMat_Generator
+import COMat_Deck
+import COMat_Mesh
+import COMat_Timestep
+from COMat_Bench import random_table
+
+EXAMPLE_DECKS = [os.path.join(Root, 'Example', '3PB', '3-Point-Bending.inp'),
+                 os.path.join(Root, 'Example', 'Cyclic', 'Cyclic_Loading.inp')]
+
+# Nominal concrete used for the synthetic test curves
+NOMINAL = (30.0, 26.5, 0.0013, 0.002, 2.3, 2.63, 0.001, 1.7, 1.0)
+
+def measure(fn, repeat=5, number=1):
+    # Seconds per call: every repeat times number calls of fn
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start)/number)
+    return {"min": min(times), "median": statistics.median(times), "mean": statistics.mean(times),
+            "repeat": repeat, "number": number}
+
+def synthetic_curves(seed=0, noise=0.01):
+    # Compression and tension test curves of the nominal concrete with relative noise
+    Curves = COMat_Generator.CDPCurves(*NOMINAL)
+    rng = np.random.default_rng(seed)
+    CompTarget = Curves.Compression_SS_plot.copy()
+    TensTarget = Curves.Tensile_SS_plot.copy()
+    CompTarget[:, 1] *= 1 + noise*rng.standard_normal(len(CompTarget))
+    TensTarget[:, 1] *= 1 + noise*rng.standard_normal(len(TensTarget))
+    return CompTarget, TensTarget
+
+#####################
+## Benchmark cases ##
+#####################
+
+def cases(Path):
+    # {name: (function, number of calls per repeat)}, Path is a scratch directory
+    Table_100, Table_1000 = random_table(100), random_table(1000)
+    Params = [float(Table_100[key][0]) for key in COMat_Generator.BATCH_COLUMNS]
+
+    def generate_single():
+        # Cache cleared so that the curve math is measured as well
+        COMat_Generator.compute_curves.cache_clear()
+        COMat_Generator.generate(Path, False, *Params[:10], False, Params[10])
+
+    def plot_agg():
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        COMat_Generator.compute_curves.cache_clear()
+        COMat_Generator.plot(Path, True, *Params[:10], False, Params[10])
+        plt.close("all")
+
+    Result = {
+        "generate_single": (generate_single, 20),
+        "generate_batch_100": (lambda: COMat_Generator.generate_batch(Path, Table_100, False), 1),
+        "generate_batch_1000": (lambda: COMat_Generator.generate_batch(Path, Table_1000, False), 1),
+        "plot_agg": (plot_agg, 1),
+    }
+
+    try:
+        import CoMatFIT
+    except ImportError:
+        # SciPy is needed by the fitter only
+        CoMatFIT = None
+    if CoMatFIT is not None:
+        CompTarget, TensTarget = synthetic_curves()
+        E, S_cu, e_cu, S_tu = NOMINAL[0], NOMINAL[1], NOMINAL[2], NOMINAL[5]
+        e_c, e_t = CompTarget[:, 0], TensTarget[:, 0]
+        Args_Comp = (e_c[e_c > e_cu], CompTarget[e_c > e_cu, 1], S_cu, e_cu)
+        e_tu = S_tu/(1000*E)
+        Args_Tens = (e_t[e_t > e_tu], TensTarget[e_t > e_tu, 1], S_tu, e_tu)
+
+        def random_search():
+            np.random.seed(0)
+            CoMatFIT.Random_Search(CoMatFIT.Error_Comp_Batch, [(0.5, 8.0), (0.0001, 0.01)], Args_Comp, 1000)
+            CoMatFIT.Random_Search(CoMatFIT.Error_Tens_Batch, [(1.0, 5.0), (0.9*e_t.max(), 1.1*e_t.max())], Args_Tens, 1000)
+
+        def fit_method(Method):
+            def fit():
+                np.random.seed(0)
+                CoMatFIT.fit_compression(CompTarget, S_cu, e_cu, 1000, Method=Method)
+                CoMatFIT.fit_tension(TensTarget, E, S_tu, 1000, Method=Method)
+            return fit
+
+        def load_log():
+            # Raw machine log, written by the untimed first call of measure() so that runs
+            # filtering this case out skip it: two header lines, 1M rows of time, strain and stress
+            Log = os.path.join(Path, "Log.csv")
+            if not os.path.isfile(Log):
+                e = np.linspace(0, e_c.max(), 1000000)
+                with open(Log, 'w') as f:
+                    f.write("Time,Strain,Stress\ns,-,MPa\n")
+                    np.savetxt(f, np.column_stack((np.arange(e.size)*0.01, e, np.interp(e, e_c, CompTarget[:, 1]))), fmt="%.2f,%.7e,%.5f")
+            return CoMatFIT.load_curve(Log, Columns=(1, 2))
+
+        Result["fit_random_search"] = (random_search, 5)
+        Result["fit_nelder_mead"] = (fit_method('Nelder-Mead'), 1)
+        Result["fit_least_squares"] = (fit_method('least_squares'), 1)
+        Result["fit_load_log"] = (load_log, 1)
+
+    for Deck in EXAMPLE_DECKS:
+        if not os.path.isfile(Deck):
+            continue
+        name = os.path.splitext(os.path.basename(Deck))[0].replace("-", "_").lower()
+        Result["deck_index_" + name] = (lambda Deck=Deck: COMat_Deck.build_index(Deck), 1)
+        Result["deck_stream_" + name] = (lambda Deck=Deck: COMat_Deck.inject_material(
+            Deck, os.path.join(Path, "Deck.inp"), os.path.join(Path, "CDP_Mat.inp")), 1)
+        Result["deck_mesh_" + name] = (lambda Deck=Deck: COMat_Mesh.read_parts(Deck, COMat_Deck.build_index(Deck)), 1)
+        Result["deck_timestep_" + name] = (lambda Deck=Deck: COMat_Timestep.estimate(Deck), 1)
+    return Result
+
+def git_commit():
+    try:
+        run = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Root, capture_output=True, text=True)
+    except OSError:
+        return None
+    return run.stdout.strip() if run.returncode == 0 else None
+
+def run_suite(repeat=5, Filter=None):
+    Results = {}
+    with tempfile.TemporaryDirectory() as Path:
+        # CDP_Mat.inp for the deck cases
+        COMat_Generator.generate(Path, False, *NOMINAL[:8], 1.0, 0.0, False, NOMINAL[8])
+        for name, (fn, number) in cases(Path).items():
+            if Filter is not None and Filter not in name:
+                continue
+            Results[name] = measure(fn, repeat, number)
+            print("{:<32}{:>12.3f} ms".format(name, 1000*Results[name]["median"]))
+    return {
+        "commit": git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+        "results": Results,
+    }
+
+def compare(Old, New, threshold=0.1):
+    # Ratio of the median times New/Old per case, return the cases slower than 1+threshold
+    print("{:<32}{:>12}{:>12}{:>9}".format("case", "old ms", "new ms", "ratio"))
+    Slower = []
+    for name in sorted(set(Old["results"]) & set(New["results"])):
+        old, new = Old["results"][name]["median"], New["results"][name]["median"]
+        ratio = new/old
+        flag = ""
+        if ratio > 1 + threshold:
+            Slower.append(name)
+            flag = "  slower"
+        print("{:<32}{:>12.3f}{:>12.3f}{:>9.2f}{}".format(name, 1000*old, 1000*new, ratio, flag))
+    return Slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COMat benchmark suite")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeats per case (default: 5)")
+    parser.add_argument("--filter", help="Only run cases whose name contains this text")
+    parser.add_argument("--out", help="JSON result file (default: Benchmark/results/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed slowdown for --compare (default: 0.1)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            Old = json.load(f)
+        with open(args.compare[1]) as f:
+            New = json.load(f)
+        return 1 if compare(Old, New, args.threshold) else 0
+
+    Report = run_suite(args.repeat, args.filter)
+    FilePathName = args.out
+    if FilePathName is None:
+        os.makedirs(os.path.join(Root, 'Benchmark', 'results'), exist_ok=True)
+        FilePathName = os.path.join(Root, 'Benchmark', 'results', (Report["commit"] or "local") + ".json")
+    with open(FilePathName, 'w') as f:
+        json.dump(Report, f, indent=1)
+    print("Results written to " + FilePathName)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
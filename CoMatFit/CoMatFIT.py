@@ -5,10 +5,16 @@ Author: Youngbin LIM
 Contact: lyb0684@naver.com
 """
 
+import io
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 from scipy import interpolate
-from scipy.optimize import minimize
-import matplotlib.pyplot as plt
+from scipy.optimize import minimize, least_squares
 
 ##################################################
 ## User defined parameters for target data path ##
@@ -26,234 +32,772 @@ e_cu = 0.0013
 # Max Tensile Stress in MPa
 S_tu = 2.63
 
+# Number of random candidates used to seed each optimization
+N_samples = 1000
+
+# Local optimizer: 'Nelder-Mead' or 'least_squares' (bounded, analytic Jacobian)
+Method = 'Nelder-Mead'
+
+# Fit E, S_cu, e_cu and S_tu as well (values above are then only used as a fallback)
+Fit_Full_Curve = False
+
+# Multi-start: local fits from the Starts best candidates of a seeded 'random' or 'sobol'
+# search, run in parallel. Seed = None keeps the single unseeded random search.
+Starts = 8
+Seed = None
+Sampler = 'random'
+
+# Points of a measured curve after its reduction to a monotone envelope (None: every row as read)
+Envelope_Points = 2000
+
+# Calibration record (JSON) for re-fits, e.g. "Calibration.json". Unchanged data returns the
+# recorded parameters, changed data starts from them without random search. None: always fit.
+Calibration_Record = None
+
 ##################################################
 ##!!!!!!!!!! DO NOT TOUCH LINES BELOW !!!!!!!!!!##
 ##################################################
 
 # Load Target SS curve
 
-def guess_delimiter_and_load(filename):
-    # Read the first line of the file
-    with open(filename, 'r') as f:
-        first_line = f.readline()
-    
-    # Guess the delimiter based on the first line
-    tab_count = first_line.count('\t')
-    comma_count = first_line.count(',')
-
-    if tab_count > comma_count:
-        delimiter = '\t'
-    else:
-        delimiter = ','
-
-    # Use the determined delimiter with genfromtxt
-    return np.genfromtxt(filename, delimiter=delimiter)
-
-# TargetData for Compression part
-CompTarget = guess_delimiter_and_load(Path_to_Compression_SS_data)
-
-# TargetData for Tension part
-TensTarget = guess_delimiter_and_load(Path_to_Tension_SS_data)
+# Test files are read in blocks of complete lines, so memory does not grow with the file size.
+# The envelope keeps the rows that reach a new strain maximum (unloading and backward noise are
+# dropped), averages equal strains and sums the rest into equal strain bins. First, last and
+# peak stress points are kept as measured, so the curve stays strictly increasing in strain.
+
+# Column delimiters tried on the first data line, None is any whitespace
+DELIMITERS = ('\t', ';', ',', None)
+
+# Bytes per block, a file of more than 4 blocks is read in a process pool
+BLOCK_SIZE = 1 << 24
+
+def _is_numeric(fields):
+    try:
+        [float(field) for field in fields]
+    except ValueError:
+        return False
+    return True
+
+def detect_format(filename, Probe=1 << 16):
+    # Number of header lines, delimiter and decimal comma, from the first line with two or more numbers
+    with open(filename, 'rb') as f:
+        head = f.read(Probe).decode("latin-1")
+    lines = head.splitlines()
+    for n, line in enumerate(lines):
+        for delimiter in DELIMITERS:
+            fields = [field.strip() for field in line.split(delimiter)]
+            # A trailing delimiter leaves an empty field
+            while fields and fields[-1] == "":
+                fields.pop()
+            if len(fields) < 2:
+                continue
+            if _is_numeric(fields) or (delimiter != ',' and _is_numeric([field.replace(',', '.') for field in fields])):
+                # Commas in the data lines of another delimiter are decimal commas
+                return n, delimiter, delimiter != ',' and any(',' in line for line in lines[n:n+100])
+    raise ValueError("No line with two numeric columns at the start of " + str(filename))
+
+def parse_rows(block, delimiter, decimal_comma, Columns=(0, 1)):
+    # Columns of a block of complete lines, lines that are not numbers (notes, units, footers) are dropped
+    if decimal_comma:
+        block = block.replace(b",", b".")
+    try:
+        return np.loadtxt(io.BytesIO(block), delimiter=delimiter, usecols=Columns, ndmin=2, comments="#")
+    except ValueError:
+        Rows = []
+        for line in block.decode("latin-1").splitlines():
+            fields = line.split(delimiter)
+            try:
+                Rows.append([float(fields[column]) for column in Columns])
+            except (ValueError, IndexError):
+                continue
+        return np.array(Rows, dtype=float).reshape(-1, len(Columns))
+
+def strain_envelope(Rows):
+    # Rows that reach the running strain maximum of the block, equal consecutive strains averaged
+    x, y = Rows[:,0], Rows[:,1]
+    keep = x >= np.maximum.accumulate(x)
+    x, y = x[keep], y[keep]
+    if x.size == 0:
+        return x, y
+    first = np.concatenate(([True], x[1:] != x[:-1]))
+    group = np.cumsum(first) - 1
+    return x[first], np.bincount(group, weights=y)/np.bincount(group)
+
+def _read_block(Job):
+    # Worker: the lines starting in bytes [start, stop) of a file, as rows or as their envelope
+    filename, start, stop, Format, Columns, Envelope = Job
+    with open(filename, 'rb') as f:
+        if start > 0:
+            # The line running into start belongs to the block before
+            f.seek(start - 1)
+            if f.read(1) != b"\n":
+                f.readline()
+        position = f.tell()
+        block = f.read(max(stop - position, 0)) if position < stop else b""
+        if block and not block.endswith(b"\n"):
+            block += f.readline()
+    Rows = parse_rows(block, Format[1], Format[2], Columns)
+    return strain_envelope(Rows) if Envelope else Rows
+
+class EnvelopeBins:
+    # Sums of strain and stress in equal strain bins, the bin width doubles when there are more than
+    # Capacity bins. Points are kept as they are until there are more than Capacity of them.
+    def __init__(self, Capacity):
+        self.Capacity = Capacity
+        self.Width = None
+        self.Raw = []
+        self.n_raw = 0
+
+    def add(self, x, y):
+        # x is non-decreasing and not smaller than any x added before
+        if self.Width is None:
+            self.Raw.append((x, y))
+            self.n_raw += x.size
+            if self.n_raw <= self.Capacity:
+                return
+            x, y = [np.concatenate(values) for values in zip(*self.Raw)]
+            self.Raw = None
+            self.Origin = x[0]
+            # The points so far fill Capacity/2 bins
+            self.Width = (x[-1] - x[0])/max(self.Capacity // 2 - 1, 1) or 1E-12
+            self.Sx, self.Sy, self.N = np.zeros(0), np.zeros(0), np.zeros(0)
+        k = np.floor((x - self.Origin)/self.Width).astype(np.int64)
+        while k.size and k[-1] >= self.Capacity:
+            # Pairs of bins merged, odd bin counts padded with an empty bin
+            self.Sx, self.Sy, self.N = [np.pad(S, (0, S.size % 2)).reshape(-1, 2).sum(axis=1) for S in (self.Sx, self.Sy, self.N)]
+            self.Width *= 2
+            k //= 2
+        size = max(self.N.size, int(k[-1]) + 1) if k.size else self.N.size
+        self.Sx, self.Sy, self.N = [np.pad(S, (0, size - S.size)) for S in (self.Sx, self.Sy, self.N)]
+        self.Sx += np.bincount(k, weights=x, minlength=size)
+        self.Sy += np.bincount(k, weights=y, minlength=size)
+        self.N += np.bincount(k, minlength=size)
+
+    def points(self, Points, Keep=()):
+        # About Points (strain, stress) bin means, strictly increasing in strain. The points of Keep
+        # replace the mean of their bin.
+        if self.Width is None:
+            x, y = [np.concatenate(values) for values in zip(*self.Raw)] if self.Raw else (np.zeros(0), np.zeros(0))
+            x, y = strain_envelope(np.column_stack((x, y)))
+            if x.size <= Points:
+                for x_k, y_k in Keep:
+                    y[np.searchsorted(x, x_k)] = y_k
+                return np.column_stack((x, y))
+            Bins = EnvelopeBins(2*Points)
+            Bins.add(x, y)
+            return Bins.points(Points, Keep)
+        f = -(-self.N.size // Points)
+        Sx, Sy, N = [np.pad(S, (0, -S.size % f)).reshape(-1, f).sum(axis=1) for S in (self.Sx, self.Sy, self.N)]
+        Used = np.flatnonzero(N)
+        x, y = Sx[Used]/N[Used], Sy[Used]/N[Used]
+        for x_k, y_k in Keep:
+            k = int(np.floor((x_k - self.Origin)/self.Width)) // f
+            i = np.searchsorted(Used, k)
+            if i < Used.size and Used[i] == k:
+                x[i], y[i] = x_k, y_k
+        return np.column_stack((x, y))
+
+def collect_envelope(Blocks, Points):
+    # Envelope of the blocks in file order, first / peak / last points kept as measured
+    Bins = EnvelopeBins(16*Points)
+    top = -np.inf
+    First = Peak = Last = None
+    for x, y in Blocks:
+        # Rows below the strain reached in earlier blocks are not on the envelope
+        cut = np.searchsorted(x, top)
+        x, y = x[cut:], y[cut:]
+        if x.size == 0:
+            continue
+        top = x[-1]
+        First = (x[0], y[0]) if First is None else First
+        Last = (x[-1], y[-1])
+        i = np.argmax(y)
+        if Peak is None or y[i] > Peak[1]:
+            Peak = (x[i], y[i])
+        Bins.add(x, y)
+    if First is None:
+        return np.zeros((0, 2))
+    return Bins.points(Points, (First, Peak, Last))
+
+def load_curve(filename, Points=Envelope_Points, Columns=(0, 1), Workers=None):
+    # Strain / stress columns of a test file with any header, tab, semicolon, comma or whitespace
+    # delimiter and decimal commas. Points: size of the monotone envelope, None for every row as read.
+    Format = detect_format(filename)
+    with open(filename, 'rb') as f:
+        for _ in range(Format[0]):
+            f.readline()
+        start, size = f.tell(), os.fstat(f.fileno()).st_size
+    Jobs = [(filename, offset, min(offset + BLOCK_SIZE, size), Format, Columns, Points is not None)
+            for offset in range(start, size, BLOCK_SIZE)]
+
+    if Workers == 1 or len(Jobs) <= 4:
+        Blocks = map(_read_block, Jobs)
+        return collect_envelope(Blocks, Points) if Points is not None else np.concatenate(list(Blocks) or [np.zeros((0, 2))])
+    with ProcessPoolExecutor(max_workers=Workers) as pool:
+        Blocks = pool.map(_read_block, Jobs)
+        return collect_envelope(Blocks, Points) if Points is not None else np.concatenate(list(Blocks))
+
+def guess_delimiter_and_load(filename, Points=Envelope_Points):
+    # Former loader of the reference curves, same as load_curve()
+    return load_curve(filename, Points)
 
 ######################################
 ## Regression Starts from this line ##
 ######################################
 
-#### Compression Part ####
+def Evaluate_Batch(Error_Batch, Samples_1, Samples_2, Args):
+    # Evaluate candidates in chunks so that memory stays bounded for large N_samples
+    Chunk = max(1, 4000000 // max(Args[0].size, 1))
+    return np.concatenate([Error_Batch(Samples_1[i:i+Chunk], Samples_2[i:i+Chunk], *Args)
+                           for i in range(0, len(Samples_1), Chunk)])
 
-# Interpolate Compression SS curve
-e_c_Target, S_c_Target = CompTarget[:,0], CompTarget[:,1]
-e_c_Interp = np.linspace(0, max(e_c_Target), num=100, endpoint=True)
-Comp_Spline= interpolate.PchipInterpolator(e_c_Target, S_c_Target)
+def Random_Search(Error_Batch, bounds, Args, N_samples):
+    # Score N_samples random candidates inside bounds and return the best one
+    (min_1, max_1), (min_2, max_2) = bounds
+    Samples_1 = min_1 + (max_1 - min_1) * np.random.rand(N_samples)
+    Samples_2 = min_2 + (max_2 - min_2) * np.random.rand(N_samples)
 
-# Parabolic Hardening region is automatically determined by E, S_cu and e_cu
-E = 1000*E
-S_c0 = 2*S_cu - E*e_cu
-e_0 = S_c0/E
+    # Evaluate the error for all samples at once
+    errors = Evaluate_Batch(Error_Batch, Samples_1, Samples_2, Args)
 
-# Alpha and e_63 is determined by optimizing the error between target data and prediction
+    # Get the index of the minimum error
+    best_index = np.argmin(errors)
+    return [Samples_1[best_index], Samples_2[best_index]]
 
-def Error_Comp(Alpha,e_63):
-    # Take strain larger than e_cu
-    e_wb = e_c_Target[e_c_Target>e_cu]
-    
-    # Gerenate Stress array for Weibull softening curve
-    S_c_wb = S_cu*(0.99*np.exp(-np.power((e_wb-e_cu)/e_63, Alpha)) + 0.01)
-    
-    # Calculate Error between prediction and Target data
-    ErrComp = np.sum(np.power((Comp_Spline(e_wb) - S_c_wb), 2))
-    
-    return ErrComp
-
-# Generate Random sample for Alpha and e_63
-Alpha_min, Alpha_max = 0.5, 8.0
-e_63_min, e_63_max = 0.0001, 0.01
-
-Alpha_samples = Alpha_min + (Alpha_max - Alpha_min) * np.random.rand(1000)
-e_63_samples = e_63_min + (e_63_max - e_63_min) * np.random.rand(1000)
-
-# Evaluate the error for each sample
-errors_comp = [Error_Comp(Alpha, e_63) for Alpha, e_63 in zip(Alpha_samples, e_63_samples)]
-
-# Get the index of the minimum error
-best_index = np.argmin(errors_comp)
-
-# Retrieve the corresponding Alpha and e_63 values
-best_Alpha = Alpha_samples[best_index]
-best_e_63 = e_63_samples[best_index]
-
-# Initial values for optimization
-initial_point = [best_Alpha, best_e_63]
+#### Compression Part ####
 
-# Bounds for Alpha and e_63
-bounds = [(Alpha_min, Alpha_max), (e_63_min, e_63_max)]
+# Alpha and e_63 is determined by optimizing the error between target data and prediction
 
-# Use the best initial values for optimization
-result_comp = minimize(lambda params: Error_Comp(*params), initial_point, method='Nelder-Mead', bounds=bounds, 
-                  options={'maxiter': 1000000, 'disp': True})
+def Error_Comp(Alpha, e_63, e_wb_Target, S_wb_Target, S_cu, e_cu):
+    # Gerenate Stress array for Weibull softening curve
+    S_c_wb = S_cu*(0.99*np.exp(-np.power((e_wb_Target-e_cu)/e_63, Alpha)) + 0.01)
 
-# Extract optimized values
-Alpha, e_63 = result_comp.x
+    # Calculate Error between prediction and Target data
+    ErrComp = np.sum(np.power((S_wb_Target - S_c_wb), 2))
 
-# Generae array for whole Compression Stress-Strain curve t
-# Generate strain array
-# Linear Elastic part
-e_c_lin = np.linspace(0.0, e_0, num=5, endpoint=False)
-# Parabolic Hardening part
-e_para = np.linspace(e_0, e_cu, num=5, endpoint=False)
-# Gerenate Stress array for Linear elastic part
-S_c_lin = E*e_c_lin
-# Gerenate Stress array for parabolic hardening part
-S_c_para = -((S_cu-S_c0)/(e_cu-e_0)**2)*(e_para-e_0)*(e_para-e_0-2*(e_cu-e_0)) + S_c0
+    return ErrComp
 
-## Weibull softening part
-# Generate strain array
-e_wb = np.linspace(e_cu, max(e_c_Target), 20, endpoint=True)
-# Gerenate Stress array
-S_c_wb = S_cu*(0.99*np.exp(-np.power((e_wb-e_cu)/e_63, Alpha)) + 0.01)
+def Error_Comp_Batch(Alpha, e_63, e_wb_Target, S_wb_Target, S_cu, e_cu):
+    # Same as Error_Comp for arrays of candidates, one row per candidate
+    S_c_wb = S_cu*(0.99*np.exp(-np.power((e_wb_Target-e_cu)/e_63[:,None], Alpha[:,None])) + 0.01)
+    return np.sum(np.power((S_wb_Target - S_c_wb), 2), axis=1)
+
+def Residual_Comp(params, e_wb_Target, S_wb_Target, S_cu, e_cu):
+    Alpha, e_63 = params
+    S_c_wb = S_cu*(0.99*np.exp(-np.power((e_wb_Target-e_cu)/e_63, Alpha)) + 0.01)
+    return S_wb_Target - S_c_wb
+
+def Jacobian_Comp(params, e_wb_Target, S_wb_Target, S_cu, e_cu):
+    # Derivatives of Residual_Comp with respect to Alpha and e_63
+    Alpha, e_63 = params
+    x = (e_wb_Target-e_cu)/e_63
+    x_A = np.power(x, Alpha)
+    decay = S_cu*0.99*np.exp(-x_A)
+    # x^Alpha*ln(x) goes to zero at x = 0
+    log_x = np.log(np.where(x > 0, x, 1.0))
+    dS_dAlpha = -decay*x_A*log_x
+    dS_de_63 = decay*Alpha*x_A/e_63
+    return -np.stack((dS_dAlpha, dS_de_63), axis=1)
+
+def comp_problem(CompTarget, S_cu, e_cu):
+    # Error arguments and bounds of the Alpha / e_63 fit
+    # Interpolate Compression SS curve
+    e_c_Target, S_c_Target = CompTarget[:,0], CompTarget[:,1]
+    Comp_Spline= interpolate.PchipInterpolator(e_c_Target, S_c_Target)
+
+    # Take strain larger than e_cu, target stress is evaluated only once
+    e_wb_Target = e_c_Target[e_c_Target>e_cu]
+    S_wb_Target = Comp_Spline(e_wb_Target)
+    Args = (e_wb_Target, S_wb_Target, S_cu, e_cu)
+
+    # Bounds for Alpha and e_63
+    Alpha_min, Alpha_max = 0.5, 8.0
+    e_63_min, e_63_max = 0.0001, 0.01
+    bounds = [(Alpha_min, Alpha_max), (e_63_min, e_63_max)]
+    return Args, bounds
+
+def fit_compression(CompTarget, S_cu, e_cu, N_samples=1000, disp=False, Method='Nelder-Mead', Initial=None):
+    # Initial: [Alpha, e_63] to start from instead of the random search
+    Args, bounds = comp_problem(CompTarget, S_cu, e_cu)
+
+    # Initial values for optimization from random search
+    if Initial is None:
+        initial_point = Random_Search(Error_Comp_Batch, bounds, Args, N_samples)
+    else:
+        initial_point = np.clip(Initial, *zip(*bounds))
+
+    # Use the best initial values for optimization
+    if Method == 'least_squares':
+        result_comp = least_squares(Residual_Comp, initial_point, jac=Jacobian_Comp, args=Args, method='trf',
+                                    bounds=tuple(zip(*bounds)), x_scale='jac', verbose=1 if disp else 0)
+        Residual = 2*result_comp.cost
+        njev = result_comp.njev
+    else:
+        result_comp = minimize(lambda params: Error_Comp(*params, *Args), initial_point, method='Nelder-Mead', bounds=bounds,
+                          options={'maxiter': 1000000, 'disp': disp})
+        Residual = result_comp.fun
+        njev = 0
 
-# Combine to 1 array
-e_c_total = np.concatenate((e_c_lin, e_para, e_wb), axis=None)
-S_c_total = np.concatenate((S_c_lin, S_c_para, S_c_wb), axis=None)
-# For txt file out
-Compression_SS_plot=np.stack((e_c_total, S_c_total), axis=1)
+    # Extract optimized values
+    Alpha, e_63 = result_comp.x
+    return {"Alpha": Alpha, "e_63": e_63, "Residual_Comp": Residual, "nfev_Comp": result_comp.nfev, "njev_Comp": njev}
 
 #### Tension Part ####
 
-e_tu = S_tu/E
-# Interpolate Tension SS curve
-e_t_Target, S_t_Target = TensTarget[:,0], TensTarget[:,1]
-e_t_Interp = np.linspace(0, max(e_t_Target), num=100, endpoint=True)
-Tens_Spline= interpolate.PchipInterpolator(e_t_Target, S_t_Target)
-
 # Beta and e_end is determined by optimizing the error between target data and prediction
 
-def Error_Tens(Beta,e_end):
-    # Take strain larger than e_tu
-    e_t_power = e_t_Target[e_t_Target>e_tu]
-    
+def Error_Tens(Beta, e_end, e_power_Target, S_power_Target, S_tu, e_tu):
     # Gerenate Stress array for Power softening curve
-    S_t_power = S_tu*(np.power(np.abs((e_end-e_t_power)/(e_end-e_tu)), Beta))
-    
-    # Calculate Error between prediction and Target data
-    ErrTens = np.sum(np.power((Tens_Spline(e_t_power) - S_t_power), 2))
-    
-    return ErrTens
-
-# Generate Random sample for Beta and e_end
-Beta_min, Beta_max = 1.0, 5.0
-e_end_min, e_end_max = 0.9*max(e_t_Target), 1.1*max(e_t_Target)
+    S_t_power = S_tu*(np.power(np.abs((e_end-e_power_Target)/(e_end-e_tu)), Beta))
 
-Beta_samples = Beta_min + (Beta_max - Beta_min) * np.random.rand(1000)
-e_end_samples = e_end_min + (e_end_max - e_end_min) * np.random.rand(1000)
-
-# Evaluate the error for each sample
-errors_tens = [Error_Tens(Beta, e_end) for Beta, e_end in zip(Beta_samples, e_end_samples)]
-
-# Get the index of the minimum error
-best_index = np.argmin(errors_tens)
-
-# Retrieve the corresponding Beta and e_end values
-best_Beta = Beta_samples[best_index]
-best_e_end = e_end_samples[best_index]
-
-# Initial values for optimization
-initial_point = [best_Beta, best_e_end]
-
-# Bounds for Beta and e_end
-bounds = [(Beta_min, Beta_max), (e_end_min, e_end_max)]
+    # Calculate Error between prediction and Target data
+    ErrTens = np.sum(np.power((S_power_Target - S_t_power), 2))
 
-# Use the best initial values for optimization
-result_tens = minimize(lambda params: Error_Tens(*params), initial_point, method='Nelder-Mead', bounds=bounds, 
-                  options={'maxiter': 1000000, 'disp': True})
+    return ErrTens
 
-# Extract optimized values
-Beta, e_end = result_tens.x
+def Error_Tens_Batch(Beta, e_end, e_power_Target, S_power_Target, S_tu, e_tu):
+    # Same as Error_Tens for arrays of candidates, one row per candidate
+    S_t_power = S_tu*(np.power(np.abs((e_end[:,None]-e_power_Target)/(e_end[:,None]-e_tu)), Beta[:,None]))
+    return np.sum(np.power((S_power_Target - S_t_power), 2), axis=1)
+
+def Residual_Tens(params, e_power_Target, S_power_Target, S_tu, e_tu):
+    Beta, e_end = params
+    S_t_power = S_tu*(np.power(np.abs((e_end-e_power_Target)/(e_end-e_tu)), Beta))
+    return S_power_Target - S_t_power
+
+def Jacobian_Tens(params, e_power_Target, S_power_Target, S_tu, e_tu):
+    # Derivatives of Residual_Tens with respect to Beta and e_end
+    Beta, e_end = params
+    u = (e_end-e_power_Target)/(e_end-e_tu)
+    abs_u = np.abs(u)
+    S_t_power = S_tu*np.power(abs_u, Beta)
+    # |u|^Beta*ln|u| and Beta*|u|^(Beta-1) vanish at u = 0 for Beta >= 1
+    nonzero = abs_u > 0
+    safe_u = np.where(nonzero, u, 1.0)
+    dS_dBeta = np.where(nonzero, S_t_power*np.log(np.abs(safe_u)), 0.0)
+    du_de_end = (e_power_Target-e_tu)/(e_end-e_tu)**2
+    dS_de_end = np.where(nonzero, Beta*S_t_power/safe_u, 0.0)*du_de_end
+    return -np.stack((dS_dBeta, dS_de_end), axis=1)
+
+def tens_problem(TensTarget, E, S_tu):
+    # Error arguments and bounds of the Beta / e_end fit, E in GPa
+    e_tu = S_tu/(1000*E)
+    # Interpolate Tension SS curve
+    e_t_Target, S_t_Target = TensTarget[:,0], TensTarget[:,1]
+    Tens_Spline= interpolate.PchipInterpolator(e_t_Target, S_t_Target)
+
+    # Take strain larger than e_tu, target stress is evaluated only once
+    e_power_Target = e_t_Target[e_t_Target>e_tu]
+    S_power_Target = Tens_Spline(e_power_Target)
+    Args = (e_power_Target, S_power_Target, S_tu, e_tu)
+
+    # Bounds for Beta and e_end
+    Beta_min, Beta_max = 1.0, 5.0
+    e_end_min, e_end_max = 0.9*max(e_t_Target), 1.1*max(e_t_Target)
+    bounds = [(Beta_min, Beta_max), (e_end_min, e_end_max)]
+    return Args, bounds
+
+def fit_tension(TensTarget, E, S_tu, N_samples=1000, disp=False, Method='Nelder-Mead', Initial=None):
+    # E in GPa. Initial: [Beta, e_end] to start from instead of the random search
+    Args, bounds = tens_problem(TensTarget, E, S_tu)
+
+    # Initial values for optimization from random search
+    if Initial is None:
+        initial_point = Random_Search(Error_Tens_Batch, bounds, Args, N_samples)
+    else:
+        initial_point = np.clip(Initial, *zip(*bounds))
+
+    # Use the best initial values for optimization
+    if Method == 'least_squares':
+        result_tens = least_squares(Residual_Tens, initial_point, jac=Jacobian_Tens, args=Args, method='trf',
+                                    bounds=tuple(zip(*bounds)), x_scale='jac', verbose=1 if disp else 0)
+        Residual = 2*result_tens.cost
+        njev = result_tens.njev
+    else:
+        result_tens = minimize(lambda params: Error_Tens(*params, *Args), initial_point, method='Nelder-Mead', bounds=bounds,
+                          options={'maxiter': 1000000, 'disp': disp})
+        Residual = result_tens.fun
+        njev = 0
+
+    # Extract optimized values
+    Beta, e_end = result_tens.x
+    return {"Beta": Beta, "e_end": e_end, "Residual_Tens": Residual, "nfev_Tens": result_tens.nfev, "njev_Tens": njev}
+
+#### Full curve fit ####
+
+# All parameters of a branch are unknowns. The e_cu window of generate(),
+# S_cu/E < e_cu < 2*S_cu/E, is kept by fitting r in e_cu = (1+r)*S_cu/E with 0 < r < 1.
+
+def Model_Comp_Full(e, E, S_cu, e_cu, Alpha, e_63):
+    # Whole compression curve (linear, parabolic hardening, Weibull softening), E in MPa
+    S_c0 = 2*S_cu - E*e_cu
+    e_0 = S_c0/E
+    S_c_lin = E*e
+    S_c_para = -((S_cu-S_c0)/(e_cu-e_0)**2)*(e-e_0)*(e-e_0-2*(e_cu-e_0)) + S_c0
+    S_c_wb = S_cu*(0.99*np.exp(-np.power(np.maximum(e-e_cu, 0.0)/e_63, Alpha)) + 0.01)
+    return np.where(e < e_0, S_c_lin, np.where(e < e_cu, S_c_para, S_c_wb))
+
+def Model_Tens_Full(e, E, S_tu, e_end, Beta):
+    # Whole tension curve (linear, power law stiffening), E in MPa
+    e_tu = S_tu/E
+    S_t_lin = E*e
+    S_t_power = S_tu*(np.power(np.abs((e_end-e)/(e_end-e_tu)), Beta))
+    return np.where(e < e_tu, S_t_lin, S_t_power)
+
+def Residual_Comp_Full(params, e_c_Target, S_c_Target):
+    E, S_cu, r, Alpha, e_63 = params
+    return S_c_Target - Model_Comp_Full(e_c_Target, E, S_cu, (1+r)*S_cu/E, Alpha, e_63)
+
+def Residual_Tens_Full(params, e_t_Target, S_t_Target, E=None):
+    # E is a fitted parameter unless given
+    if E is None:
+        E, S_tu, q, Beta = params
+    else:
+        S_tu, q, Beta = params
+    # e_end = (1+q)*e_tu with q > 0 keeps e_end larger than S_tu/E
+    return S_t_Target - Model_Tens_Full(e_t_Target, E, S_tu, (1+q)*S_tu/E, Beta)
+
+def initial_modulus(Target):
+    # Secant through the origin of the points below 40% of the peak stress (MPa)
+    e, S = Target[:,0], Target[:,1]
+    peak = S.argmax()
+    elastic = (S[:peak+1] <= 0.4*S[peak]) & (e[:peak+1] > 0)
+    if np.count_nonzero(elastic) > 0:
+        return np.sum(e[:peak+1][elastic]*S[:peak+1][elastic])/np.sum(e[:peak+1][elastic]**2)
+    # Parabolic hardening reaches the peak at about 1.5*S_cu/E
+    return 1.5*S[peak]/e[peak]
+
+def fit_compression_full(CompTarget, N_samples=1000, disp=False):
+    e_c_Target, S_c_Target = CompTarget[:,0], CompTarget[:,1]
+
+    # Initial E, S_cu and e_cu from the data, e_cu is moved inside its window
+    E_0 = initial_modulus(CompTarget)
+    peak = S_c_Target.argmax()
+    S_cu_0 = S_c_Target[peak]
+    r_0 = np.clip(e_c_Target[peak]*E_0/S_cu_0 - 1, 0.05, 0.95)
+
+    # Alpha and e_63 seeded by the softening fit with these values
+    Seed = fit_compression(CompTarget, S_cu_0, (1+r_0)*S_cu_0/E_0, N_samples, Method='least_squares')
+
+    initial_point = [E_0, S_cu_0, r_0, Seed["Alpha"], Seed["e_63"]]
+    bounds = ([0.2*E_0, 0.5*S_cu_0, 1e-3, 0.5, 0.0001], [5.0*E_0, 1.5*S_cu_0, 1-1e-3, 8.0, 0.01])
+    initial_point = np.clip(initial_point, bounds[0], bounds[1])
+
+    result_comp = least_squares(Residual_Comp_Full, initial_point, args=(e_c_Target, S_c_Target), method='trf',
+                                bounds=bounds, x_scale='jac', verbose=1 if disp else 0)
+
+    E, S_cu, r, Alpha, e_63 = result_comp.x
+    return {"E": E/1000, "S_cu": S_cu, "e_cu": (1+r)*S_cu/E, "Alpha": Alpha, "e_63": e_63,
+            "Residual_Comp": 2*result_comp.cost, "nfev_Comp": result_comp.nfev + Seed["nfev_Comp"]}
+
+def fit_tension_full(TensTarget, E=None, N_samples=1000, disp=False):
+    # E in GPa. When given (e.g. from the compression fit) it is kept fixed.
+    e_t_Target, S_t_Target = TensTarget[:,0], TensTarget[:,1]
+
+    E_0 = initial_modulus(TensTarget) if E is None else 1000*E
+    S_tu_0 = S_t_Target.max()
+
+    # Beta and e_end seeded by the stiffening fit with these values
+    Seed = fit_tension(TensTarget, E_0/1000, S_tu_0, N_samples, Method='least_squares')
+    q_0 = max(Seed["e_end"]*E_0/S_tu_0 - 1, 1e-2)
+
+    initial_point = [S_tu_0, q_0, Seed["Beta"]]
+    bounds = ([0.5*S_tu_0, 1e-3, 1.0], [1.5*S_tu_0, np.inf, 5.0])
+    Args = (e_t_Target, S_t_Target, 1000*E if E is not None else None)
+    if E is None:
+        initial_point = [E_0] + initial_point
+        bounds = ([0.2*E_0] + bounds[0], [5.0*E_0] + bounds[1])
+    initial_point = np.clip(initial_point, bounds[0], bounds[1])
+
+    result_tens = least_squares(Residual_Tens_Full, initial_point, args=Args, method='trf',
+                                bounds=bounds, x_scale='jac', verbose=1 if disp else 0)
+
+    if E is None:
+        E_fit, S_tu, q, Beta = result_tens.x
+    else:
+        E_fit = 1000*E
+        S_tu, q, Beta = result_tens.x
+    return {"E_Tens": E_fit/1000, "S_tu": S_tu, "Beta": Beta, "e_end": (1+q)*S_tu/E_fit,
+            "Residual_Tens": 2*result_tens.cost, "nfev_Tens": result_tens.nfev + Seed["nfev_Tens"]}
+
+def fit(Path_to_Compression_SS_data, Path_to_Tension_SS_data, E, S_cu, e_cu, S_tu, N_samples=1000, disp=False, Method='Nelder-Mead'):
+    # Fit one specimen pair. Either path can be None when only one test exists.
+    Result = {}
+    if Path_to_Compression_SS_data is not None:
+        CompTarget = load_curve(Path_to_Compression_SS_data)
+        Result.update(fit_compression(CompTarget, S_cu, e_cu, N_samples, disp, Method))
+    if Path_to_Tension_SS_data is not None:
+        TensTarget = load_curve(Path_to_Tension_SS_data)
+        Result.update(fit_tension(TensTarget, E, S_tu, N_samples, disp, Method))
+    return Result
+
+#### Multi-start search ####
+
+# Seeded candidates (random or Sobol), the Starts best ones are optimized locally in a process
+# pool. The same seed gives the same answer. A large spread of the local optima points to
+# several local minima or a flat valley of the error.
+
+def sample_candidates(bounds, N_samples, Sampler='random', Seed=0):
+    # N_samples points inside bounds, one row per point. 'sobol' rounds N_samples up to a power of 2.
+    if Sampler == 'sobol':
+        from scipy.stats import qmc
+        U = qmc.Sobol(d=len(bounds), scramble=True, seed=Seed).random_base2(int(np.ceil(np.log2(max(N_samples, 2)))))
+    elif Sampler == 'random':
+        U = np.random.default_rng(Seed).random((N_samples, len(bounds)))
+    else:
+        raise ValueError("Sampler should be random or sobol: " + str(Sampler))
+    lower, upper = np.array(bounds, dtype=float).T
+    return lower + (upper - lower)*U
+
+def best_candidates(Error_Batch, bounds, Args, N_samples, Starts, Sampler='random', Seed=0):
+    # Starts candidates with the lowest error, best first
+    Samples = sample_candidates(bounds, N_samples, Sampler, Seed)
+    errors = Evaluate_Batch(Error_Batch, Samples[:,0], Samples[:,1], Args)
+    return Samples[np.argsort(errors, kind='stable')[:Starts]]
+
+def local_fit(Job):
+    # Worker: one local optimization of a branch from a given start
+    Branch, Target, Inputs, Method, Initial = Job
+    fit_branch = fit_compression if Branch == "Compression" else fit_tension
+    return fit_branch(Target, *Inputs, Method=Method, Initial=Initial)
+
+def fit_multi_start(Branch, Target, Inputs, N_samples=1000, Starts=8, Sampler='random', Seed=0,
+                    Method='Nelder-Mead', Workers=None):
+    # Branch "Compression" (Inputs: S_cu, e_cu) or "Tension" (Inputs: E, S_tu). Return the best local
+    # fit with nfev summed over all starts, the spread (max - min) of each parameter over the starts,
+    # the number of starts that reached the best residual and the list of runs.
+    if Branch == "Compression":
+        Args, bounds = comp_problem(Target, *Inputs)
+        Error_Batch, Params, Suffix = Error_Comp_Batch, ("Alpha", "e_63"), "Comp"
+    else:
+        Args, bounds = tens_problem(Target, *Inputs)
+        Error_Batch, Params, Suffix = Error_Tens_Batch, ("Beta", "e_end"), "Tens"
 
-# Generae array for whole Tension Stress-Strain curve
-# Generate strain array
-# Linear Elastic part
-e_t_lin = np.linspace(0.0, e_tu, num=5, endpoint=False)
-# Gerenate Stress array for Linear elastic part
-S_t_lin = E*e_t_lin
-# Power Law Tension stiffning strain
-e_t_power = np.linspace(e_tu, e_end, num=20, endpoint=True)
-# Generate stress array
-S_t_power = S_tu*(np.power((e_end-e_t_power)/(e_end-e_tu), Beta))
-# Combine to 1 array
-e_t_total = np.concatenate((e_t_lin, e_t_power), axis=None)
-S_t_total = np.concatenate((S_t_lin, S_t_power), axis=None)
-# For txt file out
-Tensile_SS_plot=np.stack((e_t_total, S_t_total), axis=1)
+    Points = best_candidates(Error_Batch, bounds, Args, N_samples, Starts, Sampler, Seed)
+    Jobs = [(Branch, Target, Inputs, Method, list(Point)) for Point in Points]
+    if Workers == 1 or len(Jobs) == 1:
+        Runs = list(map(local_fit, Jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=Workers) as pool:
+            Runs = list(pool.map(local_fit, Jobs))
+
+    Residuals = np.array([Run["Residual_" + Suffix] for Run in Runs])
+    best = Residuals.min()
+    Result = dict(Runs[int(np.argmin(Residuals))])
+    Result["nfev_" + Suffix] = sum(Run["nfev_" + Suffix] for Run in Runs)
+    for key in Params:
+        Values = [Run[key] for Run in Runs]
+        Result[key + "_spread"] = max(Values) - min(Values)
+    # 1% of the best residual, at least 1E-9 of the target sum of squares for near perfect fits
+    Result["Converged_" + Suffix] = int(np.count_nonzero(Residuals <= 1.01*best + 1e-9*np.sum(Args[1]**2)))
+    Result["Runs_" + Suffix] = Runs
+    return Result
+
+#### Calibration record and re-fit ####
+
+# The record keeps, per branch, the fitted parameters with a hash of the data and fixed inputs.
+# Same hash: the recorded fit is returned as is. Other hash: warm start from the recorded
+# parameters without random search. No entry: regular fit.
+
+RECORD_VERSION = 1
+
+# Branch: (fixed inputs, fitted parameters, result keys)
+RECORD_BRANCHES = {
+    "Compression": (("S_cu", "e_cu"), ("Alpha", "e_63"), ("Residual_Comp", "nfev_Comp", "njev_Comp")),
+    "Tension": (("E", "S_tu"), ("Beta", "e_end"), ("Residual_Tens", "nfev_Tens", "njev_Tens")),
+}
+
+def data_hash(Target, *Inputs):
+    # SHA-256 of the curve and the fixed inputs of its fit
+    Digest = hashlib.sha256(np.ascontiguousarray(Target, dtype=float).tobytes())
+    Digest.update(json.dumps([value if isinstance(value, str) else float(value) for value in Inputs]).encode())
+    return Digest.hexdigest()
+
+def load_record(FilePathName):
+    # Empty record when the file does not exist or has another version
+    try:
+        with open(FilePathName) as f:
+            Record = json.load(f)
+    except FileNotFoundError:
+        return {"version": RECORD_VERSION}
+    if Record.get("version") != RECORD_VERSION:
+        return {"version": RECORD_VERSION}
+    return Record
+
+def save_record(FilePathName, Record):
+    # Written next to the target then renamed, an interrupted save keeps the old record
+    Temp = FilePathName + ".tmp"
+    with open(Temp, 'w') as f:
+        json.dump(Record, f, indent=1)
+    os.replace(Temp, FilePathName)
+
+def refit_branch(Record, Branch, Target, Inputs, N_samples=1000, disp=False, Method='Nelder-Mead', Search=None):
+    # Fit one branch through the record (updated in place). Start_<Branch> of the result is
+    # "record" (unchanged data, nothing evaluated), "warm" or "random".
+    # Search: keyword arguments of fit_multi_start() for branches without record entry
+    Input_keys, Param_keys, Result_keys = RECORD_BRANCHES[Branch]
+    Hash = data_hash(Target, *Inputs, Method)
+    Entry = Record.get(Branch)
+    if Entry is not None and Entry["Hash"] == Hash:
+        Result = {key: Entry[key] for key in Param_keys + Result_keys[:1]}
+        Result.update({key: 0 for key in Result_keys[1:]})
+        Result["Start_" + Branch] = "record"
+        return Result
+
+    Initial = None if Entry is None else [Entry[key] for key in Param_keys]
+    if Initial is None and Search is not None:
+        Result = fit_multi_start(Branch, Target, Inputs, N_samples, Method=Method, **Search)
+    else:
+        fit_branch = fit_compression if Branch == "Compression" else fit_tension
+        Result = fit_branch(Target, *Inputs, N_samples, disp, Method, Initial=Initial)
+    Result["Start_" + Branch] = "random" if Initial is None else "warm"
+
+    Entry = {"Hash": Hash, "Points": len(Target), "Method": Method, "Fitted": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    Entry.update({key: float(value) for key, value in zip(Input_keys, Inputs)})
+    Entry.update({key: float(Result[key]) for key in Param_keys + Result_keys[:1]})
+    Entry.update({key: int(Result[key]) for key in Result_keys[1:]})
+    Record[Branch] = Entry
+    return Result
+
+def refit(Record_File, CompTarget, TensTarget, E, S_cu, e_cu, S_tu, N_samples=1000, disp=False, Method='Nelder-Mead',
+          Search=None):
+    # fit() on loaded curves through the calibration record file, either curve can be None
+    Record = load_record(Record_File)
+    Result = {}
+    if CompTarget is not None:
+        Result.update(refit_branch(Record, "Compression", CompTarget, (S_cu, e_cu), N_samples, disp, Method, Search))
+    if TensTarget is not None:
+        Result.update(refit_branch(Record, "Tension", TensTarget, (E, S_tu), N_samples, disp, Method, Search))
+    save_record(Record_File, Record)
+    return Result
 
 #######################################
 ## Plot Graph and calibration result ##
 #######################################
 
-fig, axs = plt.subplots(nrows=1, ncols=2, figsize=(12, 4))
-
-axs[0].plot(e_c_Target, S_c_Target, label='Compression-Target', marker='o', linestyle='', markersize=10, color='C0')
-axs[0].plot(e_c_total, S_c_total, label='Compression-Fit', linestyle='-', color='C0')
-axs[0].set_xlabel('Strain')
-axs[0].set_ylabel('Stress (MPa)')
-axs[0].ticklabel_format(axis='x', style='sci', scilimits=(0,0), useMathText=True)
-axs[0].grid(True)
-axs[0].legend(loc='upper left')
-axs[0].set_ylim(top=1.4*max(S_c_Target))
-
-axs[1].plot(e_t_Target, S_t_Target, label='Tension-Target', marker='o', linestyle='', markersize=10, color='C3')
-axs[1].plot(e_t_total, S_t_total, label='Tension-Fit', linestyle='-', color='C3')
-axs[1].set_xlabel('Strain')
-axs[1].set_ylabel('Stress (MPa)')
-axs[1].ticklabel_format(axis='x', style='sci', scilimits=(0,0), useMathText=True)
-axs[1].grid(True)
-axs[1].legend(loc='upper left')
-axs[1].set_ylim(top=1.4*max(S_t_Target))
-
-# Annotations for Compression side
-compression_annotations = [
-    ("$E$ (GPa):", E/1000),  # Dividing by 1000 to convert to GPa
-    ("$\sigma_{cu}$ (MPa):", S_cu),
-    ("$\epsilon_{cu}$:", "{:.1e}".format(e_cu)),
-    ("$\epsilon_{0.63}$:", "{:.1e}".format(e_63)),
-    ("$\\alpha$:", "{:.3f}".format(Alpha))
-]
-
-# Annotations for Tension side
-tension_annotations = [
-    ("$\sigma_{tu}$ (MPa):", S_tu),
-    ("$\epsilon_{tu}$:", "{:.1e}".format(e_tu)),
-    ("$\\beta$:", "{:.3f}".format(Beta)),
-    ("$\epsilon_{end}$:", "{:.1e}".format(e_end))
-]
-
-# Add annotations to Compression plot on the right side
-for i, (label, value) in enumerate(compression_annotations):
-    axs[0].text(0.95, 0.9 - i*0.1, "{} {}".format(label, value), transform=axs[0].transAxes, ha='right')
-
-# Add annotations to Tension plot on the right side
-for i, (label, value) in enumerate(tension_annotations):
-    axs[1].text(0.95, 0.9 - i*0.1, "{} {}".format(label, value), transform=axs[1].transAxes, ha='right')
-
-plt.tight_layout()
-plt.show()
+def plot_fit(CompTarget, TensTarget, E, S_cu, e_cu, S_tu, Alpha, e_63, Beta, e_end):
+    import matplotlib.pyplot as plt
+
+    e_c_Target, S_c_Target = CompTarget[:,0], CompTarget[:,1]
+    e_t_Target, S_t_Target = TensTarget[:,0], TensTarget[:,1]
+
+    # Parabolic Hardening region is automatically determined by E, S_cu and e_cu
+    E = 1000*E
+    S_c0 = 2*S_cu - E*e_cu
+    e_0 = S_c0/E
+
+    # Generae array for whole Compression Stress-Strain curve t
+    # Generate strain array
+    # Linear Elastic part
+    e_c_lin = np.linspace(0.0, e_0, num=5, endpoint=False)
+    # Parabolic Hardening part
+    e_para = np.linspace(e_0, e_cu, num=5, endpoint=False)
+    # Gerenate Stress array for Linear elastic part
+    S_c_lin = E*e_c_lin
+    # Gerenate Stress array for parabolic hardening part
+    S_c_para = -((S_cu-S_c0)/(e_cu-e_0)**2)*(e_para-e_0)*(e_para-e_0-2*(e_cu-e_0)) + S_c0
+
+    ## Weibull softening part
+    # Generate strain array
+    e_wb = np.linspace(e_cu, max(e_c_Target), 20, endpoint=True)
+    # Gerenate Stress array
+    S_c_wb = S_cu*(0.99*np.exp(-np.power((e_wb-e_cu)/e_63, Alpha)) + 0.01)
+
+    # Combine to 1 array
+    e_c_total = np.concatenate((e_c_lin, e_para, e_wb), axis=None)
+    S_c_total = np.concatenate((S_c_lin, S_c_para, S_c_wb), axis=None)
+
+    e_tu = S_tu/E
+    # Generae array for whole Tension Stress-Strain curve
+    # Generate strain array
+    # Linear Elastic part
+    e_t_lin = np.linspace(0.0, e_tu, num=5, endpoint=False)
+    # Gerenate Stress array for Linear elastic part
+    S_t_lin = E*e_t_lin
+    # Power Law Tension stiffning strain
+    e_t_power = np.linspace(e_tu, e_end, num=20, endpoint=True)
+    # Generate stress array
+    S_t_power = S_tu*(np.power((e_end-e_t_power)/(e_end-e_tu), Beta))
+    # Combine to 1 array
+    e_t_total = np.concatenate((e_t_lin, e_t_power), axis=None)
+    S_t_total = np.concatenate((S_t_lin, S_t_power), axis=None)
+
+    fig, axs = plt.subplots(nrows=1, ncols=2, figsize=(12, 4))
+
+    axs[0].plot(e_c_Target, S_c_Target, label='Compression-Target', marker='o', linestyle='', markersize=10, color='C0')
+    axs[0].plot(e_c_total, S_c_total, label='Compression-Fit', linestyle='-', color='C0')
+    axs[0].set_xlabel('Strain')
+    axs[0].set_ylabel('Stress (MPa)')
+    axs[0].ticklabel_format(axis='x', style='sci', scilimits=(0,0), useMathText=True)
+    axs[0].grid(True)
+    axs[0].legend(loc='upper left')
+    axs[0].set_ylim(top=1.4*max(S_c_Target))
+
+    axs[1].plot(e_t_Target, S_t_Target, label='Tension-Target', marker='o', linestyle='', markersize=10, color='C3')
+    axs[1].plot(e_t_total, S_t_total, label='Tension-Fit', linestyle='-', color='C3')
+    axs[1].set_xlabel('Strain')
+    axs[1].set_ylabel('Stress (MPa)')
+    axs[1].ticklabel_format(axis='x', style='sci', scilimits=(0,0), useMathText=True)
+    axs[1].grid(True)
+    axs[1].legend(loc='upper left')
+    axs[1].set_ylim(top=1.4*max(S_t_Target))
+
+    # Annotations for Compression side
+    compression_annotations = [
+        ("$E$ (GPa):", E/1000),  # Dividing by 1000 to convert to GPa
+        (r"$\sigma_{cu}$ (MPa):", S_cu),
+        (r"$\epsilon_{cu}$:", "{:.1e}".format(e_cu)),
+        (r"$\epsilon_{0.63}$:", "{:.1e}".format(e_63)),
+        ("$\\alpha$:", "{:.3f}".format(Alpha))
+    ]
+
+    # Annotations for Tension side
+    tension_annotations = [
+        (r"$\sigma_{tu}$ (MPa):", S_tu),
+        (r"$\epsilon_{tu}$:", "{:.1e}".format(e_tu)),
+        ("$\\beta$:", "{:.3f}".format(Beta)),
+        (r"$\epsilon_{end}$:", "{:.1e}".format(e_end))
+    ]
+
+    # Add annotations to Compression plot on the right side
+    for i, (label, value) in enumerate(compression_annotations):
+        axs[0].text(0.95, 0.9 - i*0.1, "{} {}".format(label, value), transform=axs[0].transAxes, ha='right')
+
+    # Add annotations to Tension plot on the right side
+    for i, (label, value) in enumerate(tension_annotations):
+        axs[1].text(0.95, 0.9 - i*0.1, "{} {}".format(label, value), transform=axs[1].transAxes, ha='right')
+
+    plt.tight_layout()
+    plt.show()
+
+if __name__ == "__main__":
+    # TargetData for Compression part
+    CompTarget = load_curve(Path_to_Compression_SS_data)
+
+    # TargetData for Tension part
+    TensTarget = load_curve(Path_to_Tension_SS_data)
+
+    if Fit_Full_Curve:
+        # Tension shares the elastic modulus fitted on the compression curve
+        Result = fit_compression_full(CompTarget, N_samples, disp=True)
+        Result.update(fit_tension_full(TensTarget, Result["E"], N_samples, disp=True))
+        E, S_cu, e_cu, S_tu = Result["E"], Result["S_cu"], Result["e_cu"], Result["S_tu"]
+        print("E: {:.3f} GPa, S_cu: {:.3f} MPa, e_cu: {:.3e}, S_tu: {:.3f} MPa".format(E, S_cu, e_cu, S_tu))
+    elif Calibration_Record is not None:
+        Search = None if Seed is None else {"Starts": Starts, "Sampler": Sampler, "Seed": Seed}
+        Result = refit(Calibration_Record, CompTarget, TensTarget, E, S_cu, e_cu, S_tu, N_samples, disp=True, Method=Method,
+                       Search=Search)
+        print("Start: compression {}, tension {}".format(Result["Start_Compression"], Result["Start_Tension"]))
+    elif Seed is not None:
+        Result = fit_multi_start("Compression", CompTarget, (S_cu, e_cu), N_samples, Starts, Sampler, Seed, Method)
+        Result.update(fit_multi_start("Tension", TensTarget, (E, S_tu), N_samples, Starts, Sampler, Seed, Method))
+        print("Starts at the best residual: compression {}/{}, tension {}/{}".format(
+            Result["Converged_Comp"], Starts, Result["Converged_Tens"], Starts))
+        print("Spread: Alpha {:.3g}, e_63 {:.3g}, Beta {:.3g}, e_end {:.3g}".format(
+            Result["Alpha_spread"], Result["e_63_spread"], Result["Beta_spread"], Result["e_end_spread"]))
+    else:
+        Result = fit_compression(CompTarget, S_cu, e_cu, N_samples, disp=True, Method=Method)
+        Result.update(fit_tension(TensTarget, E, S_tu, N_samples, disp=True, Method=Method))
+    print("Function evaluations: compression {}, tension {}".format(Result["nfev_Comp"], Result["nfev_Tens"]))
+
+    plot_fit(CompTarget, TensTarget, E, S_cu, e_cu, S_tu, Result["Alpha"], Result["e_63"], Result["Beta"], Result["e_end"])
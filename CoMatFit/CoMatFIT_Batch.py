@@ -0,0 +1,235 @@
+"""
+Source code for CoMatFIT_Batch: Fit many concrete specimens in parallel with CoMatFIT
+
+Author: Youngbin LIM
+Contact: lyb0684@naver.com
+
+Specimens are given either as a directory or as a CSV manifest.
+
+Directory: files named <Specimen>_Compression.txt and/or <Specimen>_Tension.txt
+(.csv is accepted as well). Cylinders may only have the compression file and
+dog-bones only the tension file.
+
+Manifest: CSV with the columns Specimen, Compression, Tension, E, S_cu, e_cu, S_tu
+and optionally Points. Paths are relative to the manifest. Empty cells fall back to
+the command line values, and S_cu, e_cu and S_tu fall back to the peak of the
+measured curve.
+
+Files may be raw machine logs (header lines, tab, semicolon, comma or whitespace
+delimiters, decimal commas). Every curve is reduced to a monotone envelope of
+--points points before fitting (see CoMatFIT.load_curve).
+
+Usage:
+    python CoMatFIT_Batch.py <directory or manifest.csv> --E 30.0 --out Fit_Summary.csv
+
+Reproducible multi-start fit, local fits from the 8 best of 4096 Sobol candidates (seed 1):
+    python CoMatFIT_Batch.py <directory or manifest.csv> --starts 8 --sampler sobol --seed 1 --N_samples 4096
+
+Incremental re-fit, one calibration record per specimen in Records/ (unchanged curves
+are not fitted again, changed curves start from the recorded parameters):
+    python CoMatFIT_Batch.py <directory or manifest.csv> --records Records
+
+Stage timers and objective evaluation counts (specimens are then fitted in this process):
+    python CoMatFIT_Batch.py <directory or manifest.csv> --profile Profile.json --profile-dump Profile.prof
+"""
+
+import os
+import sys
+import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import CoMatFIT
+
+SUMMARY_COLUMNS = ["Specimen", "E", "S_cu", "e_cu", "S_tu",
+                   "Alpha", "e_63", "Residual_Comp", "nfev_Comp", "Beta", "e_end", "Residual_Tens", "nfev_Tens", "Status"]
+
+# Extra summary columns of --records and --starts / --seed
+RECORD_COLUMNS = ["Start_Compression", "Start_Tension"]
+MULTI_START_COLUMNS = ["Alpha_spread", "e_63_spread", "Converged_Comp", "Beta_spread", "e_end_spread", "Converged_Tens"]
+
+def find_specimens(Directory):
+    # Pair <Specimen>_Compression / <Specimen>_Tension files of a directory
+    Specimens = {}
+    for name in sorted(os.listdir(Directory)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in (".txt", ".csv"):
+            continue
+        for suffix, key in (("_compression", "Compression"), ("_tension", "Tension")):
+            if stem.lower().endswith(suffix):
+                Specimen = stem[:-len(suffix)]
+                Specimens.setdefault(Specimen, {"Specimen": Specimen})[key] = os.path.join(Directory, name)
+    return list(Specimens.values())
+
+def read_manifest(Manifest):
+    Root = os.path.dirname(os.path.abspath(Manifest))
+    Specimens = []
+    with open(Manifest, newline='') as f:
+        for row in csv.DictReader(f):
+            Specimen = {key: value.strip() for key, value in row.items() if value is not None and value.strip() != ""}
+            for key in ("Compression", "Tension"):
+                if key in Specimen:
+                    Specimen[key] = os.path.join(Root, Specimen[key])
+            Specimens.append(Specimen)
+    return Specimens
+
+def load(Specimen, key):
+    # Measured curve of a specimen reduced to Points envelope points, 0 keeps every row
+    Points = int(Specimen.get("Points", CoMatFIT.Envelope_Points) or 0)
+    return CoMatFIT.load_curve(Specimen[key], Points or None, Workers=1)
+
+def fit_specimen(Specimen):
+    # Worker: fit one specimen and return one summary row, errors are reported in Status
+    Row = {"Specimen": Specimen["Specimen"]}
+    try:
+        if Specimen.get("Full"):
+            return fit_specimen_full(Specimen)
+        E = float(Specimen["E"])
+        Row["E"] = E
+        if Specimen.get("Records"):
+            return fit_specimen_record(Specimen, Row)
+        if "Compression" in Specimen:
+            CompTarget = load(Specimen, "Compression")
+            # Peak of the measured curve unless given explicitly
+            peak = CompTarget[:,1].argmax()
+            S_cu = float(Specimen.get("S_cu", CompTarget[peak,1]))
+            e_cu = float(Specimen.get("e_cu", CompTarget[peak,0]))
+            Row.update({"S_cu": S_cu, "e_cu": e_cu})
+            if Specimen.get("Search"):
+                Row.update(CoMatFIT.fit_multi_start("Compression", CompTarget, (S_cu, e_cu), int(Specimen["N_samples"]),
+                                                    Method=Specimen["Method"], **Specimen["Search"]))
+            else:
+                Row.update(CoMatFIT.fit_compression(CompTarget, S_cu, e_cu, int(Specimen["N_samples"]), Method=Specimen["Method"]))
+        if "Tension" in Specimen:
+            TensTarget = load(Specimen, "Tension")
+            S_tu = float(Specimen.get("S_tu", TensTarget[:,1].max()))
+            Row["S_tu"] = S_tu
+            if Specimen.get("Search"):
+                Row.update(CoMatFIT.fit_multi_start("Tension", TensTarget, (E, S_tu), int(Specimen["N_samples"]),
+                                                    Method=Specimen["Method"], **Specimen["Search"]))
+            else:
+                Row.update(CoMatFIT.fit_tension(TensTarget, E, S_tu, int(Specimen["N_samples"]), Method=Specimen["Method"]))
+        Row["Status"] = "OK"
+    except Exception as e:
+        Row["Status"] = "Error: " + str(e)
+    return Row
+
+def fit_specimen_record(Specimen, Row):
+    # Re-fit through <Records>/<Specimen>.json, peak values as in fit_specimen()
+    CompTarget = TensTarget = S_cu = e_cu = S_tu = None
+    if "Compression" in Specimen:
+        CompTarget = load(Specimen, "Compression")
+        peak = CompTarget[:,1].argmax()
+        S_cu = float(Specimen.get("S_cu", CompTarget[peak,1]))
+        e_cu = float(Specimen.get("e_cu", CompTarget[peak,0]))
+        Row.update({"S_cu": S_cu, "e_cu": e_cu})
+    if "Tension" in Specimen:
+        TensTarget = load(Specimen, "Tension")
+        S_tu = float(Specimen.get("S_tu", TensTarget[:,1].max()))
+        Row["S_tu"] = S_tu
+    Record_File = os.path.join(Specimen["Records"], Specimen["Specimen"] + ".json")
+    Row.update(CoMatFIT.refit(Record_File, CompTarget, TensTarget, Row["E"], S_cu, e_cu, S_tu,
+                              int(Specimen["N_samples"]), Method=Specimen["Method"], Search=Specimen.get("Search")))
+    Row["Status"] = "OK"
+    return Row
+
+def fit_specimen_full(Specimen):
+    # Worker for --full: E, S_cu, e_cu and S_tu are fitted as well.
+    # Tension shares the modulus of the compression fit when both tests exist.
+    Row = {"Specimen": Specimen["Specimen"]}
+    E = None
+    if "Compression" in Specimen:
+        CompTarget = load(Specimen, "Compression")
+        Row.update(CoMatFIT.fit_compression_full(CompTarget, int(Specimen["N_samples"])))
+        E = Row["E"]
+    if "Tension" in Specimen:
+        TensTarget = load(Specimen, "Tension")
+        Row.update(CoMatFIT.fit_tension_full(TensTarget, E, int(Specimen["N_samples"])))
+        Row["E"] = Row["E_Tens"]
+    Row["Status"] = "OK"
+    return Row
+
+def fit_batch(Specimens, Workers=None):
+    # Fit every specimen in a process pool, rows are returned in input order
+    with ProcessPoolExecutor(max_workers=Workers) as pool:
+        return list(pool.map(fit_specimen, Specimens, chunksize=1))
+
+def write_summary(Rows, FilePathName, Columns=SUMMARY_COLUMNS):
+    with open(FilePathName, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=Columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(Rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit Weibull / power law parameters for many specimens")
+    parser.add_argument("source", help="Directory of specimen files or CSV manifest")
+    parser.add_argument("--E", type=float, default=30.0, help="Elastic modulus in GPa")
+    parser.add_argument("--S_cu", type=float, help="Max compressive stress in MPa (default: peak of data)")
+    parser.add_argument("--e_cu", type=float, help="Strain at max compressive stress (default: peak of data)")
+    parser.add_argument("--S_tu", type=float, help="Max tensile stress in MPa (default: peak of data)")
+    parser.add_argument("--N_samples", type=int, default=1000, help="Random candidates per fit")
+    parser.add_argument("--method", default="Nelder-Mead", choices=["Nelder-Mead", "least_squares"],
+                        help="Local optimizer, least_squares uses analytic Jacobians")
+    parser.add_argument("--points", type=int, default=CoMatFIT.Envelope_Points,
+                        help="Points of the monotone envelope fitted per curve, 0 keeps every row (default: {})".format(CoMatFIT.Envelope_Points))
+    parser.add_argument("--full", action="store_true",
+                        help="Also fit E, S_cu, e_cu and S_tu over the whole curve")
+    parser.add_argument("--starts", type=int, help="Local fits from this many best candidates (multi-start, default seed 0)")
+    parser.add_argument("--sampler", default="random", choices=["random", "sobol"], help="Candidates of the multi-start")
+    parser.add_argument("--seed", type=int, help="Seed of the multi-start candidates (default starts: 1)")
+    parser.add_argument("--records", help="Folder of calibration records, re-fit only what changed (not with --full)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes (default: all cores)")
+    parser.add_argument("--out", default="Fit_Summary.csv", help="Summary table")
+    parser.add_argument("--profile", metavar="REPORT.json",
+                        help="Write stage timers and evaluation counters to a JSON report (runs in one process)")
+    parser.add_argument("--profile-dump", metavar="FILE",
+                        help="Write a cProfile dump (pyinstrument HTML when FILE ends with .html)")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.source):
+        Specimens = find_specimens(args.source)
+    else:
+        Specimens = read_manifest(args.source)
+
+    # Command line values are the defaults for every specimen
+    Defaults = {"E": args.E, "N_samples": args.N_samples, "Method": args.method, "Full": args.full, "Points": args.points}
+    if args.records is not None:
+        if args.full:
+            parser.error("--records cannot be combined with --full")
+        os.makedirs(args.records, exist_ok=True)
+        Defaults["Records"] = args.records
+    Multi_Start = args.starts is not None or args.seed is not None
+    if Multi_Start:
+        if args.full:
+            parser.error("--starts / --seed cannot be combined with --full")
+        # Shared by every specimen, the starts run in this process unless changed below
+        Search = {"Starts": args.starts or 1, "Sampler": args.sampler, "Seed": args.seed or 0, "Workers": 1}
+        Defaults["Search"] = Search
+    for key in ("S_cu", "e_cu", "S_tu"):
+        if getattr(args, key) is not None:
+            Defaults[key] = getattr(args, key)
+    Specimens = [dict(Defaults, **Specimen) for Specimen in Specimens]
+
+    if args.profile is None and args.profile_dump is None:
+        if Multi_Start and len(Specimens) < (args.workers or os.cpu_count() or 1):
+            # Fewer specimens than processes: one specimen at a time, its starts run in parallel
+            Search["Workers"] = args.workers
+            Rows = list(map(fit_specimen, Specimens))
+        else:
+            Rows = fit_batch(Specimens, args.workers)
+    else:
+        # Counters live in this process, so the pool is not used
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'CoMatGen'))
+        import COMat_Profile
+        with COMat_Profile.Session(COMat_Profile.fit_targets(CoMatFIT), args.profile, args.profile_dump) as Session:
+            Rows = list(map(fit_specimen, Specimens))
+        print(Session.summary())
+    Columns = SUMMARY_COLUMNS + (RECORD_COLUMNS if args.records is not None else [])
+    write_summary(Rows, args.out, Columns + (MULTI_START_COLUMNS if Multi_Start else []))
+
+    failed = sum(Row["Status"] != "OK" for Row in Rows)
+    print("Fitted {} specimens ({} failed), summary written to {}".format(len(Rows), failed, args.out))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
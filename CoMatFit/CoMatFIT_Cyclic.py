@@ -0,0 +1,228 @@
+"""
+Source code for CoMatFIT_Cyclic: Calibration of the CDP parameters against a cyclic test
+
+Author: Youngbin LIM
+Contact: lyb0684@naver.com
+
+The measured strain history drives the uniaxial CDP material point of COMat_Simulator, and
+the Weibull (e_60, Alpha), power law (e_end, Beta) and stiffness recovery (Tension_Recovery,
+Compression_Recovory) parameters of generate() are optimized together on the stress error.
+E, S_cu, e_cu, S_tu and Ref_Length stay fixed, S_cu, e_cu and S_tu default to the peaks of
+the test. Give S_cu and e_cu of a monotonic test when cracking before the compressive peak
+lowers the peak of the cyclic one.
+
+Data: two columns, strain and stress (MPa), tension positive. Tests recorded with
+compression positive are read with --compression-positive.
+
+Seeded random or Sobol candidates are simulated in vectorized chunks spread over a process
+pool, then the Starts best ones are refined with bounded least_squares. The forward
+difference Jacobian of a local step runs all perturbed parameter sets in one simulator call.
+
+Usage:
+    python CoMatFIT_Cyclic.py Cyclic_Test.txt --E 30 --N_samples 2000 --starts 4 --seed 1
+
+Write CDP_Mat.inp of the calibrated material and the simulated response next to the test:
+    python CoMatFIT_Cyclic.py Cyclic_Test.txt --E 30 --out ./Mat --response Response.csv
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.optimize import least_squares
+
+import CoMatFIT
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'CoMatGen'))
+import COMat_Generator
+import COMat_Simulator
+
+# Fitted parameters, the remaining columns of COMat_Generator.BATCH_COLUMNS are fixed
+FIT_KEYS = ("e_60", "Alpha", "e_end", "Beta", "Tension_Recovery", "Compression_Recovory")
+FIXED_KEYS = ("E", "S_cu", "e_cu", "S_tu", "Ref_Length")
+
+# Forward difference step of the Jacobian, fraction of the parameter range
+DIFF_STEP = 1E-4
+
+def turning_points(Strain, Threshold):
+    # Indices of the load reversals, reversals smaller than Threshold are taken as noise
+    d = np.diff(Strain)
+    moving = np.flatnonzero(d)
+    change = moving[np.flatnonzero(np.sign(d[moving[1:]]) != np.sign(d[moving[:-1]]))] + 1
+    Candidates = np.concatenate((change, [len(Strain) - 1]))
+
+    Turns, ext, direction = [0], 0, 0.
+    for i in Candidates:
+        step = Strain[i] - Strain[ext]
+        if direction == 0.:
+            if abs(Strain[i] - Strain[0]) >= Threshold:
+                direction, ext = np.sign(Strain[i] - Strain[0]), i
+        elif step*direction > 0:
+            ext = i
+        elif abs(step) >= Threshold:
+            Turns.append(ext)
+            direction, ext = -direction, i
+    if ext != Turns[-1]:
+        Turns.append(ext)
+    return np.array(Turns)
+
+def cyclic_path(Target, Increment=2E-5):
+    # Strain history of the simulator through the reversals of the test, steps no larger than
+    # Increment, and the measured stress at every step (interpolated along each branch)
+    Strain, Stress = Target[:,0], Target[:,1]
+    Turns = turning_points(Strain, Increment)
+    Path, S_Target = [Strain[:1]], [Stress[:1]]
+    for a, b in zip(Turns[:-1], Turns[1:]):
+        n = max(int(np.ceil(abs(Strain[b] - Strain[a])/Increment)), 1)
+        Steps = np.linspace(Strain[a], Strain[b], n + 1)[1:]
+        # Noise inside a branch is flattened so that the branch is monotonic
+        sign = np.sign(Strain[b] - Strain[a])
+        Branch = np.maximum.accumulate(sign*Strain[a:b+1])
+        Path.append(Steps)
+        S_Target.append(np.interp(sign*Steps, Branch, Stress[a:b+1]))
+    return np.concatenate(Path), np.concatenate(S_Target)
+
+def cyclic_bounds(Fixed):
+    # Bounds of FIT_KEYS, Weibull and power law bounds as in CoMatFIT, e_end above the cracking strain
+    e_tu = Fixed["S_tu"]/(1000*Fixed["E"])
+    return [(0.0001, 0.01), (0.5, 8.0), (1.1*e_tu, max(0.01, 2.2*e_tu)), (1.0, 5.0), (0.0, 1.0), (0.0, 1.0)]
+
+def fixed_inputs(Target, E, S_cu=None, e_cu=None, S_tu=None, Ref_Length=1.0):
+    # Fixed parameters, peaks of the test unless given
+    peak = Target[:,1].argmin()
+    Fixed = {"E": float(E), "Ref_Length": float(Ref_Length),
+             "S_cu": float(-Target[peak,1] if S_cu is None else S_cu),
+             "e_cu": float(-Target[peak,0] if e_cu is None else e_cu),
+             "S_tu": float(Target[:,1].max() if S_tu is None else S_tu)}
+    COMat_Generator.check_parameters(1000*Fixed["E"], Fixed["S_cu"], Fixed["e_cu"], Fixed["S_tu"], cyclic_bounds(Fixed)[2][0])
+    return Fixed
+
+def simulate_candidates(Samples, Fixed, Path):
+    # Simulated stress history of every candidate, one row of FIT_KEYS per candidate
+    Table = {key: np.full(len(Samples), Fixed[key]) for key in FIXED_KEYS}
+    Table.update({key: Samples[:,i] for i, key in enumerate(FIT_KEYS)})
+    return COMat_Simulator.simulate(COMat_Simulator.from_batch(Table), Path)["Stress"][:,0]
+
+def Error_Cyclic_Batch(Job):
+    # Worker: sum of squared stress errors of a chunk of candidates
+    Samples, Fixed, Path, S_Target = Job
+    return np.sum(np.power(simulate_candidates(Samples, Fixed, Path) - S_Target, 2), axis=1)
+
+def local_fit(Job):
+    # Worker: bounded least_squares from one start
+    Fixed, Path, S_Target, bounds, Initial, disp = Job
+    lower, upper = np.array(bounds, dtype=float).T
+
+    def Residual(x):
+        return simulate_candidates(x[None,:], Fixed, Path)[0] - S_Target
+
+    def Jacobian(x):
+        # Steps point inward at the upper bounds
+        h = DIFF_STEP*(upper - lower)
+        h = np.where(x + h > upper, -h, h)
+        S = simulate_candidates(np.vstack((x, x + np.diag(h))), Fixed, Path)
+        return ((S[1:] - S[0])/h[:,None]).T
+
+    result = least_squares(Residual, Initial, jac=Jacobian, bounds=(lower, upper), method='trf',
+                           x_scale=upper - lower, verbose=1 if disp else 0)
+    Run = dict(zip(FIT_KEYS, result.x.tolist()))
+    Run.update({"Residual_Cyclic": 2*result.cost, "nfev_Cyclic": int(result.nfev), "njev_Cyclic": int(result.njev)})
+    return Run
+
+def fit_cyclic(Target, Fixed, N_samples=1000, Starts=4, Sampler='random', Seed=0, Increment=2E-5, Workers=None,
+               disp=False):
+    # Candidate search then local fits from the Starts best candidates. Return the best local fit with
+    # nfev summed over all starts, the spread (max - min) of each parameter over the starts, the
+    # number of starts that reached the best residual and the list of runs.
+    Path, S_Target = cyclic_path(Target, Increment)
+    bounds = cyclic_bounds(Fixed)
+    Samples = CoMatFIT.sample_candidates(bounds, N_samples, Sampler, Seed)
+
+    # Chunks bound the (steps x candidates) stress array and give every process some work
+    n_workers = 1 if Workers == 1 else (Workers or os.cpu_count() or 1)
+    Chunk = max(1, min(4000000 // len(Path), -(-len(Samples) // n_workers)))
+    Jobs = [(Samples[i:i+Chunk], Fixed, Path, S_Target) for i in range(0, len(Samples), Chunk)]
+
+    if n_workers == 1:
+        errors = np.concatenate(list(map(Error_Cyclic_Batch, Jobs)))
+        Points = Samples[np.argsort(errors, kind='stable')[:Starts]]
+        Runs = list(map(local_fit, [(Fixed, Path, S_Target, bounds, Point, disp) for Point in Points]))
+    else:
+        with ProcessPoolExecutor(max_workers=Workers) as pool:
+            errors = np.concatenate(list(pool.map(Error_Cyclic_Batch, Jobs)))
+            Points = Samples[np.argsort(errors, kind='stable')[:Starts]]
+            Runs = list(pool.map(local_fit, [(Fixed, Path, S_Target, bounds, Point, disp) for Point in Points]))
+
+    Residuals = np.array([Run["Residual_Cyclic"] for Run in Runs])
+    best = Residuals.min()
+    Result = dict(Fixed, **Runs[int(np.argmin(Residuals))])
+    Result["nfev_Cyclic"] = sum(Run["nfev_Cyclic"] for Run in Runs)
+    for key in FIT_KEYS:
+        Values = [Run[key] for Run in Runs]
+        Result[key + "_spread"] = max(Values) - min(Values)
+    Result["Converged_Cyclic"] = int(np.count_nonzero(Residuals <= 1.01*best + 1e-9*np.sum(S_Target**2)))
+    Result["Steps"] = len(Path)
+    Result["Candidates"] = len(Samples)
+    Result["Runs_Cyclic"] = Runs
+    return Result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit the CDP damage and recovery parameters to a cyclic test")
+    parser.add_argument("data", help="Strain / stress history of the test (tension positive)")
+    parser.add_argument("--strain-column", type=int, default=0, help="Column of the strain, counted from 0 (default: 0)")
+    parser.add_argument("--stress-column", type=int, default=1, help="Column of the stress, counted from 0 (default: 1)")
+    parser.add_argument("--compression-positive", action="store_true", help="The test is recorded with compression positive")
+    parser.add_argument("--E", type=float, default=30.0, help="Elastic modulus in GPa")
+    parser.add_argument("--S_cu", type=float, help="Max compressive stress in MPa (default: peak of data)")
+    parser.add_argument("--e_cu", type=float, help="Strain at max compressive stress (default: peak of data)")
+    parser.add_argument("--S_tu", type=float, help="Max tensile stress in MPa (default: peak of data)")
+    parser.add_argument("--Ref_Length", type=float, default=1.0, help="Reference length of the written material")
+    parser.add_argument("--N_samples", type=int, default=1000, help="Candidates of the search")
+    parser.add_argument("--starts", type=int, default=4, help="Local fits from this many best candidates")
+    parser.add_argument("--sampler", default="random", choices=["random", "sobol"], help="Candidates of the search")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the candidates")
+    parser.add_argument("--increment", type=float, default=2E-5, help="Max strain increment of the simulation")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes (default: all cores)")
+    parser.add_argument("--out", help="Write CDP_Mat.inp and SS curves of the calibrated material to this folder")
+    parser.add_argument("--meter", action="store_true", help="Dimension is in meter (for --out)")
+    parser.add_argument("--response", help="CSV with strain, measured and simulated stress")
+    parser.add_argument("--disp", action="store_true", help="Show the progress of the local fits")
+    args = parser.parse_args(argv)
+
+    try:
+        # Every row in order, the load reversals are needed
+        Target = CoMatFIT.load_curve(args.data, None, (args.strain_column, args.stress_column))
+        if args.compression_positive:
+            Target = -Target
+        Fixed = fixed_inputs(Target, args.E, args.S_cu, args.e_cu, args.S_tu, args.Ref_Length)
+    except (ValueError, OSError) as e:
+        print("Error: " + str(e), file=sys.stderr)
+        return 1
+    Result = fit_cyclic(Target, Fixed, args.N_samples, args.starts, args.sampler, args.seed, args.increment,
+                        args.workers, args.disp)
+
+    for key in FIXED_KEYS + FIT_KEYS:
+        print("{} = {:.6g}".format(key, Result[key]))
+    print("Residual = {:.6g} over {} steps, {} of {} starts converged, {} evaluations".format(
+        Result["Residual_Cyclic"], Result["Steps"], Result["Converged_Cyclic"], len(Result["Runs_Cyclic"]),
+        Result["nfev_Cyclic"]))
+
+    if args.out is not None:
+        os.makedirs(args.out, exist_ok=True)
+        COMat_Generator.generate(args.out, False, *[Result[key] for key in COMat_Generator.BATCH_COLUMNS[:10]],
+                                 args.meter, Result["Ref_Length"])
+        print(os.path.join(args.out, "CDP_Mat.inp"))
+    if args.response is not None:
+        Path, S_Target = cyclic_path(Target, args.increment)
+        Sample = np.array([[Result[key] for key in FIT_KEYS]])
+        Writer = COMat_Generator.KeywordWriter()
+        Writer.line("Strain, Measured(MPa), Simulated(MPa)")
+        Writer.columns(Path, S_Target, simulate_candidates(Sample, Fixed, Path)[0])
+        Writer.write(args.response)
+        print(args.response)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+Source code for COMat_Cache: Content-addressed cache of generated CDP material files
+
+Author: Youngbin LIM
+Contact: lyb0684@naver.com
+
+Files written by generate() (CDP_Mat.inp, Compression_SS.txt, Tensile_SS.txt) and
+generate_batch() are stored under a hash of the parameters, the unit flag, the
+tolerance and FORMAT_VERSION. A hit copies (or hard links) the stored files into the
+output folder instead of computing them again. Entries are evicted least recently
+used first once the cache grows beyond its size limit.
+
+Stored files are read-only. A hard linked output shares the file of its entry, so an
+edit in place would change every later hit of that key; it fails instead, and files
+are replaced rather than written through when the cache places or generates them.
+
+Default location: $COMAT_CACHE, else ~/.cache/comat
+
+Cache statistics, pruning and clearing:
+    python COMat_Cache.py --stats
+    python COMat_Cache.py --max-size 200M --max-age 30
+    python COMat_Cache.py --clear
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+
+import numpy as np
+
+import COMat_Generator
+
+# Bump whenever the files written by generate() / generate_batch() change for the same input
+FORMAT_VERSION = 1
+
+DEFAULT_MAX_BYTES = 1 << 30
+MATERIAL_FILES = ("CDP_Mat.inp", "Compression_SS.txt", "Tensile_SS.txt")
+
+# Mode of the stored files
+READ_ONLY = 0o444
+
+def _remove(FilePathName):
+    try:
+        os.remove(FilePathName)
+    except PermissionError:
+        # Windows does not remove read-only files
+        os.chmod(FilePathName, 0o644)
+        os.remove(FilePathName)
+
+def _remove_entry(Entry):
+    for name in os.listdir(Entry) if os.path.isdir(Entry) else ():
+        try:
+            os.chmod(os.path.join(Entry, name), 0o644)
+        except OSError:
+            pass
+    shutil.rmtree(Entry, ignore_errors=True)
+
+def cache_dir():
+    return os.environ.get("COMAT_CACHE") or os.path.join(os.path.expanduser("~"), ".cache", "comat")
+
+def _normal(value):
+    # Parameters as exact float text, -0.0 and 0.0 share an entry
+    return repr(float(value) + 0.0)
+
+def cache_key(Kind, Values, is_meter, Tolerance, **Extra):
+    # SHA-256 of the normalized input of one generate() / generate_batch() call
+    Record = {"kind": Kind, "version": FORMAT_VERSION, "values": [_normal(value) for value in Values],
+              "is_meter": bool(is_meter), "tolerance": None if Tolerance is None else _normal(Tolerance)}
+    Record.update(Extra)
+    return hashlib.sha256(json.dumps(Record, sort_keys=True).encode()).hexdigest()
+
+def parse_size(text):
+    # "500M", "2G", "1048576"
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    text = text.strip().upper().rstrip("B")
+    try:
+        if text and text[-1] in units:
+            return int(float(text[:-1])*units[text[-1]])
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected a size like 500M or 2G: " + text)
+
+class MaterialCache:
+    def __init__(self, Root=None, MaxBytes=DEFAULT_MAX_BYTES, Link=False):
+        # Link: hard link the cached files into the output folder (falls back to a copy)
+        self.Root = Root or cache_dir()
+        self.MaxBytes = MaxBytes
+        self.Link = Link
+        self.Hits = 0
+        self.Misses = 0
+        self._size = None
+
+    def entry(self, Key):
+        return os.path.join(self.Root, Key[:2], Key)
+
+    def entries(self):
+        # [(last use, bytes, entry folder)], oldest first
+        Entries = []
+        if not os.path.isdir(self.Root):
+            return Entries
+        for prefix in os.listdir(self.Root):
+            Folder = os.path.join(self.Root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(Folder):
+                continue
+            for Key in os.listdir(Folder):
+                Entry = os.path.join(Folder, Key)
+                try:
+                    size = sum(os.path.getsize(os.path.join(Entry, name)) for name in os.listdir(Entry))
+                    Entries.append((os.stat(Entry).st_mtime, size, Entry))
+                except OSError:
+                    # Removed by another process meanwhile
+                    continue
+        Entries.sort()
+        return Entries
+
+    def size(self):
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self.entries())
+        return self._size
+
+    def get(self, Key, Path, FileNames):
+        # Place the cached files in Path, return False on a miss
+        Entry = self.entry(Key)
+        try:
+            for name in FileNames:
+                self._place(os.path.join(Entry, name), os.path.join(Path, name))
+            # Entry folder mtime is the last use for the LRU eviction
+            os.utime(Entry)
+        except FileNotFoundError:
+            self.Misses += 1
+            return False
+        self.Hits += 1
+        return True
+
+    def _place(self, Source, Target):
+        # Target is replaced, not written through: it may be a link to another entry
+        if os.path.lexists(Target):
+            _remove(Target)
+        # Entries of older versions, or one made writable by _remove() on Windows
+        os.chmod(Source, READ_ONLY)
+        if self.Link:
+            try:
+                os.link(Source, Target)
+                return
+            except OSError:
+                # Other file system or no hard link support
+                pass
+        shutil.copyfile(Source, Target)
+
+    def put(self, Key, Path, FileNames):
+        # Store the files of Path under Key, written in a temporary folder then renamed into place
+        Entry = self.entry(Key)
+        if os.path.isdir(Entry):
+            return
+        os.makedirs(os.path.dirname(Entry), exist_ok=True)
+        Staging = tempfile.mkdtemp(prefix=".tmp-", dir=self.Root)
+        try:
+            size = 0
+            for name in FileNames:
+                shutil.copyfile(os.path.join(Path, name), os.path.join(Staging, name))
+                size += os.path.getsize(os.path.join(Staging, name))
+            try:
+                os.rename(Staging, Entry)
+            except OSError:
+                # Stored by another process meanwhile
+                return
+            for name in FileNames:
+                os.chmod(os.path.join(Entry, name), READ_ONLY)
+            if self._size is not None:
+                self._size += size
+        finally:
+            shutil.rmtree(Staging, ignore_errors=True)
+        if self.size() > self.MaxBytes:
+            self.prune(self.MaxBytes)
+
+    def prune(self, MaxBytes=None, MaxAge=None):
+        # Remove entries unused for MaxAge seconds, then the least recently used ones
+        # until the cache fits in MaxBytes. Return (entries removed, bytes freed).
+        Entries = self.entries()
+        total = sum(size for _, size, _ in Entries)
+        removed = freed = 0
+        now = time.time()
+        for mtime, size, Entry in Entries:
+            too_old = MaxAge is not None and now - mtime > MaxAge
+            too_big = MaxBytes is not None and total - freed > MaxBytes
+            if not (too_old or too_big):
+                continue
+            _remove_entry(Entry)
+            try:
+                os.rmdir(os.path.dirname(Entry))
+            except OSError:
+                # Other entries share the prefix folder
+                pass
+            removed += 1
+            freed += size
+        self._size = total - freed
+        return removed, freed
+
+    def clear(self):
+        return self.prune(MaxBytes=0)
+
+    def generate(self, Path, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory,
+                 is_meter, Ref_Length, Tolerance=None):
+        # Same files as COMat_Generator.generate(), return its curves or None on a cache hit
+        Key = cache_key("material", (E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery,
+                                     Compression_Recovory, Ref_Length), is_meter, Tolerance)
+        if self.get(Key, Path, MATERIAL_FILES):
+            return None
+        # Files linked by an earlier hit are read-only and shared with their entry
+        for name in MATERIAL_FILES:
+            if os.path.lexists(os.path.join(Path, name)):
+                _remove(os.path.join(Path, name))
+        Curves = COMat_Generator.generate(Path, False, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery,
+                                          Compression_Recovory, is_meter, Ref_Length, Tolerance)
+        self.put(Key, Path, MATERIAL_FILES)
+        return Curves
+
+    def generate_batch(self, Path, Params, is_meter, Names=None, FileName="CDP_Lib.inp", Tolerance=None):
+        # Same library as COMat_Generator.generate_batch(), return (file, True on a cache hit)
+        Table = COMat_Generator.load_table(Params)
+        n = Table["E"].size
+        if Names is None:
+            Names = ["CDP_" + str(i+1) for i in range(n)]
+        Values = np.column_stack([Table[key] for key in COMat_Generator.BATCH_COLUMNS]).ravel()
+        Key = cache_key("library", Values, is_meter, Tolerance, names=[str(name) for name in Names])
+        # Stored as "library", FileName only names the copy in Path
+        with tempfile.TemporaryDirectory(dir=Path) as Staging:
+            if self.get(Key, Staging, ("library",)):
+                os.replace(os.path.join(Staging, "library"), os.path.join(Path, FileName))
+                return os.path.join(Path, FileName), True
+            COMat_Generator.generate_batch(Staging, Table, is_meter, Names, "library", Tolerance)
+            self.put(Key, Staging, ("library",))
+            os.replace(os.path.join(Staging, "library"), os.path.join(Path, FileName))
+        return os.path.join(Path, FileName), False
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show, prune or clear the COMat material cache")
+    parser.add_argument("--dir", default=None, help="Cache folder (default: $COMAT_CACHE or ~/.cache/comat)")
+    parser.add_argument("--max-size", type=parse_size, help="Evict least recently used entries down to this size, e.g. 500M")
+    parser.add_argument("--max-age", type=float, help="Remove entries unused for this many days")
+    parser.add_argument("--clear", action="store_true", help="Remove every entry")
+    parser.add_argument("--stats", action="store_true", help="Print the number of entries and their size")
+    args = parser.parse_args(argv)
+
+    Cache = MaterialCache(args.dir)
+    if args.clear:
+        removed, freed = Cache.clear()
+    elif args.max_size is not None or args.max_age is not None:
+        removed, freed = Cache.prune(args.max_size, None if args.max_age is None else args.max_age*86400.)
+    else:
+        args.stats = True
+        removed = None
+    if removed is not None:
+        print("Removed {} entries ({:.1f} MB)".format(removed, freed/1E6))
+    if args.stats:
+        Entries = Cache.entries()
+        print("{}: {} entries, {:.1f} MB".format(Cache.Root, len(Entries), sum(size for _, size, _ in Entries)/1E6))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,405 @@
+"""
+Source code for COMat_Deck: Put a CDP material into an existing Abaqus input deck
+
+Author: Youngbin LIM
+Contact: lyb0684@naver.com
+
+The deck is streamed line by line (constant memory), so decks with millions of
+node and element lines are fine. Line endings of the deck are kept.
+
+Replace the *Material, name=CDP block (or an *Include of a file defining it):
+    python COMat_Deck.py 3-Point-Bending.inp New.inp --material CDP_Mat.inp
+
+Reference the material file with *Include instead of copying it:
+    python COMat_Deck.py 3-Point-Bending.inp New.inp --material CDP_Mat.inp --include
+
+When the deck has no such material, it is inserted before the first *Step
+(or appended when the deck has no step).
+
+Keyword index: the byte offset of every keyword line is found on a memory map of
+the deck and cached next to it (<deck>.kwindex.json, rebuilt when the deck
+changes). With --index only the lines around the material are parsed:
+    python COMat_Deck.py 3-Point-Bending.inp New.inp --material CDP_Mat.inp --index
+    python COMat_Deck.py 3-Point-Bending.inp --list
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import mmap
+import shutil
+import argparse
+import tempfile
+
+# Keywords that may follow *Material as part of the same definition
+MATERIAL_OPTIONS = frozenset((
+    "density", "elastic", "plastic", "expansion", "damping", "depvar", "conductivity", "specific heat",
+    "concrete damaged plasticity", "concrete compression hardening", "concrete tension stiffening",
+    "concrete compression damage", "concrete tension damage", "concrete", "tension stiffening",
+    "shear retention", "failure ratios", "brittle cracking", "brittle shear", "brittle failure",
+    "damage initiation", "damage evolution", "damage stabilization", "rate dependent",
+    "user material", "user defined field", "user output variables", "inelastic heat fraction",
+    "hyperelastic", "hypoelastic", "viscoelastic", "porous elastic", "mullins effect", "hysteresis",
+    "drucker prager", "drucker prager hardening", "mohr coulomb", "mohr coulomb hardening",
+    "cap plasticity", "cap hardening", "crushable foam", "crushable foam hardening",
+    "eos", "shear failure", "tensile failure", "creep", "swelling", "permeability", "latent heat",
+    "regularization", "cyclic hardening", "potential", "anneal temperature", "heat generation",
+))
+
+def parse_keyword(line):
+    # "*Solid Section, elset=CONC, material=CDP" -> ("solid section", {"elset": "CONC", "material": "CDP"})
+    # Keyword and parameter names are lower-case with single spaces, values keep their case
+    fields = line.strip().lstrip("*").split(",")
+    keyword = " ".join(fields[0].split()).lower()
+    params = {}
+    for field in fields[1:]:
+        if field.strip() == "":
+            continue
+        key, _, value = field.partition("=")
+        params[" ".join(key.split()).lower()] = value.strip().strip('"')
+    return keyword, params
+
+def is_keyword(line):
+    # Keyword lines start with a single "*", "**" starts a comment
+    return line[:1] == b"*" and line[:2] != b"**"
+
+def is_banner(line):
+    # Comment lines framing a block written by generate(): "***...", "**E: ..."
+    return line[:3] == b"***" or line[:5] == b"**E: "
+
+def _keyword(line):
+    return parse_keyword(line.decode("latin-1"))
+
+def defines_material(FilePathName, Name):
+    # True when the file contains *Material, name=Name (streamed, names are case-insensitive)
+    with open(FilePathName, 'rb') as f:
+        for line in f:
+            if is_keyword(line):
+                keyword, params = _keyword(line)
+                if keyword == "material" and params.get("name", "").upper() == Name.upper():
+                    return True
+    return False
+
+def read_material_block(MatFile, Name, newline):
+    # Lines of a material file (e.g. CDP_Mat.inp written by generate()) with the deck newline.
+    # A file defining a single material is renamed to Name.
+    with open(MatFile, 'rb') as f:
+        Lines = [line.rstrip(b"\r\n") for line in f]
+    Materials = [i for i, line in enumerate(Lines) if is_keyword(line) and _keyword(line)[0] == "material"]
+    if len(Materials) == 0:
+        raise ValueError("No *Material definition in " + MatFile)
+    if len(Materials) == 1:
+        Lines[Materials[0]] = b"*Material, name=" + Name.encode("latin-1")
+    elif not any(_keyword(Lines[i])[1].get("name", "").upper() == Name.upper() for i in Materials):
+        raise ValueError("Material " + Name + " is not defined in " + MatFile)
+    return [line + newline for line in Lines]
+
+def _inject_lines(Lines, fout, Block, Name, DeckDir, Stats, done=False):
+    # Core of inject_material(): copy Lines to fout, replacing the material Name by Block.
+    # Return True once Block has been written, the caller appends it otherwise.
+    skipping = False
+    Comments = []
+    for line in Lines:
+        Stats["lines"] += 1
+        Stats["eol"] = line.endswith(b"\n")
+        # Runs of comment lines are held back until the next line shows where they belong
+        if line[:2] == b"**":
+            Comments.append(line)
+            continue
+
+        if skipping:
+            # Inside the old block: drop data lines and material options
+            if not is_keyword(line):
+                Comments = []
+                continue
+            keyword, params = _keyword(line)
+            if keyword in MATERIAL_OPTIONS:
+                Comments = []
+                continue
+            skipping = False
+            # Banner lines closing a block written by COMat go with the old block
+            while Comments and is_banner(Comments[0]):
+                Comments.pop(0)
+
+        if is_keyword(line):
+            keyword, params = _keyword(line)
+            replace = False
+            if keyword == "material" and params.get("name", "").upper() == Name.upper():
+                replace = skipping = True
+            elif keyword == "include" and "input" in params:
+                Included = os.path.join(DeckDir, params["input"])
+                replace = os.path.isfile(Included) and defines_material(Included, Name)
+            if replace:
+                # Banner lines opening a block written by COMat go with the old block
+                while Comments and is_banner(Comments[-1]):
+                    Comments.pop()
+                fout.writelines(Comments)
+                Comments = []
+                if not done:
+                    fout.writelines(Block)
+                done = True
+                Stats["replaced"] += 1
+                continue
+            if keyword == "step" and not done:
+                # Materials are model data and have to come before the first step,
+                # the comments announcing the step stay with it
+                fout.writelines(Block)
+                done = True
+                Stats["inserted"] = True
+        fout.writelines(Comments)
+        Comments = []
+        fout.write(line)
+
+    if skipping:
+        while Comments and is_banner(Comments[0]):
+            Comments.pop(0)
+    fout.writelines(Comments)
+    return done
+
+def _comment_run_start(mm, pos):
+    # Offset of the first line of the comment lines just before the line at pos
+    while pos > 0:
+        prev = mm.rfind(b"\n", 0, pos-1) + 1
+        if mm[prev:prev+2] != b"**":
+            break
+        pos = prev
+    return pos
+
+def _copy_range(mm, fout, start, end, chunk=1<<24):
+    for pos in range(start, end, chunk):
+        fout.write(mm[pos:min(pos+chunk, end)])
+
+def _inject_indexed(Deck, fout, Block, Name, DeckDir, Stats, Splices=()):
+    # Same result as the streaming pass, but only the lines around the keywords found
+    # in the index are parsed, everything in between is copied as raw bytes.
+    # Splices: (start, end, bytes) replacing other byte ranges of the deck.
+    Index = load_index(Deck)
+    Targets = []
+    for i, (keyword, params) in enumerate(Index.Keywords):
+        if keyword == "material" and params.get("name", "").upper() == Name.upper():
+            Targets.append((Index.Offsets[i], Index.block_end(i), None))
+        elif keyword == "include" and "input" in params:
+            Included = os.path.join(DeckDir, params["input"])
+            if os.path.isfile(Included) and defines_material(Included, Name):
+                Targets.append((Index.Offsets[i], Index.end(i), None))
+    if not Targets:
+        Steps = Index.find("step")
+        if Steps:
+            Targets.append((Index.Offsets[Steps[0]], Index.end(Steps[0]), None))
+
+    with open(Deck, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        Targets = [(_comment_run_start(mm, start), end, None) for start, end, _ in Targets]
+        done = False
+        pos = 0
+        for start, end, Replacement in sorted(Targets + list(Splices), key=lambda Target: Target[0]):
+            if start < pos:
+                raise ValueError("Overlapping replacements in " + Deck)
+            _copy_range(mm, fout, pos, start)
+            if Replacement is None:
+                done = _inject_lines(io.BytesIO(mm[start:end]), fout, Block, Name, DeckDir, Stats, done)
+            else:
+                fout.write(Replacement)
+            pos = end
+        _copy_range(mm, fout, pos, Index.Size)
+        Stats["eol"] = mm[Index.Size-1:Index.Size] == b"\n"
+    return done
+
+def deck_newline(Deck):
+    # Line ending of the deck, b"\r\n" or b"\n"
+    with open(Deck, 'rb') as f:
+        first = f.readline()
+    return b"\r\n" if first.endswith(b"\r\n") else b"\n"
+
+def replace_material(Deck, Output, Block, Name="CDP", Indexed=False, Splices=()):
+    # Core of inject_material(): write Deck to Output with the definition of material Name
+    # (or the *Include of a file defining it) replaced by the lines of Block.
+    # Splices (start, end, bytes) replace further byte ranges and need the index.
+    # Output may be the same file as Deck, it is written to a temporary file first.
+    if os.path.getsize(Deck) == 0:
+        Indexed = False
+    if Splices and not Indexed:
+        raise ValueError("Byte range replacements need the keyword index (Indexed=True)")
+
+    DeckDir = os.path.dirname(os.path.abspath(Deck))
+    OutDir = os.path.dirname(os.path.abspath(Output))
+    Stats = {"lines": 0, "replaced": 0, "inserted": False, "eol": True}
+
+    fd, TempName = tempfile.mkstemp(suffix=".inp", dir=OutDir)
+    try:
+        with os.fdopen(fd, 'wb', buffering=1<<20) as fout:
+            if Indexed:
+                done = _inject_indexed(Deck, fout, Block, Name, DeckDir, Stats, Splices)
+            else:
+                with open(Deck, 'rb', buffering=1<<20) as fin:
+                    done = _inject_lines(fin, fout, Block, Name, DeckDir, Stats)
+            if not done:
+                # No material and no step: append at the end of the deck
+                if not Stats["eol"]:
+                    fout.write(deck_newline(Deck))
+                fout.writelines(Block)
+                Stats["inserted"] = True
+        # mkstemp() files are 0600, the output keeps the permissions of the deck
+        shutil.copymode(Deck, TempName)
+        os.replace(TempName, Output)
+    except BaseException:
+        os.remove(TempName)
+        raise
+    del Stats["eol"]
+    return Stats
+
+def inject_material(Deck, Output, MatFile, Name="CDP", Include=False, Indexed=False):
+    # Stream Deck into Output with the material Name taken from MatFile.
+    # Include=True writes "*Include, input=MatFile" (relative to Output) instead of the block.
+    # Indexed=True uses the keyword index of the deck (see load_index()) instead of parsing every line.
+    newline = deck_newline(Deck)
+    if Include:
+        if not defines_material(MatFile, Name):
+            raise ValueError("Material " + Name + " is not defined in " + MatFile)
+        Block = [include_line(MatFile, Output, newline)]
+    else:
+        Block = read_material_block(MatFile, Name, newline)
+    return replace_material(Deck, Output, Block, Name, Indexed)
+
+def include_line(FilePathName, Output, newline):
+    # *Include of FilePathName, relative to the folder of the deck Output
+    Target = os.path.relpath(os.path.abspath(FilePathName), os.path.dirname(os.path.abspath(Output)))
+    return b"*Include, input=" + Target.replace(os.sep, "/").encode("latin-1") + newline
+
+############################
+## Keyword index of a deck ##
+############################
+
+# Lines starting with a single "*"
+KEYWORD_LINE = re.compile(rb"^\*[^*\r\n][^\r\n]*", re.M)
+
+# The index is cached next to the deck as <deck>.kwindex.json
+INDEX_SUFFIX = ".kwindex.json"
+INDEX_VERSION = 1
+
+class DeckIndex:
+    # Byte offsets and text of every keyword line of a deck
+    def __init__(self, Deck, Size, Offsets, Lines):
+        self.Deck = Deck
+        self.Size = Size
+        self.Offsets = Offsets
+        self.Lines = Lines
+        self.Keywords = [parse_keyword(line) for line in Lines]
+
+    def __len__(self):
+        return len(self.Offsets)
+
+    def end(self, i):
+        # Offset where the data lines of keyword i stop
+        return self.Offsets[i+1] if i+1 < len(self.Offsets) else self.Size
+
+    def block_end(self, i):
+        # Offset where the *Material definition starting at keyword i stops
+        j = i+1
+        while j < len(self.Offsets) and self.Keywords[j][0] in MATERIAL_OPTIONS:
+            j += 1
+        return self.Offsets[j] if j < len(self.Offsets) else self.Size
+
+    def find(self, keyword, **params):
+        # Positions of keyword lines, e.g. find("element", type="C3D8R"), values are case-insensitive
+        return [i for i, (key, values) in enumerate(self.Keywords)
+                if key == keyword and all(values.get(name, "").upper() == str(value).upper() for name, value in params.items())]
+
+    def materials(self):
+        # {material name: position of its *Material line}
+        return {self.Keywords[i][1].get("name", ""): i for i in self.find("material")}
+
+    def section_materials(self):
+        # [(section keyword, elset, material)] for every section referencing a material
+        return [(keyword, params.get("elset"), params["material"]) for keyword, params in self.Keywords
+                if keyword.endswith("section") and "material" in params]
+
+    def includes(self):
+        return [params["input"] for keyword, params in self.Keywords if keyword == "include" and "input" in params]
+
+    def read(self, i):
+        # Keyword line and data lines of keyword i as bytes
+        with open(self.Deck, 'rb') as f:
+            f.seek(self.Offsets[i])
+            return f.read(self.end(i) - self.Offsets[i])
+
+def build_index(Deck):
+    # Scan the memory-mapped deck for keyword lines
+    Size = os.path.getsize(Deck)
+    Offsets, Lines = [], []
+    if Size > 0:
+        with open(Deck, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for match in KEYWORD_LINE.finditer(mm):
+                Offsets.append(match.start())
+                Lines.append(match.group().decode("latin-1"))
+    return DeckIndex(Deck, Size, Offsets, Lines)
+
+def load_index(Deck, Cache=True):
+    # Index of the deck, taken from the cache file when size and modification time still match
+    stat = os.stat(Deck)
+    CacheFile = Deck + INDEX_SUFFIX
+    if Cache:
+        try:
+            with open(CacheFile) as f:
+                Data = json.load(f)
+            if Data["version"] == INDEX_VERSION and Data["size"] == stat.st_size and Data["mtime_ns"] == stat.st_mtime_ns:
+                return DeckIndex(Deck, Data["size"], Data["offsets"], Data["lines"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+    Index = build_index(Deck)
+    if Cache:
+        # A read-only folder only means that the index is not cached
+        try:
+            fd, TempName = tempfile.mkstemp(suffix=".json", dir=os.path.dirname(os.path.abspath(Deck)))
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"version": INDEX_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                           "offsets": Index.Offsets, "lines": Index.Lines}, f)
+            shutil.copymode(Deck, TempName)
+            os.replace(TempName, CacheFile)
+        except OSError:
+            pass
+    return Index
+
+def print_index(Index):
+    Materials = Index.materials()
+    print("Keywords: {}, size: {} bytes".format(len(Index), Index.Size))
+    print("Materials defined: " + (", ".join(Materials) if Materials else "none"))
+    for Include in Index.includes():
+        print("Include: " + Include)
+    for keyword, elset, material in Index.section_materials():
+        state = "" if material.upper() in (name.upper() for name in Materials) else " (not defined in this file)"
+        print("{}: elset={}, material={}{}".format(keyword.title(), elset, material, state))
+    for i, (keyword, params) in enumerate(Index.Keywords):
+        if keyword in ("part", "node", "element"):
+            print("{:>12}  {}".format(Index.Offsets[i], Index.Lines[i]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replace or insert a CDP material in an Abaqus input deck")
+    parser.add_argument("deck", help="Abaqus input deck")
+    parser.add_argument("output", nargs="?", help="New deck (may be the same file)")
+    parser.add_argument("--material", default="CDP_Mat.inp", help="Material file written by COMat (default: CDP_Mat.inp)")
+    parser.add_argument("--name", default="CDP", help="Material name in the deck (default: CDP)")
+    parser.add_argument("--include", action="store_true", help="Write an *Include of the material file instead of its content")
+    parser.add_argument("--index", action="store_true",
+                        help="Use the keyword index cached next to the deck (built on first use) instead of parsing every line")
+    parser.add_argument("--list", action="store_true", help="Print materials, sections and part/node/element offsets of the deck")
+    args = parser.parse_args(argv)
+    if args.output is None and not args.list:
+        parser.error("output is required unless --list is given")
+
+    try:
+        if args.list:
+            print_index(load_index(args.deck))
+        if args.output is not None:
+            Stats = inject_material(args.deck, args.output, args.material, args.name, args.include, args.index)
+            action = "inserted" if Stats["inserted"] else "replaced"
+            print("Material {} {} in {} ({} lines parsed)".format(args.name, action, args.output, Stats["lines"]))
+    except (ValueError, OSError) as e:
+        print("Error: " + str(e), file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
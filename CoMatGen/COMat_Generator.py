@@ -6,198 +6,400 @@ Contact: lyb0684@naver.com
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+from functools import lru_cache, cached_property
 
-def plot(Path, Plot_Graph, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, is_meter, Ref_Length):
-    E = E * 1000.
-    
+# Number of parameter sets kept by compute_curves()
+CURVE_CACHE_SIZE = 128
+
+#####################################
+## Curve computation (no file I/O) ##
+#####################################
+
+def batch_validity(E, S_cu, e_cu, S_tu, e_end):
+    # Same checks as generate(), evaluated row-wise. E is in MPa.
+    valid_cu = (e_cu > S_cu/E) & (e_cu < 2*S_cu/E)
+    valid_end = e_end > S_tu/E
+    return valid_cu, valid_end
+
+def check_parameters(E, S_cu, e_cu, S_tu, e_end):
+    # E is in MPa
     # Parabolic hardening part
     if e_cu <= S_cu/E or e_cu >= 2*S_cu/E:
         message = "Ultimate crushing strain should be in the range " + "[" + str(S_cu/E) + "~" + str(2*S_cu/E) + "]"
         raise ValueError(message)
     if e_end <= S_tu/E:
-        message = "End strain should be larger than " + "[" + str(S_tu/E) 
+        message = "End strain should be larger than " + "[" + str(S_tu/E)
         raise ValueError(message)
-    
-    ##########################################
-    ## Compression part SS curve generation ##
-    ##########################################
 
-    ## Parabolic hardening
-    # Slope constraint at the begining of parabolic hardening
+def parabola_stress(e, E, S_cu, e_cu):
+    # Parabolic hardening, with the slope constraint at the begining of the parabola
     S_c0 = 2*S_cu - E*e_cu
     e_0 = S_c0/E
+    return -((S_cu-S_c0)/(e_cu-e_0)**2)*(e-e_0)*(e-e_0-2*(e_cu-e_0)) + S_c0
 
-    # Generate strain array
-    # Linear Elastic part
-    e_c_lin = np.linspace(0.0, e_0, num=20, endpoint=False)
-    # Parabolic Hardening part
-    e_para = np.linspace(e_0, e_cu, num=20, endpoint=False)
-    # Gerenate Stress array for Linear elastic part
-    S_c_lin = E*e_c_lin
-    # Gerenate Stress array for parabolic hardening part
-    S_c_para = -((S_cu-S_c0)/(e_cu-e_0)**2)*(e_para-e_0)*(e_para-e_0-2*(e_cu-e_0)) + S_c0
+def weibull_stress(e, S_cu, e_cu, e_60, Alpha):
+    # Weibull softening
+    return S_cu*(0.99*np.exp(-np.power((e-e_cu)/e_60, Alpha)) + 0.01)
 
-    ## Weibull softening part
-    # Calculate end strain
-    e_wb_end = e_cu + e_60*np.power(-np.log(0.001/0.99), 1/Alpha)
+def power_stress(e, S_tu, e_t0, e_end, Beta):
+    # Power law tension stiffening
+    return S_tu*(np.power(np.abs((e_end-e)/(e_end-e_t0)), Beta))
 
-    # Generate strain array
-    e_wb = np.linspace(e_cu, e_wb_end, 50, endpoint=True)
-    # Gerenate Stress array
-    S_c_wb = S_cu*(0.99*np.exp(-np.power((e_wb-e_cu)/e_60, Alpha)) + 0.01)
+def batch_curves(E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length):
+    # Vectorized curve math shared by plot(), generate() and generate_batch().
+    # Inputs are 1-D arrays of length n (E in MPa), outputs are (n, num) arrays.
+    E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length = [
+        np.asarray(x, dtype=float)[:, None] for x in (E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length)]
 
-    # Combine to 1 array
-    e_c_total = np.concatenate((e_c_lin, e_para, e_wb), axis=None)
-    S_c_total = np.concatenate((S_c_lin, S_c_para, S_c_wb), axis=None)
-    # For txt file out
-    Compression_SS_plot=np.stack((e_c_total, S_c_total), axis=1)
+    ## Compression strains
+    S_c0 = 2*S_cu - E*e_cu
+    e_0 = S_c0/E
+    # Linear Elastic part
+    e_c_lin = np.linspace(0.0, e_0[:, 0], num=20, endpoint=False, axis=1)
+    # Parabolic Hardening part
+    e_para = np.linspace(e_0[:, 0], e_cu[:, 0], num=20, endpoint=False, axis=1)
+    # Weibull softening part
+    e_wb_end = e_cu + e_60*np.power(-np.log(0.001/0.99), 1/Alpha)
+    e_wb = np.linspace(e_cu[:, 0], e_wb_end[:, 0], 50, endpoint=True, axis=1)
 
-    ######################################
-    ## Tensile part SS curve generation ##
-    ######################################
+    ## Tension strains
     e_t0 = S_tu/E
-
     # Linear Elastic part
-    e_t_lin = np.linspace(0.0, e_t0, num=20, endpoint=False)
-    # Gerenate Stress array for Linear elastic part
-    S_t_lin = E*e_t_lin
+    e_t_lin = np.linspace(0.0, e_t0[:, 0], num=20, endpoint=False, axis=1)
     # Power Law Tension stiffning strain
-    e_t_power = np.linspace(e_t0, e_end, num=50, endpoint=True)
-    # Generate stress array
-    S_t_power = S_tu*(np.power(np.abs((e_end-e_t_power)/(e_end-e_t0)), Beta))
-    # Combine to 1 array
-    e_t_total = np.concatenate((e_t_lin, e_t_power), axis=None)
-    S_t_total = np.concatenate((S_t_lin, S_t_power), axis=None)
-    # For txt file out
-    Tensile_SS_plot=np.stack((e_t_total, S_t_total), axis=1)
+    e_t_power = np.linspace(e_t0[:, 0], e_end[:, 0], num=50, endpoint=True, axis=1)
 
-    if Plot_Graph==True:
-        fig, axs = plt.subplots(nrows=1, ncols=2, figsize=(12, 4))
-        
-        axs[0].plot(e_c_total, S_c_total, label='Compression', marker='o', markersize=6, linestyle='-', color='C0')
-        axs[0].set_xlabel('Strain')
-        axs[0].set_ylabel('Stress (MPa)')
-        axs[0].ticklabel_format(axis='x', style='sci', scilimits=(0,0), useMathText=True)
-        axs[0].grid(True)
-        axs[0].legend()
-        
-        axs[1].plot(e_t_total, S_t_total, label='Tension', marker='o', markersize=6, linestyle='-', color='C3')
-        axs[1].set_xlabel('Strain')
-        axs[1].set_ylabel('Stress (MPa)')
-        axs[1].ticklabel_format(axis='x', style='sci', scilimits=(0,0), useMathText=True)
-        axs[1].grid(True)
-        axs[1].legend()
-        
-        plt.tight_layout()
-        plt.show()
+    return _curves_on_strains(E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length,
+                              e_c_lin, e_para, e_wb, e_t_lin, e_t_power)
 
-def generate(Path, Plot_Graph, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, is_meter, Ref_Length):
-    E = E * 1000.
-    
-    # Parabolic hardening part
-    if e_cu <= S_cu/E or e_cu >= 2*S_cu/E:
-        message = "Ultimate crushing strain should be in the range " + "[" + str(S_cu/E) + "~" + str(2*S_cu/E) + "]"
-        raise ValueError(message)
-    if e_end <= S_tu/E:
-        message = "End strain should be larger than " + "[" + str(S_tu/E) 
-        raise ValueError(message)
+def _curves_on_strains(E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length, e_c_lin, e_para, e_wb, e_t_lin, e_t_power):
+    # Stresses, Abaqus tables and plot curves on given strain points. Parameters are (n, 1) arrays.
 
     ##########################################
     ## Compression part SS curve generation ##
     ##########################################
-
-    ## Parabolic hardening
-    # Slope constraint at the begining of parabolic hardening
-    S_c0 = 2*S_cu - E*e_cu
-    e_0 = S_c0/E
-
-    # Generate strain array
-    # Linear Elastic part
-    e_c_lin = np.linspace(0.0, e_0, num=20, endpoint=False)
-    # Parabolic Hardening part
-    e_para = np.linspace(e_0, e_cu, num=20, endpoint=False)
-    # Gerenate Stress array for Linear elastic part
     S_c_lin = E*e_c_lin
-    # Gerenate Stress array for parabolic hardening part
-    S_c_para = -((S_cu-S_c0)/(e_cu-e_0)**2)*(e_para-e_0)*(e_para-e_0-2*(e_cu-e_0)) + S_c0
-
-    ## Weibull softening part
-    # Calculate end strain
-    e_wb_end = e_cu + e_60*np.power(-np.log(0.001/0.99), 1/Alpha)
+    S_c_para = parabola_stress(e_para, E, S_cu, e_cu)
+    S_c_wb = weibull_stress(e_wb, S_cu, e_cu, e_60, Alpha)
 
-    # Generate strain array
-    e_wb = np.linspace(e_cu, e_wb_end, 50, endpoint=True)
-    # Gerenate Stress array
-    S_c_wb = S_cu*(0.99*np.exp(-np.power((e_wb-e_cu)/e_60, Alpha)) + 0.01)
+    ### Processing for Abaqus input file ###
+    e_c_pla = np.concatenate((e_para, e_wb), axis=1)
+    S_c_pla = np.concatenate((S_c_para, S_c_wb), axis=1)
+    # Calculate inelastic strain
+    e_c_inelastic = e_c_pla - S_c_pla/E
 
-    # Combine to 1 array
-    e_c_total = np.concatenate((e_c_lin, e_para, e_wb), axis=None)
-    S_c_total = np.concatenate((S_c_lin, S_c_para, S_c_wb), axis=None)
-    # For txt file out
-    Compression_SS_plot=np.stack((e_c_total, S_c_total), axis=1)
+    # Damage is zero up to the last strain point not exceeding e_cu
+    e_cu_index = np.sum(e_c_pla <= e_cu, axis=1) - 1
+    dc = 1.0 - S_c_pla/S_cu
+    dc[np.arange(dc.shape[1])[None, :] < e_cu_index[:, None]] = 0
 
     ######################################
     ## Tensile part SS curve generation ##
     ######################################
     e_t0 = S_tu/E
-
-    # Linear Elastic part
-    e_t_lin = np.linspace(0.0, e_t0, num=20, endpoint=False)
-    # Gerenate Stress array for Linear elastic part
     S_t_lin = E*e_t_lin
-    # Power Law Tension stiffning strain
-    e_t_power = np.linspace(e_t0, e_end, num=50, endpoint=True)
-    # Generate stress array
-    S_t_power = S_tu*(np.power(np.abs((e_end-e_t_power)/(e_end-e_t0)), Beta))
-    # Combine to 1 array
-    e_t_total = np.concatenate((e_t_lin, e_t_power), axis=None)
-    S_t_total = np.concatenate((S_t_lin, S_t_power), axis=None)
-    # For txt file out
-    Tensile_SS_plot=np.stack((e_t_total, S_t_total), axis=1)
-
-    ######################################
-    ## Processing for Abaqus input file ##
-    ######################################
+    S_t_power = power_stress(e_t_power, S_tu, e_t0, e_end, Beta)
 
-    ### Compression part ###
-    e_c_pla = np.concatenate((e_para, e_wb), axis=None)
-    S_c_pla = np.concatenate((S_c_para, S_c_wb), axis=None)
-    # Calculate inelastic strain
-    e_c_inelastic = e_c_pla - S_c_pla/E
-
-    # Calculate damage parameter
-    # Get index for e_cu
-    indices = np.where(e_c_pla <= e_cu)
-    e_cu_index = indices[0][-1] if indices[0].size > 0 else None
-
-    # Calculate damage parameter for compression part
-    dc = 1.0 - S_c_pla/S_cu
-    dc[:e_cu_index] = 0
+    ### Processing for Abaqus input file ###
+    # Rows keep their full width, the mask marks the points written to Abaqus
+    mask = S_t_power > 0.01 * S_tu
+    e_t_cracking = e_t_power - S_t_power/E
+    u_t_cracking = e_t_cracking*Ref_Length
+    dt = 1.0 - S_t_power/S_tu
+
+    return {
+        "e_c_lin": e_c_lin, "S_c_lin": S_c_lin, "e_para": e_para, "S_c_para": S_c_para,
+        "e_wb": e_wb, "S_c_wb": S_c_wb,
+        "e_t_lin": e_t_lin, "S_t_lin": S_t_lin, "e_t_power": e_t_power, "S_t_power": S_t_power,
+        "e_c_total": np.concatenate((e_c_lin, e_para, e_wb), axis=1),
+        "S_c_total": np.concatenate((S_c_lin, S_c_para, S_c_wb), axis=1),
+        "e_t_total": np.concatenate((e_t_lin, e_t_power), axis=1),
+        "S_t_total": np.concatenate((S_t_lin, S_t_power), axis=1),
+        "S_c_pla": S_c_pla, "e_c_inelastic": e_c_inelastic, "dc": dc,
+        "S_t_pla": S_t_power, "u_t_cracking": u_t_cracking, "dt": dt, "mask": mask,
+    }
+
+###########################################
+## Adaptive discretization of the curves ##
+###########################################
+
+# Number of candidate points per branch for adaptive_curves()
+ADAPTIVE_GRID = 2001
+
+def _chord_error(x, y, i, j):
+    # Max distance between y[i:j+1] and the chord from point i to point j
+    if j - i < 2:
+        return 0.0
+    x_in, y_in = x[i+1:j], y[i+1:j]
+    return np.max(np.abs(y_in - (y[i] + (y[j]-y[i])*(x_in-x[i])/(x[j]-x[i]))))
+
+def adaptive_knots(x, y, Tolerance):
+    # Indices of few points of (x, y), first and last included, whose linear interpolation
+    # stays within Tolerance of y. Each segment is extended as far as the chord error allows.
+    last = x.size - 1
+    knots = [0]
+    i = 0
+    while i < last:
+        if _chord_error(x, y, i, last) <= Tolerance:
+            lo = last
+        else:
+            # lo meets the tolerance, hi does not
+            lo, hi = i+1, last
+            while hi - lo > 1:
+                mid = (lo + hi)//2
+                if _chord_error(x, y, i, mid) <= Tolerance:
+                    lo = mid
+                else:
+                    hi = mid
+        knots.append(lo)
+        i = lo
+    return np.array(knots)
+
+def interpolation_error(Stress, e, sub=16):
+    # Max stress error of the linear interpolation between the strain points e,
+    # checked at sub points inside every segment. Stress is the exact branch function.
+    t = np.linspace(0.0, 1.0, sub+1)[1:-1]
+    S = Stress(e)
+    e_in = e[:-1, None] + (e[1:]-e[:-1])[:, None]*t
+    S_in = S[:-1, None] + (S[1:]-S[:-1])[:, None]*t
+    return float(np.max(np.abs(Stress(e_in) - S_in))) if e.size > 1 else 0.0
+
+def curve_errors(Curves):
+    # Achieved max stress error (MPa) of the compression and tension tables of a CDPCurves
+    E, S_cu, e_cu = Curves.E, Curves.S_cu, Curves.e_cu
+    e_t0 = Curves.S_tu/E
+    Error_Comp = max(interpolation_error(lambda e: parabola_stress(e, E, S_cu, e_cu), np.append(Curves.e_para, e_cu)),
+                     interpolation_error(lambda e: weibull_stress(e, S_cu, e_cu, Curves.e_60, Curves.Alpha), Curves.e_wb))
+    # Only the tension points written to Abaqus count
+    e_t = Curves.e_t_power[Curves.S_t_power > 0.01 * Curves.S_tu]
+    Error_Tens = interpolation_error(lambda e: power_stress(e, Curves.S_tu, e_t0, Curves.e_end, Curves.Beta), e_t)
+    return Error_Comp, Error_Tens
+
+def adaptive_branch(Stress, e_start, e_stop, Tolerance, Grid=ADAPTIVE_GRID):
+    # Strain points from e_start to e_stop for the branch function Stress. Knots are picked on a
+    # grid, so the target is tightened until the error checked between the knots meets Tolerance,
+    # and the grid is refined when even that fails (steep branches, e.g. Alpha < 1).
+    for _ in range(3):
+        e = np.linspace(e_start, e_stop, Grid)
+        S = Stress(e)
+        Target = Tolerance
+        for _ in range(20):
+            e_knots = e[adaptive_knots(e, S, Target)]
+            if interpolation_error(Stress, e_knots) <= Tolerance:
+                return e_knots
+            Target = 0.8*Target
+        Grid = 4*Grid
+    # Best effort, the tolerance is missed (see CDPCurves.Tolerance_Met)
+    return e_knots
+
+def adaptive_curves(E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length, Tolerance, Grid=ADAPTIVE_GRID):
+    # batch_curves() for one material (E in MPa) with the points of the parabolic, Weibull and
+    # power law branches placed so that the stress error stays below Tolerance (MPa).
+    # Linear elastic parts are exact with their first point only.
+    S_c0 = 2*S_cu - E*e_cu
+    e_0 = S_c0/E
+    e_wb_end = e_cu + e_60*np.power(-np.log(0.001/0.99), 1/Alpha)
+    e_t0 = S_tu/E
 
-    # Prepare array for Abaqus input
-    Compression_SS = np.stack((S_c_pla, e_c_inelastic), axis=1)
-    Compression_D = np.stack((dc, e_c_inelastic), axis=1)
+    # e_cu itself starts the Weibull branch
+    e_para = adaptive_branch(lambda e: parabola_stress(e, E, S_cu, e_cu), e_0, e_cu, Tolerance, Grid)[:-1]
+    e_wb = adaptive_branch(lambda e: weibull_stress(e, S_cu, e_cu, e_60, Alpha), e_cu, e_wb_end, Tolerance, Grid)
+    # Tension points below 1% of S_tu are not written to Abaqus, so the table ends at the last
+    # grid point above it (as with the fixed grid) and e_end only closes the plotted curve
+    e = np.linspace(e_t0, e_end, Grid)
+    e_stop = e[np.flatnonzero(power_stress(e, S_tu, e_t0, e_end, Beta) > 0.01 * S_tu)[-1]]
+    e_t_power = np.append(adaptive_branch(lambda e: power_stress(e, S_tu, e_t0, e_end, Beta), e_t0, e_stop, Tolerance, Grid), e_end)
+
+    Params = [np.array([[x]], dtype=float) for x in (E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length)]
+    Strains = [np.atleast_2d(x) for x in (0.0, e_para, e_wb, 0.0, e_t_power)]
+    return _curves_on_strains(*Params, *Strains)
+
+class CDPCurves:
+    # Compression and tension curves of one parameter set. E is given in GPa
+    # like plot() and generate(), self.E is in MPa. Arrays are read-only
+    # because instances are shared through compute_curves(). With a Tolerance (MPa)
+    # the branches are discretized by adaptive_curves() instead of fixed grids.
+    def __init__(self, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length, Tolerance=None):
+        E = E * 1000.
+        check_parameters(E, S_cu, e_cu, S_tu, e_end)
+
+        self.E, self.S_cu, self.e_cu, self.e_60, self.Alpha = E, S_cu, e_cu, e_60, Alpha
+        self.S_tu, self.e_end, self.Beta, self.Ref_Length = S_tu, e_end, Beta, Ref_Length
+
+        self.Tolerance = Tolerance
+        if Tolerance is None:
+            Curves = batch_curves([E], [S_cu], [e_cu], [e_60], [Alpha], [S_tu], [e_end], [Beta], [Ref_Length])
+        else:
+            Curves = adaptive_curves(E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length, Tolerance)
+        mask = Curves["mask"][0]
+
+        # Linear elastic and parabolic hardening
+        self.e_c_lin, self.S_c_lin = Curves["e_c_lin"][0], Curves["S_c_lin"][0]
+        self.e_para, self.S_c_para = Curves["e_para"][0], Curves["S_c_para"][0]
+        # Weibull softening
+        self.e_wb, self.S_c_wb = Curves["e_wb"][0], Curves["S_c_wb"][0]
+        # Tension stiffening
+        self.e_t_lin, self.S_t_lin = Curves["e_t_lin"][0], Curves["S_t_lin"][0]
+        self.e_t_power, self.S_t_power = Curves["e_t_power"][0], Curves["S_t_power"][0]
+
+        # Whole curves for plotting and txt file out
+        self.e_c_total, self.S_c_total = Curves["e_c_total"][0], Curves["S_c_total"][0]
+        self.e_t_total, self.S_t_total = Curves["e_t_total"][0], Curves["S_t_total"][0]
+        self.Compression_SS_plot = np.stack((self.e_c_total, self.S_c_total), axis=1)
+        self.Tensile_SS_plot = np.stack((self.e_t_total, self.S_t_total), axis=1)
+
+        # Tables for Abaqus input
+        self.S_c_pla, self.e_c_inelastic, self.dc = Curves["S_c_pla"][0], Curves["e_c_inelastic"][0], Curves["dc"][0]
+        self.S_t_pla, self.u_t_cracking, self.dt = Curves["S_t_pla"][0][mask], Curves["u_t_cracking"][0][mask], Curves["dt"][0][mask]
+        self.Compression_SS = np.stack((self.S_c_pla, self.e_c_inelastic), axis=1)
+        self.Compression_D = np.stack((self.dc, self.e_c_inelastic), axis=1)
+        self.Tensile_SS = np.stack((self.S_t_pla, self.u_t_cracking), axis=1)
+        self.Tensile_D = np.stack((self.dt, self.u_t_cracking), axis=1)
+
+        # Table size, the achieved max stress error is computed on first use
+        self.Rows_Comp, self.Rows_Tens = len(self.S_c_pla), len(self.S_t_pla)
+
+        for value in vars(self).values():
+            if isinstance(value, np.ndarray):
+                value.setflags(write=False)
+
+    @cached_property
+    def Errors(self):
+        return curve_errors(self)
+
+    @property
+    def Error_Comp(self):
+        return self.Errors[0]
+
+    @property
+    def Error_Tens(self):
+        return self.Errors[1]
+
+    @property
+    def Tolerance_Met(self):
+        # False when even the finest grid of adaptive_branch() misses the Tolerance
+        return self.Tolerance is None or max(self.Errors) <= self.Tolerance
+
+@lru_cache(maxsize=CURVE_CACHE_SIZE)
+def compute_curves(E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length, Tolerance=None):
+    # Memoized CDPCurves, keyed on the parameter tuple (least recently used entries are evicted)
+    return CDPCurves(E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length, Tolerance)
+
+def draw_curves(axs, Curves):
+    # Draw compression and tension curves on two axes, shared by plot() and the GUI canvas
+    line_c, = axs[0].plot(Curves.e_c_total, Curves.S_c_total, label='Compression', marker='o', markersize=6, linestyle='-', color='C0')
+    axs[0].set_xlabel('Strain')
+    axs[0].set_ylabel('Stress (MPa)')
+    axs[0].ticklabel_format(axis='x', style='sci', scilimits=(0,0), useMathText=True)
+    axs[0].grid(True)
+    axs[0].legend()
+
+    line_t, = axs[1].plot(Curves.e_t_total, Curves.S_t_total, label='Tension', marker='o', markersize=6, linestyle='-', color='C3')
+    axs[1].set_xlabel('Strain')
+    axs[1].set_ylabel('Stress (MPa)')
+    axs[1].ticklabel_format(axis='x', style='sci', scilimits=(0,0), useMathText=True)
+    axs[1].grid(True)
+    axs[1].legend()
+    return line_c, line_t
 
-    ### Tensile part ###
-    e_t_pla = e_t_power
-    S_t_pla = S_t_power
-    # Create a boolean mask based on the condition
-    mask = S_t_power > 0.01 * S_tu
+def plot(Path, Plot_Graph, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, is_meter, Ref_Length):
+    Curves = compute_curves(E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length)
 
-    # Filter e_t_power and S_t_power using the mask
-    e_t_pla = e_t_power[mask]
-    S_t_pla = S_t_power[mask]
-    
-    e_t_cracking = e_t_pla - S_t_pla/E
-    u_t_cracking = e_t_cracking*Ref_Length
-    # Calculate damage parameter
-    dt = 1.0 - S_t_pla/S_tu
+    if Plot_Graph==True:
+        # Imported here so that generate() and the command line tool never load matplotlib
+        import matplotlib.pyplot as plt
+        fig, axs = plt.subplots(nrows=1, ncols=2, figsize=(12, 4))
+        draw_curves(axs, Curves)
+        plt.tight_layout()
+        plt.show()
 
-    # Prepare array for Abaqus input
-    Tensile_SS = np.stack((S_t_pla, u_t_cracking), axis=1)
-    Tensile_D = np.stack((dt, u_t_cracking), axis=1)
+    return Curves
+
+##############################################
+## Buffered writer for Abaqus keyword files ##
+##############################################
+
+def format_table(Array, fmt='%.6e', delimiter=","):
+    # Format a 2-D array exactly like np.savetxt(fmt=fmt, delimiter=delimiter) in one shot
+    Array = np.asarray(Array, dtype=float)
+    if Array.ndim == 1:
+        Array = Array[:, np.newaxis]
+    n, m = Array.shape
+    return ((delimiter.join([fmt]*m) + "\n") * n) % tuple(Array.ravel().tolist())
+
+def format_columns(*Columns):
+    # Same as format_table(np.column_stack(Columns)) without building the stacked array
+    n = Columns[0].size
+    Rows = np.empty(len(Columns)*n)
+    for i, Col in enumerate(Columns):
+        Rows[i::len(Columns)] = Col
+    return ((",".join(["%.6e"]*len(Columns)) + "\n") * n) % tuple(Rows.tolist())
+
+class KeywordWriter:
+    # Collect keyword lines and data tables in memory, then write the file with a single call
+    def __init__(self):
+        self.parts = []
+
+    def line(self, text):
+        self.parts.append(text + "\n")
+
+    def table(self, Array):
+        self.parts.append(format_table(Array))
+
+    def columns(self, *Columns):
+        self.parts.append(format_columns(*Columns))
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+    def write(self, FilePathName):
+        # Text mode keeps the platform newline of np.savetxt, return the number of bytes on disk
+        # (file.write() counts characters, one per newline also where it is written as two bytes)
+        with open(FilePathName, 'w') as file:
+            file.write(self.getvalue())
+        return os.path.getsize(FilePathName)
+
+def write_material(Writer, Name, E, Density, Poisson, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta,
+                   Tension_Recovery, Compression_Recovory, Ref_Length, Tables):
+    # Tables: (S_c_pla, e_c_inelastic, dc, S_t_pla, u_t_cracking, dt), tension arrays already masked
+    S_c_pla, e_c_inelastic, dc, S_t_pla, u_t_cracking, dt = Tables
+    Writer.line("**E: "+str(E)+", S_cu: "+str(S_cu)+", e_cu: "+str(e_cu)+", e_63: "+str(e_60)+", Alpha: "+str(Alpha)+", S_tu: "+str(S_tu)+", e_end: "+str(e_end)+", Beta: "+str(Beta)+"**")
+    Writer.line("*Material, name=" + Name)
+    Writer.line("*Density")
+    Writer.line(str(Density))
+    Writer.line("*Elastic")
+    Writer.line(str(E) + ", " + str(Poisson))
+    Writer.line("*Concrete Damaged Plasticity, REF LENGTH=" + str(Ref_Length))
+    Writer.line("40., 0.1, 1.16, 0.66667, 0.001")
+    Writer.line("*Concrete Compression Hardening")
+    Writer.columns(S_c_pla, e_c_inelastic)
+    Writer.line("*Concrete Tension Stiffening, type=DISPLACEMENT")
+    Writer.columns(S_t_pla, u_t_cracking)
+    Writer.line("*Concrete Compression Damage, tension recovery=" + str(Tension_Recovery))
+    Writer.columns(dc, e_c_inelastic)
+    Writer.line("*Concrete Tension Damage, type=DISPLACEMENT, compression recovery=" + str(Compression_Recovory))
+    Writer.columns(dt, u_t_cracking)
+
+def write_definition(FilePathName, Name, E, Density, Poisson, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta,
+                     Tension_Recovery, Compression_Recovory, Ref_Length, Tables):
+    # Material file with a single definition, as CDP_Mat.inp of generate()
+    Writer = KeywordWriter()
+    Writer.line("**************************")
+    Writer.line("*** CDP Mat Definition ***")
+    Writer.line("**************************")
+    write_material(Writer, Name, E, Density, Poisson, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta,
+                   Tension_Recovery, Compression_Recovory, Ref_Length, Tables)
+    Writer.line("*************************")
+    Writer.line("*** End of Definition ***")
+    Writer.line("*************************")
+    return Writer.write(FilePathName)
+
+def generate(Path, Plot_Graph, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, is_meter, Ref_Length, Tolerance=None):
+    # Tolerance: max stress error (MPa) of adaptively discretized tables, None for the fixed grids.
+    # Return the curves, Rows_Comp/Rows_Tens and Error_Comp/Error_Tens report the table size and error.
+    Curves = compute_curves(E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length, Tolerance)
+    E = Curves.E
 
     ### Write input file CDP marterial model part ###
     Density = 2.4E-9
@@ -205,48 +407,123 @@ def generate(Path, Plot_Graph, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Te
 
     if is_meter == True:
         Density = Density*1E12
-        S_c_pla = S_c_pla*1E6
-        S_t_pla = S_t_pla*1E6
         E = E*1E6
 
-    FilePathName = Path + "\CDP_Mat.inp"
-    file=open(FilePathName,'w')
-    file.write("**************************\n")
-    file.write("*** CDP Mat Definition ***\n")
-    file.write("**************************\n")
-    file.write("**E: "+str(E)+", S_cu: "+str(S_cu)+", e_cu: "+str(e_cu)+", e_63: "+str(e_60)+", Alpha: "+str(Alpha)+", S_tu: "+str(S_tu)+", e_end: "+str(e_end)+", Beta: "+str(Beta)+"**\n")
-    file.write("*Material, name=CDP\n")
-    file.write("*Density\n")
-    file.write(str(Density)+"\n")
-    file.write("*Elastic\n")
-    file.write(str(E) + ", " + str(Poisson) + "\n")
-    file.write("*Concrete Damaged Plasticity, REF LENGTH=" + str(Ref_Length)+"\n")
-    file.write("40., 0.1, 1.16, 0.66667, 0.001\n")
-    file.write("*Concrete Compression Hardening\n")
-    np.savetxt(file,Compression_SS,fmt='%.6e',delimiter=",")
-    file.write("*Concrete Tension Stiffening, type=DISPLACEMENT\n")
-    np.savetxt(file,Tensile_SS,fmt='%.6e',delimiter=",")
-    file.write("*Concrete Compression Damage, tension recovery=" + str(Tension_Recovery) + "\n")
-    np.savetxt(file,Compression_D,fmt='%.6e',delimiter=",")
-    file.write("*Concrete Tension Damage, type=DISPLACEMENT, compression recovery=" + str(Compression_Recovory) + "\n")
-    np.savetxt(file,Tensile_D,fmt='%.6e',delimiter=",")
-    file.write("*************************\n")
-    file.write("*** End of Definition ***\n")
-    file.write("*************************\n")
-    file.close()
+    write_definition(os.path.join(Path, "CDP_Mat.inp"), "CDP", E, Density, Poisson, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta,
+                     Tension_Recovery, Compression_Recovory, Ref_Length,
+                     (Curves.S_c_pla, Curves.e_c_inelastic, Curves.dc, Curves.S_t_pla, Curves.u_t_cracking, Curves.dt))
 
     ### Write data for SS curve plot in 3rd party ###
-    FilePathName = Path + '\Compression_SS.txt'
-    file=open(FilePathName,'w')
-    file.write("Strain, Stress(MPa)\n")
-    np.savetxt(file,Compression_SS_plot,fmt='%.6e',delimiter=",")
-    file.close()
-    FilePathName = Path + '\Tensile_SS.txt'
-    file=open(FilePathName,'w')
-    file.write("Strain, Stress(MPa)\n")
-    np.savetxt(file,Tensile_SS_plot,fmt='%.6e',delimiter=",")
-    file.close()
-    
+    for FileName, Table in (('Compression_SS.txt', Curves.Compression_SS_plot), ('Tensile_SS.txt', Curves.Tensile_SS_plot)):
+        Writer = KeywordWriter()
+        Writer.line("Strain, Stress(MPa)")
+        Writer.table(Table)
+        Writer.write(os.path.join(Path, FileName))
+    return Curves
+
+###############################################
+## Batch generation of CDP material libraries ##
+###############################################
+
+# Column order of a batch parameter table
+BATCH_COLUMNS = ("E", "S_cu", "e_cu", "e_60", "Alpha", "S_tu", "e_end", "Beta",
+                 "Tension_Recovery", "Compression_Recovory", "Ref_Length")
+
+# Default values of the batch columns, the same as in the GUI
+DEFAULTS = {
+    "E": 30.0, "S_cu": 50.0, "e_cu": 0.003, "e_60": 0.005, "Alpha": 2.0, "Tension_Recovery": 1.0,
+    "S_tu": 5.0, "e_end": 0.002, "Beta": 2.0, "Compression_Recovory": 0.0, "Ref_Length": 1.0,
+}
+
+# Alternative spellings accepted in batch files
+ALIASES = {"e_63": "e_60", "Compression_Recovery": "Compression_Recovory"}
+
+def load_table(Params):
+    # Accept a dict of columns, a list of dicts (one per material) or a 2-D array
+    # whose columns follow BATCH_COLUMNS. Return a dict of 1-D float arrays.
+    if isinstance(Params, dict):
+        Table = {key: np.atleast_1d(np.asarray(Params[key], dtype=float)) for key in BATCH_COLUMNS}
+    elif len(Params) > 0 and isinstance(Params[0], dict):
+        Table = {key: np.array([row[key] for row in Params], dtype=float) for key in BATCH_COLUMNS}
+    else:
+        Array = np.atleast_2d(np.asarray(Params, dtype=float))
+        if Array.shape[1] != len(BATCH_COLUMNS):
+            message = "Parameter table should have " + str(len(BATCH_COLUMNS)) + " columns " + str(BATCH_COLUMNS)
+            raise ValueError(message)
+        Table = {key: Array[:, i] for i, key in enumerate(BATCH_COLUMNS)}
+
+    sizes = set(column.size for column in Table.values())
+    if len(sizes) != 1:
+        raise ValueError("All columns of the parameter table should have the same length")
+    return Table
+
+def batch_tables(Curves, i):
+    # Tables of row i of batch_curves() in the order taken by write_material()
+    mask = Curves["mask"][i]
+    return (Curves["S_c_pla"][i], Curves["e_c_inelastic"][i], Curves["dc"][i],
+            Curves["S_t_pla"][i][mask], Curves["u_t_cracking"][i][mask], Curves["dt"][i][mask])
+
+def check_names(Names, n):
+    # One name per parameter set, unique regardless of case
+    Names = [str(name) for name in Names]
+    if len(Names) != n:
+        raise ValueError("Number of material names should match the number of parameter sets")
+    if len(set(name.upper() for name in Names)) != n:
+        raise ValueError("Material names should be unique (Abaqus names are case-insensitive)")
+    return Names
+
+def generate_batch(Path, Params, is_meter, Names=None, FileName="CDP_Lib.inp", Tolerance=None):
+    # Tolerance: as in generate(), the adaptive tables are computed material by material
+    Table = load_table(Params)
+    n = Table["E"].size
+    E = Table["E"] * 1000.
+
+    if Names is None:
+        Names = ["CDP_" + str(i+1) for i in range(n)]
+    Names = check_names(Names, n)
+
+    valid_cu, valid_end = batch_validity(E, Table["S_cu"], Table["e_cu"], Table["S_tu"], Table["e_end"])
+    if not np.all(valid_cu):
+        i = int(np.argmin(valid_cu))
+        message = "Material " + Names[i] + ": Ultimate crushing strain should be in the range " + "[" + str(Table["S_cu"][i]/E[i]) + "~" + str(2*Table["S_cu"][i]/E[i]) + "]"
+        raise ValueError(message)
+    if not np.all(valid_end):
+        i = int(np.argmin(valid_end))
+        message = "Material " + Names[i] + ": End strain should be larger than " + "[" + str(Table["S_tu"][i]/E[i])
+        raise ValueError(message)
+
+    if Tolerance is None:
+        Curves = batch_curves(E, Table["S_cu"], Table["e_cu"], Table["e_60"], Table["Alpha"],
+                              Table["S_tu"], Table["e_end"], Table["Beta"], Table["Ref_Length"])
+
+    Density = 2.4E-9
+    Poisson = 0.2
+    if is_meter == True:
+        Density = Density*1E12
+
+    Writer = KeywordWriter()
+    Writer.line("**************************")
+    Writer.line("*** CDP Mat Library    ***")
+    Writer.line("**************************")
+    for i in range(n):
+        # Header values are taken as python floats so they print like generate()
+        E_i = float(E[i])*1E6 if is_meter == True else float(E[i])
+        S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, Ref_Length = [
+            float(Table[key][i]) for key in BATCH_COLUMNS[1:]]
+        if Tolerance is None:
+            Tables = batch_tables(Curves, i)
+        else:
+            Tables = batch_tables(adaptive_curves(float(E[i]), S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length, Tolerance), 0)
+        write_material(Writer, Names[i], E_i, Density, Poisson, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta,
+                       Tension_Recovery, Compression_Recovory, Ref_Length, Tables)
+    Writer.line("*************************")
+    Writer.line("*** End of Library    ***")
+    Writer.line("*************************")
+
+    FilePathName = os.path.join(Path, FileName)
+    Writer.write(FilePathName)
+    return FilePathName
+
 if __name__ == "__main__":
     # Define the parameters
     is_meter = False
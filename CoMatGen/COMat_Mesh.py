@@ -0,0 +1,338 @@
+"""
+Source code for COMat_Mesh: Crack band regularization of the CDP material per element size
+
+Author: Youngbin LIM
+Contact: lyb0684@naver.com
+
+The tension stiffening displacement of the CDP material is u_t = e_t_cracking * Ref_Length,
+so the reference length should follow the element size. This tool reads the nodes, solid
+elements and element sets of a deck, computes the characteristic length of every element
+assigned to the material (cube root of the volume), bins the lengths and writes:
+    - a library with one CDP material per bin (Ref_Length = mean length of the bin),
+    - a copy of the deck where every *Solid Section of the material is split into one
+      element set and section per bin, and the material is replaced by the library.
+
+    python COMat_Mesh.py 3-Point-Bending.inp --out ./Regularized --bins 5 --E 30 --S_cu 26.5 --e_cu 0.0013
+
+Solid elements C3D4/C3D10 (tetrahedron), C3D6/C3D15 (wedge) and C3D8/C3D20 (hexahedron)
+with any suffix are supported.
+"""
+
+import io
+import os
+import re
+import sys
+import mmap
+import argparse
+
+import numpy as np
+
+import COMat_Generator
+import COMat_Deck
+from COMat_Generator import DEFAULTS
+
+# Corner nodes split into tetrahedra, in Abaqus node order
+HEX_TETS = ((0, 1, 2, 6), (0, 2, 3, 6), (0, 3, 7, 6), (0, 7, 4, 6), (0, 4, 5, 6), (0, 5, 1, 6))
+WEDGE_TETS = ((0, 1, 2, 5), (0, 1, 5, 4), (0, 4, 5, 3))
+TET_TETS = ((0, 1, 2, 3),)
+
+# Element type prefix: (nodes per element, tetrahedra of the corner nodes), longest prefix first
+SOLID_ELEMENTS = (
+    ("C3D10", 10, TET_TETS), ("C3D15", 15, WEDGE_TETS), ("C3D20", 20, HEX_TETS),
+    ("C3D4", 4, TET_TETS), ("C3D6", 6, WEDGE_TETS), ("C3D8", 8, HEX_TETS),
+)
+
+def solid_element(Type):
+    # (nodes per element, tetrahedra) of a solid element type, None for other types
+    for prefix, nodes, tets in SOLID_ELEMENTS:
+        if Type.upper().startswith(prefix):
+            return nodes, tets
+    return None
+
+###################
+## Reading decks ##
+###################
+
+def _data(mm, Index, i):
+    # Data lines of keyword i, comment lines removed
+    start = mm.find(b"\n", Index.Offsets[i], Index.end(i))
+    data = mm[start+1:Index.end(i)] if start >= 0 else b""
+    if b"**" in data:
+        data = b"".join(line for line in data.splitlines(True) if line[:2] != b"**")
+    return data
+
+def parse_numbers(data):
+    # All numbers of comma separated data lines as one flat float array
+    return np.fromstring(data.replace(b",", b" ").decode("latin-1"), sep=" ")
+
+def parse_table(data, columns, dtype=float):
+    # Data lines with a fixed number of values per row (rows may be continued on the next line)
+    try:
+        Table = np.loadtxt(io.BytesIO(data), delimiter=",", dtype=dtype, ndmin=2)
+        if Table.shape[1] == columns or Table.size == 0:
+            return Table.reshape(-1, columns)
+    except ValueError:
+        pass
+    Flat = parse_numbers(data)
+    if Flat.size % columns != 0:
+        raise ValueError("Expected {} values per row".format(columns))
+    return Flat.reshape(-1, columns).astype(dtype)
+
+def _elset_members(data, generate):
+    # Element labels and names of other sets in the data lines of an *Elset
+    if generate:
+        Ranges = parse_numbers(data).astype(np.int64).reshape(-1, 3)
+        return [np.arange(start, stop+1, step) for start, stop, step in Ranges], []
+    if re.search(rb"[A-Za-z_]", data) is None:
+        return [parse_numbers(data).astype(np.int64)], []
+    Labels, Names = [], []
+    for token in data.replace(b"\n", b",").split(b","):
+        token = token.strip()
+        if token:
+            try:
+                Labels.append(int(token))
+            except ValueError:
+                Names.append(token.decode("latin-1"))
+    return [np.array(Labels, dtype=np.int64)], Names
+
+class Part:
+    # Nodes, elements and element sets of one *Part (or of a deck without parts)
+    def __init__(self, Name):
+        self.Name = Name
+        self.Nodes = []        # (labels, coordinates)
+        self.Elements = []     # (type, labels, connectivity)
+        self.Elsets = {}       # upper-case name: [label arrays]
+        self.ElsetNames = {}   # upper-case name: other set names
+        self.Sections = []     # positions of *... Section keywords in the index
+
+    def add_elset(self, Name, Labels, Names=()):
+        self.Elsets.setdefault(Name.upper(), []).extend(Labels)
+        self.ElsetNames.setdefault(Name.upper(), []).extend(Names)
+
+    def elset(self, Name, _seen=None):
+        # Unique element labels of a set, sets referenced by name are resolved
+        _seen = set() if _seen is None else _seen
+        key = Name.upper()
+        if key not in self.Elsets:
+            raise ValueError("Element set " + Name + " is not defined in part " + self.Name)
+        _seen.add(key)
+        Labels = list(self.Elsets[key])
+        for Other in self.ElsetNames[key]:
+            if Other.upper() not in _seen:
+                Labels.append(self.elset(Other, _seen))
+        if not Labels:
+            return np.zeros(0, dtype=np.int64)
+        Labels = np.concatenate(Labels)
+        # Sets written with generate are already sorted and unique
+        return Labels if np.all(Labels[1:] > Labels[:-1]) else np.unique(Labels)
+
+def read_parts(Deck, Index=None, Elements=solid_element):
+    # {part name: Part}, keywords outside of *Part ... *End Part go to the part named "".
+    # Elements(type) gives a tuple starting with the nodes per element, None for types to skip.
+    Index = COMat_Deck.load_index(Deck) if Index is None else Index
+    Parts = {"": Part("")}
+    Current = Parts[""]
+    with open(Deck, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for i, (keyword, params) in enumerate(Index.Keywords):
+            if keyword == "part":
+                Current = Parts.setdefault(params.get("name", ""), Part(params.get("name", "")))
+            elif keyword == "end part":
+                Current = Parts[""]
+            elif keyword == "node":
+                data = _data(mm, Index, i)
+                Table = parse_table(data, len(data.split(b"\n", 1)[0].split(b",")))
+                Current.Nodes.append((Table[:, 0].astype(np.int64), Table[:, 1:]))
+            elif keyword == "element":
+                Kind = Elements(params.get("type", ""))
+                if Kind is None:
+                    continue
+                Table = parse_table(_data(mm, Index, i), Kind[0]+1, np.int64)
+                Current.Elements.append((params["type"].upper(), Table[:, 0], Table[:, 1:]))
+                if "elset" in params:
+                    Current.add_elset(params["elset"], [Table[:, 0]])
+            elif keyword == "elset" and "elset" in params and "instance" not in params:
+                Labels, Names = _elset_members(_data(mm, Index, i), "generate" in params)
+                Current.add_elset(params["elset"], Labels, Names)
+            elif keyword.endswith("section") and "elset" in params:
+                Current.Sections.append(i)
+    return Parts
+
+####################################
+## Characteristic element lengths ##
+####################################
+
+def tet_volumes(X, tets):
+    # Sum of the signed volumes of the tetrahedra of every element, X: (n, nodes, 3)
+    V = np.zeros(X.shape[0])
+    for a, b, c, d in tets:
+        V += np.einsum('ij,ij->i', X[:, b]-X[:, a], np.cross(X[:, c]-X[:, a], X[:, d]-X[:, a]))/6.0
+    return np.abs(V)
+
+def element_lengths(Part):
+    # Labels and characteristic lengths (cube root of the volume) of the solid elements of a part
+    if not Part.Nodes or not Part.Elements:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    NodeLabels = np.concatenate([Labels for Labels, _ in Part.Nodes])
+    Coords = np.concatenate([XYZ for _, XYZ in Part.Nodes])
+    if Coords.shape[1] != 3:
+        raise ValueError("Solid elements need 3-D nodal coordinates (part " + Part.Name + ")")
+    # Node label -> row of Coords
+    Row = np.full(NodeLabels.max()+1, -1, dtype=np.int64)
+    Row[NodeLabels] = np.arange(NodeLabels.size)
+
+    Labels, Lengths = [], []
+    for Type, ElementLabels, Connectivity in Part.Elements:
+        nodes, tets = solid_element(Type)
+        corners = 8 if tets is HEX_TETS else (6 if tets is WEDGE_TETS else 4)
+        Rows = Row[Connectivity[:, :corners]]
+        if np.any(Rows < 0):
+            raise ValueError("Elements of part " + Part.Name + " use undefined nodes")
+        Labels.append(ElementLabels)
+        Lengths.append(np.cbrt(tet_volumes(Coords[Rows], tets)))
+    return np.concatenate(Labels), np.concatenate(Lengths)
+
+def bin_lengths(Lengths, Bins):
+    # Bin number (0, 1, ...) of every length and mean length of every bin.
+    # Bins have equal width on a log scale between the shortest and longest element, empty bins are dropped.
+    Edges = np.geomspace(Lengths.min(), Lengths.max(), Bins+1) if Lengths.max() > Lengths.min() else np.array([Lengths.min()]*2)
+    Bin = np.clip(np.searchsorted(Edges, Lengths, side='right') - 1, 0, max(Edges.size-2, 0))
+    Counts = np.bincount(Bin)
+    Used = Counts > 0
+    Bin = (np.cumsum(Used) - 1)[Bin]
+    Counts = Counts[Used]
+    Means = np.bincount(Bin, weights=Lengths)/Counts
+    return Bin, Means, Counts
+
+#############################
+## Regularized deck output ##
+#############################
+
+def _format_labels(Labels, newline, per_line=16):
+    # Element labels, 16 per line as written by Abaqus/CAE
+    full = Labels.size // per_line * per_line
+    text = ((", ".join(["%d"]*per_line) + newline) * (full // per_line)) % tuple(Labels[:full].tolist())
+    if full < Labels.size:
+        text += ", ".join(["%d"]*(Labels.size-full)) % tuple(Labels[full:].tolist()) + newline
+    return text
+
+def _set_param(line, name, value):
+    # Replace the value of parameter name in a keyword line
+    return re.sub(r"(?i)(,\s*" + name + r"\s*=\s*)[^,]*", lambda match: match.group(1) + value, line, count=1)
+
+def regularize(Deck, Output, Params, Material="CDP", Bins=5, is_meter=False, Include=True,
+               Tolerance=None, Library="CDP_Lib.inp"):
+    # Write Output (and the material library next to it) with one material per element size bin.
+    # Output is written by COMat_Deck.replace_material() and keeps the file mode of Deck.
+    # Params: material parameters as for generate_batch(), Ref_Length is replaced per bin.
+    # Return a list of {"Name", "Ref_Length", "Elements", "Min", "Max"}, one per bin.
+    Index = COMat_Deck.load_index(Deck)
+    for keyword, params in Index.Keywords:
+        if keyword.endswith("section") and keyword != "solid section" and params.get("material", "").upper() == Material.upper():
+            raise ValueError("Material " + Material + " is also used by *" + keyword.title() + ", only solid sections can be split")
+    Parts = read_parts(Deck, Index)
+
+    # Lengths of the elements of every solid section using the material
+    Sections = []
+    for Part in Parts.values():
+        Mine = [i for i in Part.Sections if Index.Keywords[i][0] == "solid section"
+                and Index.Keywords[i][1].get("material", "").upper() == Material.upper()]
+        if not Mine:
+            continue
+        Labels, Lengths = element_lengths(Part)
+        Order = np.argsort(Labels)
+        Labels, Lengths = Labels[Order], Lengths[Order]
+        for i in Mine:
+            Members = Part.elset(Index.Keywords[i][1]["elset"])
+            Position = np.clip(np.searchsorted(Labels, Members), 0, max(Labels.size-1, 0))
+            if Labels.size == 0 or np.any(Labels[Position] != Members):
+                raise ValueError("Element set " + Index.Keywords[i][1]["elset"] + " has elements that are not supported solid elements")
+            Sections.append((Part, i, Members, Lengths[Position]))
+    if not Sections:
+        raise ValueError("No *Solid Section uses material " + Material)
+
+    AllLengths = np.concatenate([Lengths for _, _, _, Lengths in Sections])
+    Bin, Means, Counts = bin_lengths(AllLengths, Bins)
+    Names = [Material + "_L" + str(k+1) for k in range(Means.size)]
+
+    # Library with one material per bin
+    Table = {key: np.full(Means.size, float(Params[key])) for key in COMat_Generator.BATCH_COLUMNS}
+    Table["Ref_Length"] = Means
+    OutDir = os.path.dirname(os.path.abspath(Output))
+    LibFile = COMat_Generator.generate_batch(OutDir, Table, is_meter, Names=Names, FileName=Library, Tolerance=Tolerance)
+
+    # Every section becomes one element set and one section per bin
+    newline = COMat_Deck.deck_newline(Deck)
+    nl = newline.decode()
+    Splices = []
+    first = 0
+    with open(Deck, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for Part, i, Members, Lengths in Sections:
+            SectionBin = Bin[first:first+Members.size]
+            first += Members.size
+            Elset = Index.Keywords[i][1]["elset"]
+            Window = mm[Index.Offsets[i]:Index.end(i)].splitlines(True)
+            # Data lines of the section, the comments after them announce the next keyword
+            n = 1
+            while n < len(Window) and Window[n][:2] != b"**":
+                n += 1
+            Data, Trailing = b"".join(Window[1:n]).decode("latin-1"), b"".join(Window[n:]).decode("latin-1")
+            Text = []
+            for k in np.unique(SectionBin):
+                NewElset = Elset + "_L" + str(k+1)
+                if NewElset.upper() in Part.Elsets:
+                    raise ValueError("Element set " + NewElset + " already exists in part " + Part.Name)
+                Text.append("*Elset, elset=" + NewElset + nl + _format_labels(Members[SectionBin == k], nl))
+            for k in np.unique(SectionBin):
+                Line = _set_param(_set_param(Index.Lines[i], "elset", Elset + "_L" + str(k+1)), "material", Names[k])
+                Text.append(Line + nl + Data)
+            Text.append(Trailing)
+            Splices.append((Index.Offsets[i], Index.end(i), "".join(Text).encode("latin-1")))
+
+    if Include:
+        Block = [COMat_Deck.include_line(LibFile, Output, newline)]
+    else:
+        with open(LibFile, 'rb') as f:
+            Block = [line.rstrip(b"\r\n") + newline for line in f]
+    COMat_Deck.replace_material(Deck, Output, Block, Material, Indexed=True, Splices=Splices)
+
+    Summary = []
+    for k, Name in enumerate(Names):
+        Summary.append({"Name": Name, "Ref_Length": float(Means[k]), "Elements": int(Counts[k]),
+                        "Min": float(AllLengths[Bin == k].min()), "Max": float(AllLengths[Bin == k].max())})
+    return Summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="One CDP material per element size bin (crack band regularization)")
+    parser.add_argument("deck", help="Abaqus input deck")
+    parser.add_argument("--out", default="Regularized", help="Output directory for the deck and the library (default: Regularized)")
+    parser.add_argument("--material", default="CDP", help="Material of the solid sections to split (default: CDP)")
+    parser.add_argument("--bins", type=int, default=5, help="Number of element size bins (default: 5)")
+    parser.add_argument("--library", default="CDP_Lib.inp", help="File name of the material library")
+    parser.add_argument("--inline", action="store_true", help="Copy the materials into the deck instead of *Include")
+    parser.add_argument("--meter", action="store_true", help="Dimension is in meter")
+    parser.add_argument("--tolerance", type=float, help="Max stress error in MPa for adaptive tables")
+    group = parser.add_argument_group("material parameters (Ref_Length is set per bin)")
+    for key in COMat_Generator.BATCH_COLUMNS[:-1]:
+        group.add_argument("--" + key, type=float, default=DEFAULTS[key])
+    args = parser.parse_args(argv)
+
+    Params = {key: getattr(args, key) for key in COMat_Generator.BATCH_COLUMNS[:-1]}
+    Params["Ref_Length"] = 0.0
+    Output = os.path.join(args.out, os.path.basename(args.deck))
+    try:
+        os.makedirs(args.out, exist_ok=True)
+        if os.path.abspath(Output) == os.path.abspath(args.deck):
+            raise ValueError("Output folder should differ from the folder of the deck: " + args.deck)
+        Summary = regularize(args.deck, Output, Params, args.material, args.bins, args.meter,
+                             not args.inline, args.tolerance, args.library)
+    except (ValueError, OSError) as e:
+        print("Error: " + str(e), file=sys.stderr)
+        return 1
+    print("{:<12}{:>10}{:>14}{:>12}{:>12}".format("Material", "Elements", "Ref_Length", "Min", "Max"))
+    for Row in Summary:
+        print("{Name:<12}{Elements:>10}{Ref_Length:>14.4g}{Min:>12.4g}{Max:>12.4g}".format(**Row))
+    print("Written: " + Output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
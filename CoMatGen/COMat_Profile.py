@@ -0,0 +1,183 @@
+"""
+Source code for COMat_Profile: Opt-in stage timers and counters for generation and fitting
+
+Author: Youngbin LIM
+Contact: lyb0684@naver.com
+
+Nothing is instrumented until a Session is opened: the session swaps the listed module
+functions for timing / counting wrappers and puts the originals back on exit, so a run
+without profiling executes exactly the same code as before.
+
+    with COMat_Profile.Session(COMat_Profile.generator_targets(), "Profile.json", "Profile.prof"):
+        COMat_Generator.generate(...)
+
+Report (JSON): wall time, per stage the number of calls, total seconds (nested stages
+included) and self seconds (nested stages excluded), and the counters (function
+evaluations, fit candidates, files and bytes written). A dump file ending in .html is
+written with pyinstrument, any other name gets cProfile stats (read with pstats/snakeviz).
+"""
+
+import time
+import json
+import functools
+
+# Target kinds
+STAGE = "stage"           # time the call
+COUNT = "count"           # count the calls
+CANDIDATES = "candidates" # count the calls and the candidates (length of the first argument)
+WRITE = "write"           # time the call, count files and the returned number of bytes
+
+class Session:
+    # Targets: list of (owner, attribute, kind, name), owner is a module or a class
+    def __init__(self, Targets, Report=None, Dump=None):
+        self.Targets = Targets
+        self.Report = Report
+        self.Dump = Dump
+        self.Stages = {}
+        self.Counters = {}
+        self.Stack = []
+        self.Saved = []
+        self.profiler = None
+
+    def __enter__(self):
+        for owner, attribute, kind, name in self.Targets:
+            original = owner.__dict__[attribute] if isinstance(owner, type) else getattr(owner, attribute)
+            self.Saved.append((owner, attribute, original))
+            setattr(owner, attribute, self.wrap(original, kind, name))
+        if self.Dump is not None:
+            self.profiler = start_profiler(self.Dump)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.start
+        if self.profiler is not None:
+            stop_profiler(self.profiler, self.Dump)
+        for owner, attribute, original in reversed(self.Saved):
+            setattr(owner, attribute, original)
+        self.Saved = []
+        if self.Report is not None:
+            with open(self.Report, 'w') as f:
+                json.dump(self.report(), f, indent=1)
+        return False
+
+    def count(self, name, n=1):
+        self.Counters[name] = self.Counters.get(name, 0) + n
+
+    def wrap(self, fn, kind, name):
+        if kind == COUNT:
+            def wrapper(*args, **kwargs):
+                self.count(name)
+                return fn(*args, **kwargs)
+        elif kind == CANDIDATES:
+            def wrapper(*args, **kwargs):
+                self.count(name)
+                self.count(name + " candidates", len(args[0]))
+                return fn(*args, **kwargs)
+        elif kind == WRITE:
+            def wrapper(*args, **kwargs):
+                written = self.timed(fn, name, args, kwargs)
+                self.count("files written")
+                self.count("bytes written", written)
+                return written
+        else:
+            def wrapper(*args, **kwargs):
+                return self.timed(fn, name, args, kwargs)
+        return functools.wraps(fn)(wrapper)
+
+    def timed(self, fn, name, args, kwargs):
+        # A stage called inside itself (e.g. compute_curves -> batch_curves) is timed once
+        if name in (frame[0] for frame in self.Stack):
+            return fn(*args, **kwargs)
+        frame = [name, 0.0]
+        self.Stack.append(frame)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.Stack.pop()
+            if self.Stack:
+                self.Stack[-1][1] += elapsed
+            Stage = self.Stages.setdefault(name, {"calls": 0, "total_s": 0.0, "self_s": 0.0})
+            Stage["calls"] += 1
+            Stage["total_s"] += elapsed
+            Stage["self_s"] += elapsed - frame[1]
+
+    def report(self):
+        wall = self.wall if not self.Saved else time.perf_counter() - self.start
+        Stages = dict(sorted(self.Stages.items(), key=lambda item: -item[1]["self_s"]))
+        return {"wall_s": wall, "stages": Stages, "counters": dict(self.Counters)}
+
+    def summary(self):
+        # Text table of the report, slowest stage first
+        Report = self.report()
+        lines = ["{:<20}{:>10}{:>12}{:>12}".format("stage", "calls", "total s", "self s")]
+        for name, Stage in Report["stages"].items():
+            lines.append("{:<20}{:>10}{:>12.4f}{:>12.4f}".format(name, Stage["calls"], Stage["total_s"], Stage["self_s"]))
+        for name, value in Report["counters"].items():
+            lines.append("{:<30}{:>24}".format(name, value))
+        lines.append("{:<30}{:>24.4f}".format("wall s", Report["wall_s"]))
+        return "\n".join(lines)
+
+def start_profiler(Dump):
+    if Dump.lower().endswith(".html"):
+        try:
+            import pyinstrument
+        except ImportError:
+            raise ValueError("HTML profile dumps require pyinstrument (pip install pyinstrument)")
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+def stop_profiler(profiler, Dump):
+    if Dump.lower().endswith(".html"):
+        profiler.stop()
+        with open(Dump, 'w') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        profiler.dump_stats(Dump)
+
+######################
+## Standard targets ##
+######################
+
+def generator_targets():
+    # Curve math, validation, table formatting and file output of COMat_Generator
+    import COMat_Generator as G
+    return [
+        (G, "generate", STAGE, "generate"),
+        (G, "generate_batch", STAGE, "generate"),
+        (G, "check_parameters", STAGE, "validation"),
+        (G, "batch_validity", STAGE, "validation"),
+        (G, "compute_curves", STAGE, "curves"),
+        (G, "batch_curves", STAGE, "curves"),
+        (G, "adaptive_curves", STAGE, "curves"),
+        (G, "format_table", STAGE, "formatting"),
+        (G, "format_columns", STAGE, "formatting"),
+        (G.KeywordWriter, "write", WRITE, "file output"),
+    ]
+
+def fit_targets(CoMatFIT):
+    # Loading, random search, local optimizer and objective evaluations of CoMatFIT
+    return [
+        (CoMatFIT, "load_curve", STAGE, "load"),
+        (CoMatFIT, "fit_compression", STAGE, "fit"),
+        (CoMatFIT, "fit_tension", STAGE, "fit"),
+        (CoMatFIT, "fit_compression_full", STAGE, "fit"),
+        (CoMatFIT, "fit_tension_full", STAGE, "fit"),
+        (CoMatFIT, "Random_Search", STAGE, "random search"),
+        (CoMatFIT, "minimize", STAGE, "minimize"),
+        (CoMatFIT, "least_squares", STAGE, "least_squares"),
+        (CoMatFIT, "Error_Comp", COUNT, "Error_Comp"),
+        (CoMatFIT, "Error_Tens", COUNT, "Error_Tens"),
+        (CoMatFIT, "Error_Comp_Batch", CANDIDATES, "Error_Comp_Batch"),
+        (CoMatFIT, "Error_Tens_Batch", CANDIDATES, "Error_Tens_Batch"),
+        (CoMatFIT, "Residual_Comp", COUNT, "Residual_Comp"),
+        (CoMatFIT, "Residual_Tens", COUNT, "Residual_Tens"),
+    ]
@@ -0,0 +1,217 @@
+"""
+Source code for COMat_Simulator: Uniaxial material point of the concrete damaged plasticity model
+
+Author: Youngbin LIM
+Contact: lyb0684@naver.com
+
+Strain driven response of one integration point under uniaxial stress, following the
+CDP rules of Abaqus in 1-D:
+    sigma = (1 - d)*E*(eps - eps_pl)
+    1 - d = (1 - s_t*d_c)*(1 - s_c*d_t),  s_t = 1 - w_t*r,  s_c = 1 - w_c*(1 - r)
+r is 1 when the effective stress is tensile and 0 otherwise, w_t and w_c are the tension
+and compression recovery written by generate(). Hardening variables are the equivalent
+plastic strains of tension and compression, the Abaqus tables (Compression_SS,
+Compression_D, Tensile_SS, Tensile_D) are converted to effective yield stress and damage
+against them as Abaqus does. The return mapping is exact for the piecewise linear tables,
+so the step size only has to resolve the load reversals.
+
+Every material runs every strain history at once, the loop only goes over the time steps:
+    Tables = COMat_Simulator.from_batch(Params)              # or from_curves(Curves, w_t, w_c)
+    Strain = COMat_Simulator.load_path([0.0002, -0.003, 0.0004, -0.006], 1E-5)
+    Stress = COMat_Simulator.simulate(Tables, Strain)["Stress"]  # (materials, histories, steps)
+
+Command line, response of one material written as CSV:
+    python COMat_Simulator.py --peaks 0.0002,-0.003,0.0004,-0.006 --E 30 --S_cu 26.5 --e_cu 0.0013 --out Response.csv
+"""
+
+import sys
+import argparse
+
+import numpy as np
+
+import COMat_Generator
+
+# Damage is kept below this value so that effective stresses stay finite
+MAX_DAMAGE = 0.999
+
+TABLE_KEYS = ("E", "K_c", "Y_c", "D_c", "K_t", "Y_t", "D_t", "w_t", "w_c")
+
+def _tables(E, S_c, e_in, d_c, S_t, e_ck, d_t, w_t, w_c):
+    # Inputs are (M, K) arrays (E, w_t, w_c of length M). Return the simulator tables:
+    # equivalent plastic strain K, effective yield stress Y and damage D per branch.
+    E = np.asarray(E, dtype=float)[:, None]
+    d_c = np.minimum(d_c, MAX_DAMAGE)
+    d_t = np.minimum(d_t, MAX_DAMAGE)
+    # eps_pl = eps_inelastic - d/(1-d)*sigma/E, Abaqus rejects decreasing values, here they are flattened
+    K_c = np.maximum.accumulate(np.maximum(e_in - d_c/(1 - d_c)*S_c/E, 0.0), axis=1)
+    K_t = np.maximum.accumulate(np.maximum(e_ck - d_t/(1 - d_t)*S_t/E, 0.0), axis=1)
+    return {"E": E[:, 0], "K_c": K_c, "Y_c": S_c/(1 - d_c), "D_c": d_c, "K_t": K_t, "Y_t": S_t/(1 - d_t), "D_t": d_t,
+            "w_t": np.broadcast_to(np.asarray(w_t, dtype=float), E[:, 0].shape).copy(),
+            "w_c": np.broadcast_to(np.asarray(w_c, dtype=float), E[:, 0].shape).copy()}
+
+def material_tables(E, Compression_SS, Compression_D, Tensile_SS, Tensile_D, Ref_Length, Tension_Recovery, Compression_Recovory):
+    # One material from the tables of an Abaqus card: E in MPa, tension tables of type DISPLACEMENT
+    Compression_SS, Compression_D = np.asarray(Compression_SS, dtype=float), np.asarray(Compression_D, dtype=float)
+    Tensile_SS, Tensile_D = np.asarray(Tensile_SS, dtype=float), np.asarray(Tensile_D, dtype=float)
+    return _tables([E], Compression_SS[None, :, 0], Compression_SS[None, :, 1], Compression_D[None, :, 0],
+                   Tensile_SS[None, :, 0], Tensile_SS[None, :, 1]/Ref_Length, Tensile_D[None, :, 0],
+                   Tension_Recovery, Compression_Recovory)
+
+def from_curves(Curves, Tension_Recovery, Compression_Recovory):
+    # Tables of a CDPCurves instance (compute_curves() / generate())
+    return material_tables(Curves.E, Curves.Compression_SS, Curves.Compression_D, Curves.Tensile_SS, Curves.Tensile_D,
+                           Curves.Ref_Length, Tension_Recovery, Compression_Recovory)
+
+def from_batch(Params):
+    # Tables of many parameter sets in one vectorized pass, Params as for generate_batch()
+    Table = COMat_Generator.load_table(Params)
+    E = Table["E"]*1000.
+    valid_cu, valid_end = COMat_Generator.batch_validity(E, Table["S_cu"], Table["e_cu"], Table["S_tu"], Table["e_end"])
+    if not np.all(valid_cu & valid_end):
+        i = int(np.argmin(valid_cu & valid_end))
+        raise ValueError("Parameter set " + str(i+1) + " fails the e_cu / e_end checks of generate()")
+    Curves = COMat_Generator.batch_curves(E, Table["S_cu"], Table["e_cu"], Table["e_60"], Table["Alpha"],
+                                          Table["S_tu"], Table["e_end"], Table["Beta"], Table["Ref_Length"])
+    # Rows past the tension mask repeat the last written point, as a shorter Abaqus table would
+    last = np.sum(Curves["mask"], axis=1) - 1
+    keep = np.minimum(np.arange(Curves["mask"].shape[1])[None, :], last[:, None])
+    S_t, u_t, d_t = [np.take_along_axis(Curves[key], keep, axis=1) for key in ("S_t_pla", "u_t_cracking", "dt")]
+    return _tables(E, Curves["S_c_pla"], Curves["e_c_inelastic"], Curves["dc"], S_t, u_t/Table["Ref_Length"][:, None], d_t,
+                   Table["Tension_Recovery"], Table["Compression_Recovory"])
+
+def stack_tables(Tables):
+    # Concatenate the tables of several materials, shorter tables repeat their last row
+    K = {key: max(T[key].shape[1] for T in Tables) for key in TABLE_KEYS if Tables[0][key].ndim == 2}
+    Stacked = {}
+    for key in TABLE_KEYS:
+        if key in K:
+            Stacked[key] = np.concatenate([np.pad(T[key], ((0, 0), (0, K[key] - T[key].shape[1])), mode='edge') for T in Tables])
+        else:
+            Stacked[key] = np.concatenate([T[key] for T in Tables])
+    return Stacked
+
+def load_path(Peaks, Increment, Start=0.0):
+    # Piecewise linear strain history through the peaks, steps no larger than Increment
+    Points = np.concatenate(([Start], np.asarray(Peaks, dtype=float)))
+    Segments = []
+    for a, b in zip(Points[:-1], Points[1:]):
+        n = max(int(np.ceil(abs(b - a)/Increment)), 1)
+        Segments.append(np.linspace(a, b, n + 1)[1:])
+    return np.concatenate([[Start]] + Segments)
+
+def _interp_rows(x, Knots, Values):
+    # Row-wise linear interpolation on non-decreasing knots, constant outside them
+    n, K = Knots.shape
+    rows = np.arange(n)
+    j = np.clip(np.sum(Knots <= x[:, None], axis=1), 1, K - 1)
+    x0, x1 = Knots[rows, j-1], Knots[rows, j]
+    y0, y1 = Values[rows, j-1], Values[rows, j]
+    span = x1 - x0
+    w = np.clip(np.divide(x - x0, span, out=np.zeros_like(x), where=span > 0), 0.0, 1.0)
+    return y0 + w*(y1 - y0)
+
+def _return_map(S_trial, E, kappa, Y_now, Knots, Yield):
+    # Plastic increment dk >= 0 with S_trial - E*dk = Y(kappa + dk), Y linear between the knots
+    # and constant past the last one. Rows are points that yield (S_trial > Y_now = Y(kappa)).
+    G = S_trial[:, None] - E[:, None]*(Knots - kappa[:, None]) - Yield
+    G = np.where(Knots > kappa[:, None], G, np.inf)
+    below = G <= 0
+    has = below.any(axis=1)
+    j = np.argmax(below, axis=1)
+    rows = np.arange(len(kappa))
+
+    # Root inside the segment ending at knot j, the segment starts at kappa or at knot j-1
+    prev = np.maximum(j - 1, 0)
+    start_at_knot = (j > 0) & (Knots[rows, prev] > kappa)
+    x0 = np.where(start_at_knot, Knots[rows, prev], kappa)
+    g0 = np.where(start_at_knot, G[rows, prev], S_trial - Y_now)
+    x1, g1 = Knots[rows, j], G[rows, j]
+    denom = g0 - g1
+    inside = x0 + np.divide(g0*(x1 - x0), denom, out=np.zeros_like(g0), where=denom > 0)
+
+    # Past the last knot the yield stress is constant
+    beyond = kappa + (S_trial - Yield[:, -1])/E
+    return np.where(has, inside, beyond) - kappa
+
+def simulate(Tables, Strain, Full=False):
+    # Every material of Tables runs every strain history. Strain: (P, T) or (T,).
+    # Return {"Stress": (M, P, T)}, plus "d_t", "d_c" and "e_pl" histories when Full.
+    Strain = np.atleast_2d(np.asarray(Strain, dtype=float))
+    M, (P, T) = len(Tables["E"]), Strain.shape
+    m = np.repeat(np.arange(M), P)
+    E, w_t, w_c = Tables["E"][m], Tables["w_t"][m], Tables["w_c"][m]
+    K_c, Y_c, D_c = Tables["K_c"][m], Tables["Y_c"][m], Tables["D_c"][m]
+    K_t, Y_t, D_t = Tables["K_t"][m], Tables["Y_t"][m], Tables["D_t"][m]
+    # One row per step, one column per material and history
+    Path = np.ascontiguousarray(Strain.T[:, np.tile(np.arange(P), M)])
+
+    N = M*P
+    e_pl = np.zeros(N)
+    kappa_t, kappa_c = np.zeros(N), np.zeros(N)
+    # Yield stresses and damage of the current state, looked up again only where kappa grows
+    y_t, d_t = _interp_rows(kappa_t, K_t, Y_t), _interp_rows(kappa_t, K_t, D_t)
+    y_c, d_c = _interp_rows(kappa_c, K_c, Y_c), _interp_rows(kappa_c, K_c, D_c)
+    Result = {"Stress": np.empty((T, N))}
+    if Full:
+        for key in ("d_t", "d_c", "e_pl"):
+            Result[key] = np.empty((T, N))
+
+    for k in range(T):
+        S_eff = E*(Path[k] - e_pl)
+
+        # Tension: effective stress above the current tensile yield stress
+        tens = np.flatnonzero(S_eff > y_t)
+        if tens.size:
+            dk = _return_map(S_eff[tens], E[tens], kappa_t[tens], y_t[tens], K_t[tens], Y_t[tens])
+            kappa_t[tens] += dk
+            e_pl[tens] += dk
+            y_t[tens] = _interp_rows(kappa_t[tens], K_t[tens], Y_t[tens])
+            d_t[tens] = _interp_rows(kappa_t[tens], K_t[tens], D_t[tens])
+            S_eff[tens] -= E[tens]*dk
+
+        # Compression, same on the mirrored stress
+        comp = np.flatnonzero(-S_eff > y_c)
+        if comp.size:
+            dk = _return_map(-S_eff[comp], E[comp], kappa_c[comp], y_c[comp], K_c[comp], Y_c[comp])
+            kappa_c[comp] += dk
+            e_pl[comp] -= dk
+            y_c[comp] = _interp_rows(kappa_c[comp], K_c[comp], Y_c[comp])
+            d_c[comp] = _interp_rows(kappa_c[comp], K_c[comp], D_c[comp])
+            S_eff[comp] += E[comp]*dk
+
+        # Stiffness recovery: s_t = 1 - w_t in tension, s_c = 1 - w_c in compression, 1 otherwise
+        tensile = S_eff > 0
+        s_t = np.where(tensile, 1 - w_t, 1.0)
+        s_c = np.where(tensile, 1.0, 1 - w_c)
+        Result["Stress"][k] = (1 - s_t*d_c)*(1 - s_c*d_t)*S_eff
+        if Full:
+            Result["d_t"][k], Result["d_c"][k], Result["e_pl"][k] = d_t, d_c, e_pl
+
+    return {key: value.T.reshape(M, P, T) for key, value in Result.items()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Uniaxial CDP response of one material to a strain history")
+    parser.add_argument("--peaks", required=True, help="Strain peaks of the history, comma separated (compression negative)")
+    parser.add_argument("--increment", type=float, default=1E-5, help="Max strain increment (default: 1E-5)")
+    parser.add_argument("--out", default="Response.csv", help="CSV with strain, stress (MPa), d_t, d_c")
+    for key in COMat_Generator.BATCH_COLUMNS:
+        parser.add_argument("--" + key, type=float, default=COMat_Generator.DEFAULTS[key])
+    args = parser.parse_args(argv)
+
+    try:
+        Peaks = [float(value) for value in args.peaks.split(",")]
+        Tables = from_batch({key: [getattr(args, key)] for key in COMat_Generator.BATCH_COLUMNS})
+    except ValueError as ve:
+        print("Error: " + str(ve), file=sys.stderr)
+        return 1
+    Strain = load_path(Peaks, args.increment)
+    Result = simulate(Tables, Strain, Full=True)
+    Writer = COMat_Generator.KeywordWriter()
+    Writer.line("Strain, Stress(MPa), d_t, d_c")
+    Writer.columns(Strain, Result["Stress"][0, 0], Result["d_t"][0, 0], Result["d_c"][0, 0])
+    Writer.write(args.out)
+    print("{} steps written to {}".format(len(Strain), args.out))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
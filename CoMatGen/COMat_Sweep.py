@@ -0,0 +1,182 @@
+"""
+Source code for COMat_Sweep: Parameter sweeps of the CDP material for sensitivity studies
+
+Author: Youngbin LIM
+Contact: lyb0684@naver.com
+
+Parameters not swept keep their nominal value (same defaults as the command line tool).
+Each sample gets a folder with CDP_Mat.inp (and a copy of the deck when --deck is given,
+with the file mode of the deck), Sweep_Manifest.csv lists every sample with its parameters
+and status. Samples failing the e_cu / e_end checks of generate() are skipped and reported
+in the manifest.
+
+Grid, 5 levels per range (an explicit level count or list of values can be given per parameter):
+    python COMat_Sweep.py --vary e_60=0.003:0.008 --vary Alpha=1.5:3:4 --vary Beta=1,1.5,2 --out Sweep
+
+Latin hypercube around a nominal concrete, one Abaqus deck per sample:
+    python COMat_Sweep.py --strategy lhs --samples 1000 --seed 1 --vary e_60=0.003:0.008 --vary Alpha=1.5:3
+        --vary Beta=1:3 --vary Ref_Length=50:150 --E 30 --S_cu 26.5 --e_cu 0.0013 --deck Cyclic_Loading.inp
+"""
+
+import os
+import csv
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import COMat_Generator
+import COMat_Deck
+from COMat_Generator import DEFAULTS, ALIASES
+
+MANIFEST = "Sweep_Manifest.csv"
+
+def latin_hypercube(n, d, seed=0):
+    # n points in [0, 1)^d, one point per 1/n stratum on every axis
+    rng = np.random.default_rng(seed)
+    U = (rng.random((n, d)) + np.arange(n)[:, np.newaxis]) / n
+    for j in range(d):
+        U[:, j] = U[rng.permutation(n), j]
+    return U
+
+def sample(Ranges, Strategy="grid", n=5, seed=0):
+    # Ranges: {name: (low, high), (low, high, levels) or [values]}. Return {name: 1-D array}.
+    # grid: full factorial, n levels for ranges without their own level count
+    # lhs : n samples, ranges are sampled uniformly and value lists by stratum
+    if Strategy == "grid":
+        Axes = []
+        for Range in Ranges.values():
+            if isinstance(Range, list):
+                Axes.append(np.asarray(Range, dtype=float))
+            else:
+                Axes.append(np.linspace(Range[0], Range[1], int(Range[2]) if len(Range) > 2 else n))
+        Mesh = np.meshgrid(*Axes, indexing="ij")
+        return {name: Values.ravel() for name, Values in zip(Ranges, Mesh)}
+    elif Strategy == "lhs":
+        U = latin_hypercube(n, len(Ranges), seed)
+        Samples = {}
+        for j, (name, Range) in enumerate(Ranges.items()):
+            if isinstance(Range, list):
+                Samples[name] = np.asarray(Range, dtype=float)[(U[:, j]*len(Range)).astype(int)]
+            else:
+                Samples[name] = Range[0] + U[:, j]*(Range[1] - Range[0])
+        return Samples
+    raise ValueError("Sampling strategy should be grid or lhs: " + str(Strategy))
+
+def _write_variants(Job):
+    # Worker: write the folders of one chunk of samples, return the number of bytes written
+    Path, Rows, is_meter, Deck, Include = Job
+    Density = 2.4E-9
+    Poisson = 0.2
+    if is_meter == True:
+        Density = Density*1E12
+    written = 0
+    for Name, Values, Tables in Rows:
+        E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, Ref_Length = Values
+        # E of the table is in GPa
+        E = E*1000.*1E6 if is_meter == True else E*1000.
+        Folder = os.path.join(Path, Name)
+        os.makedirs(Folder, exist_ok=True)
+        MatFile = os.path.join(Folder, "CDP_Mat.inp")
+        written += COMat_Generator.write_definition(MatFile, "CDP", E, Density, Poisson, S_cu, e_cu, e_60, Alpha,
+                                                    S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory,
+                                                    Ref_Length, Tables)
+        if Deck is not None:
+            Output = os.path.join(Folder, os.path.basename(Deck))
+            COMat_Deck.inject_material(Deck, Output, MatFile, "CDP", Include, Indexed=True)
+            written += os.path.getsize(Output)
+    return written
+
+def sweep(Path, Nominal, Ranges, Strategy="grid", n=5, seed=0, is_meter=False, Workers=None,
+          Deck=None, Include=False, chunk=64):
+    # Write one folder per valid sample and the manifest. Return (manifest path, samples, valid samples)
+    unknown = set(Ranges) - set(COMat_Generator.BATCH_COLUMNS)
+    if unknown:
+        raise ValueError("Unknown sweep parameters: " + ", ".join(sorted(unknown)))
+    Samples = sample(Ranges, Strategy, n, seed)
+    m = next(iter(Samples.values())).size if Samples else 1
+    Table = {key: np.full(m, float(Nominal[key])) for key in COMat_Generator.BATCH_COLUMNS}
+    Table.update(Samples)
+    Names = ["Sweep_" + str(i+1).zfill(len(str(m))) for i in range(m)]
+
+    # Invalid combinations are reported, not raised
+    E = Table["E"]*1000.
+    valid_cu, valid_end = COMat_Generator.batch_validity(E, Table["S_cu"], Table["e_cu"], Table["S_tu"], Table["e_end"])
+    Status = np.where(~valid_cu, "Skipped: e_cu outside (S_cu/E, 2*S_cu/E)",
+                      np.where(~valid_end, "Skipped: e_end not above S_tu/E", "OK"))
+    Valid = np.flatnonzero(valid_cu & valid_end)
+
+    os.makedirs(Path, exist_ok=True)
+    if Valid.size > 0:
+        # Every curve in one vectorized pass, the workers only format and write
+        Curves = COMat_Generator.batch_curves(E[Valid], *[Table[key][Valid] for key in
+                                              ("S_cu", "e_cu", "e_60", "Alpha", "S_tu", "e_end", "Beta", "Ref_Length")])
+        Rows = [(Names[i], [float(Table[key][i]) for key in COMat_Generator.BATCH_COLUMNS], COMat_Generator.batch_tables(Curves, k))
+                for k, i in enumerate(Valid)]
+        if Deck is not None:
+            # Built once here, the workers find it in the cache next to the deck
+            COMat_Deck.load_index(Deck)
+        Jobs = [(Path, Rows[k:k+chunk], is_meter, Deck, Include) for k in range(0, len(Rows), chunk)]
+        if Workers == 1:
+            list(map(_write_variants, Jobs))
+        else:
+            with ProcessPoolExecutor(max_workers=Workers) as pool:
+                list(pool.map(_write_variants, Jobs))
+
+    FilePathName = os.path.join(Path, MANIFEST)
+    with open(FilePathName, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(("Name",) + COMat_Generator.BATCH_COLUMNS + ("Status",))
+        for i in range(m):
+            writer.writerow([Names[i]] + [repr(float(Table[key][i])) for key in COMat_Generator.BATCH_COLUMNS] + [Status[i]])
+    return FilePathName, m, Valid.size
+
+def parse_range(text):
+    # "e_60=0.003:0.008" (range), "Alpha=1.5:3:4" (range with 4 grid levels) or "Beta=1,1.5,2" (values)
+    name, sep, spec = text.partition("=")
+    name = ALIASES.get(name.strip(), name.strip())
+    try:
+        if ":" in spec:
+            Range = tuple(float(value) for value in spec.split(":"))
+            if len(Range) not in (2, 3):
+                raise ValueError
+        else:
+            Range = [float(value) for value in spec.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected NAME=LOW:HIGH[:LEVELS] or NAME=V1,V2,...: " + text)
+    if sep == "" or name == "":
+        raise argparse.ArgumentTypeError("expected NAME=LOW:HIGH[:LEVELS] or NAME=V1,V2,...: " + text)
+    return name, Range
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep CDP parameters and write one material (and deck) per sample")
+    parser.add_argument("--vary", type=parse_range, action="append", default=[], metavar="NAME=RANGE",
+                        help="Swept parameter, NAME=LOW:HIGH[:LEVELS] or NAME=V1,V2,... (repeat for more)")
+    parser.add_argument("--strategy", default="grid", choices=["grid", "lhs"], help="Sampling strategy (default: grid)")
+    parser.add_argument("--samples", type=int, default=5, help="lhs: number of samples, grid: levels per range (default: 5)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the Latin hypercube")
+    parser.add_argument("--out", default="Sweep", help="Output directory (default: Sweep)")
+    parser.add_argument("--deck", help="Abaqus deck copied into every sample folder with its material")
+    parser.add_argument("--include", action="store_true", help="Reference CDP_Mat.inp from the deck with *Include")
+    parser.add_argument("--meter", action="store_true", help="Dimension is in meter")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes (default: all cores)")
+    group = parser.add_argument_group("nominal parameters")
+    for key in COMat_Generator.BATCH_COLUMNS:
+        group.add_argument("--" + key, type=float, default=DEFAULTS[key])
+    args = parser.parse_args(argv)
+    if not args.vary:
+        parser.error("at least one --vary is required")
+
+    Nominal = {key: getattr(args, key) for key in COMat_Generator.BATCH_COLUMNS}
+    try:
+        Manifest, m, valid = sweep(args.out, Nominal, dict(args.vary), args.strategy, args.samples, args.seed,
+                                   args.meter, args.workers, args.deck, args.include)
+    except (ValueError, OSError) as e:
+        print("Error: " + str(e), file=sys.stderr)
+        return 1
+    print("{} samples, {} written, {} skipped, manifest: {}".format(m, valid, m - valid, Manifest))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,436 @@
+"""
+Source code for COMat_Timestep: Stable time increment and mass scaling estimate of an explicit deck
+
+Author: Youngbin LIM
+Contact: lyb0684@naver.com
+
+Abaqus/Explicit is conditionally stable: no element may be crossed by a dilatational wave
+within one increment, dt = L/c*(sqrt(1 + b1^2) - b1) with the linear bulk viscosity b1 of
+the step. The mesh, sections and materials (*Density, *Elastic, also from *Include files
+such as the CDP_Mat.inp written by generate()) of the deck give per element:
+    - solid (C3D4/6/8/10/15/20, any suffix): L = smallest height (volume over face area),
+      c = sqrt(E*(1-v)/(rho*(1+v)*(1-2*v)))
+    - shell (S3, S4, any suffix): L = area over longest edge (twice for triangles),
+      c = sqrt(E/(rho*(1-v^2)))
+    - beam and truss (B21, B22, B31, B32, T2D2, T3D2): L = length, c = sqrt(E/rho)
+Reported are the critical elements and, for every *Dynamic, Explicit step, the stable
+increment, the expected number of increments and the mass added by the *Variable (or
+*Fixed) Mass Scaling dt of the step. Element by element estimates are conservative, the
+global estimate of Abaqus is usually somewhat larger.
+
+    python COMat_Timestep.py Cyclic_Loading.inp
+
+Target increment instead of the mass scaling of the deck, CDP properties of a new material file:
+    python COMat_Timestep.py 3-Point-Bending.inp --dt 2E-6 --material-file ./Mat/CDP_Mat.inp --top 20
+"""
+
+import os
+import sys
+import json
+import math
+import mmap
+import argparse
+
+import numpy as np
+
+import COMat_Deck
+import COMat_Mesh
+
+SOLID, SHELL, BEAM = "solid", "shell", "beam"
+
+# Shell, beam and truss type prefix: (nodes per element, kind), longest prefix first
+LINE_SURFACE_ELEMENTS = (
+    ("T2D2", 2, BEAM), ("T3D2", 2, BEAM), ("B21", 2, BEAM), ("B22", 3, BEAM), ("B31", 2, BEAM), ("B32", 3, BEAM),
+    ("S3", 3, SHELL), ("S4", 4, SHELL),
+)
+
+# Faces of the corner nodes and the factor turning volume / face area into a height
+HEX_FACES = (((0, 1, 2, 3), 1.), ((4, 5, 6, 7), 1.), ((0, 1, 5, 4), 1.), ((1, 2, 6, 5), 1.), ((2, 3, 7, 6), 1.), ((3, 0, 4, 7), 1.))
+WEDGE_FACES = (((0, 1, 2), 1.), ((3, 4, 5), 1.), ((0, 1, 4, 3), 2.), ((1, 2, 5, 4), 2.), ((2, 0, 3, 5), 2.))
+TET_FACES = (((0, 1, 2), 3.), ((0, 1, 3), 3.), ((1, 2, 3), 3.), ((0, 2, 3), 3.))
+SOLID_FACES = {8: HEX_FACES, 6: WEDGE_FACES, 4: TET_FACES}
+
+# Linear bulk viscosity of Abaqus/Explicit when the step does not set one
+DEFAULT_BULK_VISCOSITY = 0.06
+
+# Elements per vectorized block, bounds the memory of the nodal coordinate arrays
+CHUNK = 200000
+
+def explicit_element(Type):
+    # (nodes per element, kind, tetrahedra of solids) of a supported element type, None for other types
+    Solid = COMat_Mesh.solid_element(Type)
+    if Solid is not None:
+        return Solid[0], SOLID, Solid[1]
+    for prefix, nodes, kind in LINE_SURFACE_ELEMENTS:
+        if Type.upper().startswith(prefix):
+            return nodes, kind, None
+    return None
+
+###########################
+## Parameters and values ##
+###########################
+
+def read_parameters(mm, Index):
+    # *Parameter values, evaluated in order as Python expressions with the math functions like Abaqus does
+    Params = {}
+    Namespace = {name: getattr(math, name) for name in dir(math) if not name.startswith("_")}
+    for i in Index.find("parameter"):
+        for line in COMat_Mesh._data(mm, Index, i).decode("latin-1").splitlines():
+            name, sep, expression = line.partition("=")
+            if not sep:
+                continue
+            try:
+                Params[name.strip()] = eval(expression, {"__builtins__": {}}, dict(Namespace, **Params))
+            except Exception:
+                # Expressions this estimate cannot evaluate are only a problem when used below
+                continue
+    return Params
+
+def _value(text, Params):
+    # Number or <parameter>
+    text = text.strip()
+    if text.startswith("<") and text.endswith(">"):
+        if text[1:-1] not in Params:
+            raise ValueError("Parameter " + text + " is not defined by *Parameter")
+        return float(Params[text[1:-1]])
+    return float(text)
+
+def _row(mm, Index, i, Params):
+    # Values of the first data line of keyword i, None for empty fields
+    line = COMat_Mesh._data(mm, Index, i).split(b"\n", 1)[0].decode("latin-1").strip()
+    return [_value(field, Params) if field.strip() else None for field in line.split(",")] if line else []
+
+def read_materials(Deck, Index=None, Params=None, Materials=None):
+    # {upper-case name: {"Density", "E", "v"}} of the deck and of the files it includes
+    Index = COMat_Deck.load_index(Deck, Cache=False) if Index is None else Index
+    Params = {} if Params is None else Params
+    Materials = {} if Materials is None else Materials
+    if Index.Size == 0:
+        return Materials
+    Current = None
+    with open(Deck, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for i, (keyword, params) in enumerate(Index.Keywords):
+            if keyword == "material":
+                Current = Materials.setdefault(params.get("name", "").upper(), {})
+            elif keyword == "include" and "input" in params:
+                Include = os.path.join(os.path.dirname(os.path.abspath(Deck)), params["input"])
+                if os.path.isfile(Include):
+                    read_materials(Include, None, Params, Materials)
+                Current = None
+            elif keyword not in COMat_Deck.MATERIAL_OPTIONS:
+                Current = None
+            elif Current is not None and keyword == "density":
+                Current["Density"] = _row(mm, Index, i, Params)[0]
+            elif Current is not None and keyword == "elastic" and params.get("type", "isotropic").lower() == "isotropic":
+                Row = _row(mm, Index, i, Params)
+                Current["E"], Current["v"] = Row[0], (Row[1] if len(Row) > 1 and Row[1] is not None else 0.0)
+    return Materials
+
+def read_steps(mm, Index, Params):
+    # [{"Name", "Period", "DT", "Type", "b1"}] of the *Dynamic, Explicit steps, DT None without mass scaling
+    Steps = []
+    Current = None
+    for i, (keyword, params) in enumerate(Index.Keywords):
+        if keyword == "step":
+            Current = {"Name": params.get("name", "Step-" + str(len(Steps)+1)), "Explicit": False, "Period": 1.0,
+                       "DT": None, "Type": "below min", "b1": DEFAULT_BULK_VISCOSITY}
+        elif Current is None:
+            continue
+        elif keyword == "dynamic" and "explicit" in params:
+            Current["Explicit"] = True
+            Row = _row(mm, Index, i, Params)
+            if len(Row) > 1 and Row[1] is not None:
+                Current["Period"] = Row[1]
+        elif keyword in ("variable mass scaling", "fixed mass scaling") and "dt" in params:
+            Current["DT"] = _value(params["dt"], Params)
+            Current["Type"] = " ".join(params.get("type", "below min").lower().split())
+        elif keyword == "bulk viscosity":
+            Row = _row(mm, Index, i, Params)
+            if Row and Row[0] is not None:
+                Current["b1"] = Row[0]
+        elif keyword == "end step":
+            if Current.pop("Explicit"):
+                Steps.append(Current)
+            Current = None
+    return Steps
+
+##########################
+## Element measurements ##
+##########################
+
+# Coordinates are laid out (3, corner nodes, elements) so that every component is a contiguous row
+
+def _cross(u, v):
+    return np.array((u[1]*v[2] - u[2]*v[1], u[2]*v[0] - u[0]*v[2], u[0]*v[1] - u[1]*v[0]))
+
+def _norm(u):
+    return np.sqrt(u[0]*u[0] + u[1]*u[1] + u[2]*u[2])
+
+def _area(X, face):
+    # Area of a triangle or (through its diagonals) of a quadrilateral of every element
+    if len(face) == 3:
+        a, b, c = face
+        return 0.5*_norm(_cross(X[:, b]-X[:, a], X[:, c]-X[:, a]))
+    a, b, c, d = face
+    return 0.5*_norm(_cross(X[:, c]-X[:, a], X[:, d]-X[:, b]))
+
+def solid_geometry(X, tets):
+    # Volume and smallest height of solid elements, tets as in COMat_Mesh.tet_volumes
+    V = np.zeros(X.shape[2])
+    for a, b, c, d in tets:
+        u, w = X[:, b]-X[:, a], _cross(X[:, c]-X[:, a], X[:, d]-X[:, a])
+        V += (u[0]*w[0] + u[1]*w[1] + u[2]*w[2])/6.0
+    V = np.abs(V)
+    L = np.full(V.size, np.inf)
+    for face, factor in SOLID_FACES[X.shape[1]]:
+        L = np.minimum(L, factor*V/_area(X, face))
+    return V, L
+
+def shell_geometry(X):
+    # Area and area over the longest edge (twice for triangles) of shell elements
+    n = X.shape[1]
+    A = _area(X, tuple(range(n)))
+    Edge = np.max([_norm(X[:, (k+1) % n] - X[:, k]) for k in range(n)], axis=0)
+    return A, (2.0 if n == 3 else 1.0)*A/Edge
+
+def beam_geometry(X):
+    # Length between the end nodes of beam and truss elements
+    L = _norm(X[:, -1] - X[:, 0])
+    return L, L
+
+def beam_area(Type, Data):
+    # Area of a *Beam Section profile from its first data line, None for profiles not handled here
+    Type = Type.upper()
+    if Type == "CIRC" and len(Data) >= 1:
+        return math.pi*Data[0]**2
+    if Type == "RECT" and len(Data) >= 2:
+        return Data[0]*Data[1]
+    if Type == "PIPE" and len(Data) >= 2:
+        return math.pi*(Data[0]**2 - (Data[0]-Data[1])**2)
+    if Type == "BOX" and len(Data) >= 6:
+        return Data[0]*Data[1] - (Data[0]-Data[3]-Data[5])*(Data[1]-Data[2]-Data[4])
+    return None
+
+def part_geometry(Part):
+    # Sorted element labels with their kind, measure (volume, area or length) and characteristic length
+    NodeLabels = np.concatenate([Labels for Labels, _ in Part.Nodes])
+    Coords = np.concatenate([XYZ for _, XYZ in Part.Nodes])
+    if Coords.shape[1] < 3:
+        Coords = np.pad(Coords, ((0, 0), (0, 3 - Coords.shape[1])))
+    Coords = np.ascontiguousarray(Coords.T)
+    Row = np.full(NodeLabels.max()+1, -1, dtype=np.int64)
+    Row[NodeLabels] = np.arange(NodeLabels.size)
+
+    Labels, Types, Kinds, Measures, Lengths = [], [], [], [], []
+    for Type, ElementLabels, Connectivity in Part.Elements:
+        nodes, kind, tets = explicit_element(Type)
+        corners = {SOLID: max(max(tet) for tet in tets)+1 if tets else nodes, SHELL: nodes, BEAM: nodes}[kind]
+        for start in range(0, ElementLabels.size, CHUNK):
+            Rows = Row[Connectivity[start:start+CHUNK, :corners]]
+            if np.any(Rows < 0):
+                raise ValueError("Elements of part " + Part.Name + " use undefined nodes")
+            X = Coords[:, Rows.T]
+            if kind == SOLID:
+                Measure, Length = solid_geometry(X, tets)
+            elif kind == SHELL:
+                Measure, Length = shell_geometry(X)
+            else:
+                Measure, Length = beam_geometry(X)
+            Measures.append(Measure)
+            Lengths.append(Length)
+        Labels.append(ElementLabels)
+        Types.append(np.full(ElementLabels.size, Type, dtype=object))
+        Kinds.append(np.full(ElementLabels.size, kind, dtype=object))
+
+    Labels = np.concatenate(Labels)
+    Order = np.argsort(Labels, kind='stable')
+    return {"Label": Labels[Order], "Type": np.concatenate(Types)[Order], "Kind": np.concatenate(Kinds)[Order],
+            "Measure": np.concatenate(Measures)[Order], "Length": np.concatenate(Lengths)[Order]}
+
+def wave_speed(Kind, E, v, rho):
+    # Dilatational wave speed of solids, plane stress speed of shells, bar speed of beams and trusses
+    return np.where(Kind == SOLID, np.sqrt(E*(1-v)/(rho*(1+v)*(1-2*v))),
+                    np.where(Kind == SHELL, np.sqrt(E/(rho*(1-v*v))), np.sqrt(E/rho)))
+
+def element_table(Deck, MaterialFiles=()):
+    # Every element with a section: part, label, type, material, instances, length, mass and
+    # stable increment without bulk viscosity. Return (table, parameters, explicit steps).
+    Index = COMat_Deck.load_index(Deck)
+    with open(Deck, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        Params = read_parameters(mm, Index)
+        Steps = read_steps(mm, Index, Params)
+        Sections = {i: _row(mm, Index, i, Params) for i, (keyword, params) in enumerate(Index.Keywords)
+                    if keyword.endswith("section") and "elset" in params}
+    Materials = read_materials(Deck, Index, Params)
+    for MaterialFile in MaterialFiles:
+        Materials.update(read_materials(MaterialFile, None, Params))
+
+    # Copies of every part in the assembly, a deck without parts is its own single instance
+    Instances = {"": 1}
+    for keyword, params in Index.Keywords:
+        if keyword == "instance" and "part" in params:
+            Instances[params["part"].upper()] = Instances.get(params["part"].upper(), 0) + 1
+
+    Columns = {key: [] for key in ("Part", "Label", "Type", "Kind", "Material", "Instances", "Length", "Mass", "Speed")}
+    for Part in COMat_Mesh.read_parts(Deck, Index, explicit_element).values():
+        Count = Instances.get(Part.Name.upper(), 0)
+        if Count == 0 or not Part.Nodes or not Part.Elements:
+            continue
+        Geometry = part_geometry(Part)
+        Assigned = np.full(Geometry["Label"].size, -1)
+        Section = np.zeros(Geometry["Label"].size)
+        Names = []
+        for i in Part.Sections:
+            keyword, params = Index.Keywords[i]
+            if "material" not in params:
+                continue
+            Members = Part.elset(params["elset"])
+            Position = np.clip(np.searchsorted(Geometry["Label"], Members), 0, Geometry["Label"].size-1)
+            Position = Position[Geometry["Label"][Position] == Members]
+            if Position.size == 0:
+                continue
+            Data = Sections[i]
+            # Mass per measure: 1 for solids, thickness of shells, area of beams and trusses
+            if keyword == "shell section":
+                factor = Data[0] if Data and Data[0] is not None else np.nan
+            elif keyword == "beam section":
+                factor = beam_area(params.get("section", ""), [x for x in Data if x is not None])
+                factor = np.nan if factor is None else factor
+            elif keyword == "solid section" and np.any(Geometry["Kind"][Position] == BEAM):
+                factor = Data[0] if Data and Data[0] is not None else 1.0
+            else:
+                factor = 1.0
+            Assigned[Position] = len(Names)
+            Section[Position] = factor
+            Names.append(params["material"])
+
+        Keep = Assigned >= 0
+        for name in set(Names):
+            Material = Materials.get(name.upper(), {})
+            if "Density" not in Material or "E" not in Material:
+                raise ValueError("Material " + name + " needs *Density and isotropic *Elastic for the stable increment")
+        Material = np.array(Names + [""], dtype=object)[Assigned[Keep]]
+        Props = np.array([[Materials[name.upper()][key] for key in ("E", "v", "Density")] for name in Names] or np.zeros((0, 3)))
+        E, v, rho = Props[Assigned[Keep]].T
+        Kind = Geometry["Kind"][Keep]
+        Columns["Part"].append(np.full(Kind.size, Part.Name, dtype=object))
+        Columns["Label"].append(Geometry["Label"][Keep])
+        Columns["Type"].append(Geometry["Type"][Keep])
+        Columns["Kind"].append(Kind)
+        Columns["Material"].append(Material)
+        Columns["Instances"].append(np.full(Kind.size, Count))
+        Columns["Length"].append(Geometry["Length"][Keep])
+        Columns["Mass"].append(rho*Geometry["Measure"][Keep]*Section[Keep])
+        Columns["Speed"].append(wave_speed(Kind, E, v, rho))
+
+    if not Columns["Label"]:
+        raise ValueError("No solid, shell or beam element with a section and material in " + Deck)
+    Table = {key: np.concatenate(value) for key, value in Columns.items()}
+    Table["dt"] = Table["Length"]/Table["Speed"]
+    return Table, Params, Steps
+
+##################
+## Mass scaling ##
+##################
+
+def viscosity_factor(b1):
+    # Reduction of the stable increment by the linear bulk viscosity (fraction of critical damping b1)
+    return math.sqrt(1 + b1*b1) - b1
+
+def mass_scaling(dt, Mass, Instances, DT=None, Type="below min"):
+    # Stable increment of the model after mass scaling to DT, elements scaled (with their instances)
+    # and added mass over the mass of the elements with a known section
+    Weight = np.where(np.isfinite(Mass), Mass, 0.0)*Instances
+    Total = Weight.sum()
+    dt_min = dt.min()
+    if DT is None:
+        return {"Increment": dt_min, "Scaled": 0, "Added": 0.0}
+    if Type == "uniform":
+        Scale = np.full(dt.size, max((DT/dt_min)**2, 1.0))
+        Increment = max(dt_min, DT)
+    elif Type == "set equal dt":
+        Scale = (DT/dt)**2
+        Increment = DT
+    else:
+        Scale = np.maximum((DT/dt)**2, 1.0)
+        Increment = max(dt_min, DT)
+    Added = np.sum(Weight*(Scale - 1))
+    return {"Increment": Increment, "Scaled": int(np.sum(Instances[Scale != 1])),
+            "Added": float(Added/Total) if Total > 0 else float("nan")}
+
+def estimate(Deck, MaterialFiles=(), DT=None, Type=None, Top=10):
+    # Report of the deck: elements, per material minimum, critical elements and per step increments.
+    # DT / Type replace the mass scaling of every explicit step.
+    Table, Params, Steps = element_table(Deck, MaterialFiles)
+    if not Steps:
+        Steps = [{"Name": "(no explicit step)", "Period": 1.0, "DT": None, "Type": "below min", "b1": DEFAULT_BULK_VISCOSITY}]
+    factor = viscosity_factor(Steps[0]["b1"])
+
+    Materials = []
+    for name in sorted(set(Table["Material"])):
+        Mine = Table["Material"] == name
+        Materials.append({"Material": name, "Elements": int(np.sum(Table["Instances"][Mine])),
+                          "Min_dt": float(Table["dt"][Mine].min()*factor), "Median_dt": float(np.median(Table["dt"][Mine])*factor)})
+
+    n = min(Top, Table["dt"].size)
+    Critical = np.argpartition(Table["dt"], n-1)[:n] if n > 0 else np.zeros(0, dtype=np.int64)
+    Critical = Critical[np.argsort(Table["dt"][Critical], kind='stable')]
+    Elements = [{"Part": Table["Part"][i], "Element": int(Table["Label"][i]), "Type": Table["Type"][i],
+                 "Material": Table["Material"][i], "Length": float(Table["Length"][i]), "dt": float(Table["dt"][i]*factor)}
+                for i in Critical]
+
+    Report = []
+    for Step in Steps:
+        dt = Table["dt"]*viscosity_factor(Step["b1"])
+        Target, Kind = (Step["DT"], Step["Type"]) if DT is None else (DT, Type or "below min")
+        Scaling = mass_scaling(dt, Table["Mass"], Table["Instances"], Target, Kind)
+        Report.append({"Step": Step["Name"], "Period": Step["Period"], "DT": Target, "Type": Kind if Target else None,
+                       "Stable_dt": float(dt.min()), "Increment": float(Scaling["Increment"]),
+                       "Increments": int(math.ceil(Step["Period"]/Scaling["Increment"])),
+                       "Scaled_Elements": Scaling["Scaled"], "Added_Mass": Scaling["Added"]})
+
+    return {"Deck": Deck, "Elements": int(np.sum(Table["Instances"])),
+            "Mass": float(np.sum(np.where(np.isfinite(Table["Mass"]), Table["Mass"], 0.0)*Table["Instances"])),
+            "Materials": Materials, "Critical": Elements, "Steps": Report}
+
+def print_report(Report):
+    print("{}: {} elements, mass {:.4g}".format(Report["Deck"], Report["Elements"], Report["Mass"]))
+    print("{:<16}{:>10}{:>14}{:>14}".format("Material", "Elements", "Min dt", "Median dt"))
+    for Row in Report["Materials"]:
+        print("{Material:<16}{Elements:>10}{Min_dt:>14.4g}{Median_dt:>14.4g}".format(**Row))
+    print("Critical elements:")
+    print("{:<16}{:>10}{:>10}{:>16}{:>12}{:>14}".format("Part", "Element", "Type", "Material", "Length", "dt"))
+    for Row in Report["Critical"]:
+        print("{Part:<16}{Element:>10}{Type:>10}{Material:>16}{Length:>12.4g}{dt:>14.4g}".format(**Row))
+    print("{:<28}{:>10}{:>12}{:>12}{:>12}{:>12}{:>10}{:>12}".format(
+        "Step", "Period", "Stable dt", "DT", "Increment", "Increments", "Scaled", "Added mass"))
+    for Row in Report["Steps"]:
+        print("{:<28}{:>10.4g}{:>12.4g}{:>12}{:>12.4g}{:>12}{:>10}{:>11.4g}%".format(
+            Row["Step"], Row["Period"], Row["Stable_dt"], "-" if Row["DT"] is None else "{:.4g}".format(Row["DT"]),
+            Row["Increment"], Row["Increments"], Row["Scaled_Elements"], 100*Row["Added_Mass"]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stable time increment and mass scaling estimate of an Abaqus/Explicit deck")
+    parser.add_argument("deck", help="Abaqus input deck")
+    parser.add_argument("--material-file", action="append", default=[],
+                        help="Material file (e.g. CDP_Mat.inp) overriding the materials of the deck, may be repeated")
+    parser.add_argument("--dt", type=float, help="Target increment for mass scaling instead of the dt of the steps")
+    parser.add_argument("--type", default="below min", choices=["below min", "uniform", "set equal dt"],
+                        help="Mass scaling type with --dt (default: below min)")
+    parser.add_argument("--top", type=int, default=10, help="Number of critical elements listed (default: 10)")
+    parser.add_argument("--out", metavar="REPORT.json", help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        Report = estimate(args.deck, args.material_file, args.dt, args.type, args.top)
+    except (ValueError, OSError) as e:
+        print("Error: " + str(e), file=sys.stderr)
+        return 1
+    print_report(Report)
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(Report, f, indent=1)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,13 +6,98 @@ Contact: lyb0684@naver.com
 """
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTabWidget, QWidget,
                              QVBoxLayout, QLabel, QLineEdit, QPushButton, QFileDialog,
-                             QHBoxLayout, QGridLayout, QDesktopWidget, QMessageBox, QCheckBox)
-from PyQt5.QtGui import QPixmap, QFont
-from PyQt5.QtCore import Qt
+                             QHBoxLayout, QGridLayout, QDesktopWidget, QMessageBox, QCheckBox, QSplitter)
+from PyQt5.QtGui import QPixmap, QFont, QImageReader
+from PyQt5.QtCore import Qt, QSize, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
 from PyQt5.QtGui import QIcon
 import sys
 import os
-import COMat_Generator
+
+# Scaled figures, shared by every window so that each image is decoded and scaled only once
+_pixmap_cache = {}
+
+def load_pixmap(img_path, width, height):
+    key = (img_path, width, height)
+    if key not in _pixmap_cache:
+        pixmap = QPixmap(img_path)
+        _pixmap_cache[key] = pixmap.scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    return _pixmap_cache[key]
+
+class LazyPixmapLabel(QLabel):
+    # QLabel that decodes its figure the first time it is shown (e.g. when its tab is opened)
+    def __init__(self, img_path, width, height, parent=None):
+        super().__init__(parent)
+        self.img_path = img_path
+        self.img_width = width
+        self.img_height = height
+        self.loaded = False
+
+        # Reserve the final size from the image header without decoding it
+        size = QImageReader(img_path).size()
+        if size.isValid():
+            self.setMinimumSize(size.scaled(QSize(width, height), Qt.KeepAspectRatio))
+
+    def showEvent(self, event):
+        if not self.loaded:
+            self.setPixmap(load_pixmap(self.img_path, self.img_width, self.img_height))
+            self.loaded = True
+        super().showEvent(event)
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal(object)
+    error = pyqtSignal(str)
+
+class Worker(QRunnable):
+    # Runs fn(*args) on the thread pool, the result or the error message is signalled back to the GUI thread
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args)
+        except ValueError as ve:
+            self.signals.error.emit(str(ve))
+        except Exception as e:
+            self.signals.error.emit(f"An error occurred: {str(e)}")
+        else:
+            self.signals.finished.emit(result)
+
+class PlotPanel(QWidget):
+    # Compression and tension curves drawn on an embedded matplotlib canvas
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # matplotlib is loaded with the first plot, pyplot is never used in the GUI
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+
+        self.figure = Figure(figsize=(12, 4))
+        self.canvas = FigureCanvasQTAgg(self.figure)
+        self.canvas.setMinimumHeight(250)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.canvas)
+
+        self.axs = None
+        self.lines = None
+
+    def showCurves(self, Curves):
+        import COMat_Generator
+        if self.lines is None:
+            self.axs = self.figure.subplots(nrows=1, ncols=2)
+            self.lines = COMat_Generator.draw_curves(self.axs, Curves)
+            self.figure.tight_layout()
+        else:
+            # Later updates only replace the line data, the figure is not rebuilt
+            for ax, line, (e, S) in zip(self.axs, self.lines, ((Curves.e_c_total, Curves.S_c_total),
+                                                                (Curves.e_t_total, Curves.S_t_total))):
+                line.set_data(e, S)
+                ax.relim()
+                ax.autoscale_view()
+        self.canvas.draw_idle()
 
 class App(QMainWindow):
     def __init__(self):
@@ -33,7 +118,12 @@ class App(QMainWindow):
 
         # Create a vertical layout for the central widget
         self.main_layout = QVBoxLayout(self.central_widget)
-        self.main_layout.addWidget(self.tab_widget)
+
+        # Parameter tabs on top, the plot panel is added below on the first plot
+        self.splitter = QSplitter(Qt.Vertical)
+        self.splitter.addWidget(self.tab_widget)
+        self.main_layout.addWidget(self.splitter)
+        self.plot_panel = None
 
         # Create and add buttons to the layout
         self.createButtons()
@@ -72,6 +162,13 @@ class App(QMainWindow):
     def showUsageHintsWindow(self):
         self.usage_hints_window = UsageHintsWindow()
         self.usage_hints_window.show()
+
+    def showCurves(self, Curves):
+        if self.plot_panel is None:
+            self.plot_panel = PlotPanel(self)
+            self.splitter.addWidget(self.plot_panel)
+            self.resize(self.width(), max(self.height(), 900))
+        self.plot_panel.showCurves(Curves)
         
     def showDeveloperWindow(self):
         self.developer_window = DeveloperWindow()
@@ -157,11 +254,8 @@ class UsageHintsWindow(QMainWindow):
             subTab = QWidget()
             subTab.layout = QVBoxLayout(subTab)
     
-            # Load and set the image
-            pixmap = QPixmap(compression_images[i-1])
-            pixmap = pixmap.scaled(1000, 500, Qt.KeepAspectRatio, Qt.SmoothTransformation)  # Set the size of the image
-            lbl = QLabel(self)
-            lbl.setPixmap(pixmap)
+            # The image is loaded when the sub-tab is first shown
+            lbl = LazyPixmapLabel(compression_images[i-1], 1000, 500, self)  # Set the size of the image
             subTab.layout.addWidget(lbl)
             subTab.setLayout(subTab.layout)
             self.compressionSubTabs.addTab(subTab, str(i))
@@ -188,11 +282,8 @@ class UsageHintsWindow(QMainWindow):
             subTab = QWidget()
             subTab.layout = QVBoxLayout(subTab)
         
-            # Load and set the image
-            pixmap = QPixmap(tension_images[i-1])
-            pixmap = pixmap.scaled(1000, 800, Qt.KeepAspectRatio, Qt.SmoothTransformation)  # Set the size of the image
-            lbl = QLabel(self)
-            lbl.setPixmap(pixmap)
+            # The image is loaded when the sub-tab is first shown
+            lbl = LazyPixmapLabel(tension_images[i-1], 1000, 800, self)  # Set the size of the image
             subTab.layout.addWidget(lbl)        
             subTab.setLayout(subTab.layout)
             self.tensionSubTabs.addTab(subTab, str(i))
@@ -211,10 +302,24 @@ class UsageHintsWindow(QMainWindow):
         self.show()
 
 class MyTabWidget(QTabWidget):
+    PREVIEW_DELAY = 200
+
     def __init__(self, parent):
         super(MyTabWidget, self).__init__(parent)
         self.parent = parent
         self.file_save_path_edit = None
+        # Curve computation and file writing run here, off the GUI thread
+        self.thread_pool = QThreadPool.globalInstance()
+        self.workers = set()
+
+        # Live preview: redrawn once the entries have not changed for PREVIEW_DELAY ms
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(self.PREVIEW_DELAY)
+        self.preview_timer.timeout.connect(self.updatePreview)
+        # Only the result of the latest request is drawn
+        self.preview_request = 0
+
         self.initUI()
 
     def initUI(self):
@@ -230,59 +335,91 @@ class MyTabWidget(QTabWidget):
         self.createTensileTab()
         self.createFileSavePathTab()
 
-    def handlePlotButtonClick(self):
+        for line_edit in self.compression_line_edits + self.tensile_line_edits:
+            line_edit.textChanged.connect(self.preview_timer.start)
+
+    def readParameters(self):
+        # Raises ValueError when an entry is not a number
+        E = float(self.compression_line_edits[0].text())
+        S_cu = float(self.compression_line_edits[1].text())
+        e_cu = float(self.compression_line_edits[2].text())
+        e_60 = float(self.compression_line_edits[3].text())
+        Alpha = float(self.compression_line_edits[4].text())
+        Tension_Recovery = float(self.compression_line_edits[5].text())
+
+        S_tu = float(self.tensile_line_edits[0].text())
+        e_end = float(self.tensile_line_edits[1].text())
+        Beta = float(self.tensile_line_edits[2].text())
+        Compression_Recovory = float(self.tensile_line_edits[3].text())
+        Ref_Length = float(self.tensile_line_edits[4].text())
+        return E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, Ref_Length
+
+    def startWorker(self, button, fn, args, on_finished):
+        # Run fn(*args) in the thread pool, button is disabled until the result is back
+        worker = Worker(fn, *args)
+        self.workers.add(worker)
+
+        def done():
+            self.workers.discard(worker)
+            button.setEnabled(True)
+
+        worker.signals.finished.connect(on_finished)
+        worker.signals.finished.connect(lambda result: done())
+        worker.signals.error.connect(lambda message: QMessageBox.critical(self, "Error", message))
+        worker.signals.error.connect(lambda message: done())
+        button.setEnabled(False)
+        self.thread_pool.start(worker)
+
+    def updatePreview(self):
+        import COMat_Generator
         try:
-            Path = self.file_save_path_edit.text()
-            is_meter = self.is_meter_checkbox.isChecked()
-            Plot_Graph = True
-        
-            E = float(self.compression_line_edits[0].text())
-            S_cu = float(self.compression_line_edits[1].text())
-            e_cu = float(self.compression_line_edits[2].text())
-            e_60 = float(self.compression_line_edits[3].text())
-            Alpha = float(self.compression_line_edits[4].text())
-            Tension_Recovery = float(self.compression_line_edits[5].text())
-
-            S_tu = float(self.tensile_line_edits[0].text())
-            e_end = float(self.tensile_line_edits[1].text())
-            Beta = float(self.tensile_line_edits[2].text())
-            Compression_Recovory = float(self.tensile_line_edits[3].text())
-            Ref_Length = float(self.tensile_line_edits[4].text())
-            COMat_Generator.plot(Path, Plot_Graph, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, is_meter, Ref_Length)
+            E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, Ref_Length = self.readParameters()
+        except ValueError:
+            # Entry is being typed, keep the last valid curves
+            return
+
+        self.preview_request += 1
+        request = self.preview_request
+
+        def show(Curves):
+            self.workers.discard(worker)
+            if request == self.preview_request:
+                self.parent.showCurves(Curves)
+
+        # Invalid parameter sets are skipped silently, the Plot button reports them
+        worker = Worker(COMat_Generator.compute_curves, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length)
+        self.workers.add(worker)
+        worker.signals.finished.connect(show)
+        worker.signals.error.connect(lambda message: self.workers.discard(worker))
+        self.thread_pool.start(worker)
 
+    def handlePlotButtonClick(self):
+        # NumPy and the generator are only loaded once they are needed
+        import COMat_Generator
+        try:
+            E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, Ref_Length = self.readParameters()
         except ValueError as ve:
             QMessageBox.critical(self, "Error", str(ve))
+            return
 
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
+        # Curves are computed in the worker and drawn on the embedded canvas
+        self.startWorker(self.parent.plot_button, COMat_Generator.compute_curves,
+                         (E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Ref_Length), self.parent.showCurves)
 
     def handleGenerateButtonClick(self):
+        import COMat_Generator
         try:
             Path = self.file_save_path_edit.text()
             is_meter = self.is_meter_checkbox.isChecked()
             Plot_Graph = True
-            
-            E = float(self.compression_line_edits[0].text())
-            S_cu = float(self.compression_line_edits[1].text())
-            e_cu = float(self.compression_line_edits[2].text())
-            e_60 = float(self.compression_line_edits[3].text())
-            Alpha = float(self.compression_line_edits[4].text())
-            Tension_Recovery = float(self.compression_line_edits[5].text())
-
-            S_tu = float(self.tensile_line_edits[0].text())
-            e_end = float(self.tensile_line_edits[1].text())
-            Beta = float(self.tensile_line_edits[2].text())
-            Compression_Recovory = float(self.tensile_line_edits[3].text())
-            Ref_Length = float(self.tensile_line_edits[4].text())
-
-            COMat_Generator.generate(Path, Plot_Graph, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, is_meter, Ref_Length)
-            QMessageBox.information(self, "Success", "Input File generated successfully!")
-       
+            E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, Ref_Length = self.readParameters()
         except ValueError as ve:
             QMessageBox.critical(self, "Error", str(ve))
-        
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
+            return
+
+        self.startWorker(self.parent.generate_button, COMat_Generator.generate,
+                         (Path, Plot_Graph, E, S_cu, e_cu, e_60, Alpha, S_tu, e_end, Beta, Tension_Recovery, Compression_Recovory, is_meter, Ref_Length),
+                         lambda result: QMessageBox.information(self, "Success", "Input File generated successfully!"))
 
     def createCompressionTab(self):
         self.tab1.layout = QGridLayout(self)
@@ -309,11 +446,9 @@ class MyTabWidget(QTabWidget):
             self.tab1.layout.addWidget(line_edit, i, 1)
             self.compression_line_edits.append(line_edit)
             
+        # The description figure is decoded when the tab is first shown
         img_path = os.path.join(os.path.dirname(__file__), 'Figs', 'Compressive_SS_Description.png')
-        pixmap = QPixmap(img_path)
-        pixmap = pixmap.scaled(800, 470, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        lbl = QLabel(self)
-        lbl.setPixmap(pixmap)
+        lbl = LazyPixmapLabel(img_path, 800, 470, self)
         self.tab1.layout.addWidget(lbl, 0, 2, len(parameters), 1)
 
         self.tab1.setLayout(self.tab1.layout)
@@ -342,11 +477,9 @@ class MyTabWidget(QTabWidget):
             self.tab2.layout.addWidget(line_edit, i, 1)
             self.tensile_line_edits.append(line_edit)
            
+        # The description figure is decoded when the tab is first shown
         img_path = os.path.join(os.path.dirname(__file__), 'Figs', 'Tensile_SS_Description.png')
-        pixmap = QPixmap(img_path)
-        pixmap = pixmap.scaled(800, 470, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        lbl = QLabel(self)
-        lbl.setPixmap(pixmap)
+        lbl = LazyPixmapLabel(img_path, 800, 470, self)
         self.tab2.layout.addWidget(lbl, 0, 2, len(parameters), 1)
 
         self.tab2.setLayout(self.tab2.layout)
@@ -0,0 +1,221 @@
+"""
+Source code for comat: Command line interface of COMat (no GUI, no plotting)
+
+Author: Youngbin LIM
+Contact: lyb0684@naver.com
+
+Single material, written like the "Generate Input File" button:
+    python CoMat_CLI.py --E 30 --S_cu 50 --e_cu 0.003 --out ./Mat
+
+Batch file (CSV, JSON or YAML), one library with one *Material per row:
+    python CoMat_CLI.py --batch Materials.csv --out ./Mat --library CDP_Lib.inp
+
+Batch file, one folder with CDP_Mat.inp per row (folder named after the Name column):
+    python CoMat_CLI.py --batch Materials.json --out ./Decks --per-material
+
+Write a copy of an existing deck with the generated material put in (see COMat_Deck.py):
+    python CoMat_CLI.py --E 30 --S_cu 50 --e_cu 0.003 --out ./Mat --deck 3-Point-Bending.inp
+
+Adaptive tables, as few rows as needed for a max stress error of 0.05 MPa (a warning is
+printed when even the finest grid misses it, e.g. steep Weibull branches with Alpha < 1):
+    python CoMat_CLI.py --E 30 --S_cu 50 --e_cu 0.003 --out ./Mat --tolerance 0.05
+
+Stage timers and counters as JSON, plus a cProfile dump (see COMat_Profile.py):
+    python CoMat_CLI.py --batch Materials.csv --out ./Mat --profile Profile.json --profile-dump Profile.prof
+
+Reuse files generated before with the same parameters (see COMat_Cache.py):
+    python CoMat_CLI.py --batch Materials.csv --out ./Decks --per-material --cache
+
+Batch columns follow COMat_Generator.BATCH_COLUMNS plus an optional Name column.
+Missing columns take the value of the corresponding flag.
+Exit code is 1 when the parameters fail the validity checks of generate().
+"""
+
+import os
+import sys
+import csv
+import json
+import argparse
+
+import COMat_Generator
+import COMat_Deck
+import COMat_Profile
+import COMat_Cache
+from COMat_Generator import DEFAULTS, ALIASES
+
+def read_batch(FilePathName):
+    # Return a list of dicts, one per material
+    ext = os.path.splitext(FilePathName)[1].lower()
+    with open(FilePathName, newline='') as f:
+        if ext == ".csv":
+            Rows = [{key.strip(): value.strip() for key, value in row.items() if value is not None and value.strip() != ""}
+                    for row in csv.DictReader(f)]
+        elif ext == ".json":
+            Rows = json.load(f)
+        elif ext in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("Reading YAML batch files requires PyYAML (pip install pyyaml)")
+            Rows = yaml.safe_load(f)
+        else:
+            raise ValueError("Batch file should be .csv, .json, .yaml or .yml: " + FilePathName)
+
+    # {"materials": [...]} is accepted as well as a bare list
+    if isinstance(Rows, dict):
+        Rows = Rows.get("materials", Rows.get("Materials"))
+    if not isinstance(Rows, list) or not all(isinstance(row, dict) for row in Rows):
+        raise ValueError("Batch file should contain a list of materials: " + FilePathName)
+    return [{ALIASES.get(key, key): value for key, value in row.items()} for row in Rows]
+
+def complete_rows(Rows, Defaults):
+    # Fill missing columns from the command line values
+    Completed = []
+    for row in Rows:
+        unknown = set(row) - set(COMat_Generator.BATCH_COLUMNS) - {"Name"}
+        if unknown:
+            raise ValueError("Unknown batch columns: " + ", ".join(sorted(unknown)))
+        Full = {key: float(row.get(key, Defaults[key])) for key in COMat_Generator.BATCH_COLUMNS}
+        if "Name" in row:
+            Full["Name"] = str(row["Name"])
+        Completed.append(Full)
+    return Completed
+
+def put_in_deck(args, Path):
+    # Copy of args.deck in Path with the CDP material of Path/CDP_Mat.inp
+    Output = os.path.join(Path, os.path.basename(args.deck))
+    if os.path.abspath(Output) == os.path.abspath(args.deck):
+        raise ValueError("Output folder should differ from the folder of the deck: " + args.deck)
+    COMat_Deck.inject_material(args.deck, Output, os.path.join(Path, "CDP_Mat.inp"), args.material_name)
+    return Output
+
+def report(args, Name, Curves):
+    # Table size and achieved error of adaptive tables, Curves is None for files taken from the cache
+    if Curves is None:
+        if not args.quiet:
+            print(Name + ": from cache")
+    elif args.tolerance is not None:
+        if not args.quiet:
+            print("{}: compression {} rows (max error {:.3g} MPa), tension {} rows (max error {:.3g} MPa)".format(
+                Name, Curves.Rows_Comp, Curves.Error_Comp, Curves.Rows_Tens, Curves.Error_Tens))
+        if not Curves.Tolerance_Met:
+            print("Warning: {}: tolerance not met, max error {:.3g} MPa is above --tolerance {:g} MPa".format(
+                Name, max(Curves.Errors), args.tolerance), file=sys.stderr)
+
+def generate(args, Cache, Path, Values):
+    # generate() through the cache when --cache is given, return None for a cache hit
+    if Cache is None:
+        return COMat_Generator.generate(Path, False, *Values[:10], args.meter, Values[10], args.tolerance)
+    return Cache.generate(Path, *Values[:10], args.meter, Values[10], args.tolerance)
+
+def run(args):
+    Defaults = {key: getattr(args, key) for key in COMat_Generator.BATCH_COLUMNS}
+    os.makedirs(args.out, exist_ok=True)
+    if args.deck is not None and args.batch is not None and not args.per_material:
+        raise ValueError("--deck needs a single material or --per-material")
+    Cache = None
+    if args.cache is not None:
+        Cache = COMat_Cache.MaterialCache(args.cache or None, args.cache_size, args.cache_link)
+
+    if args.batch is None:
+        Curves = generate(args, Cache, args.out, [Defaults[key] for key in COMat_Generator.BATCH_COLUMNS])
+        report(args, "CDP_Mat", Curves)
+        Written = [os.path.join(args.out, "CDP_Mat.inp")]
+        if args.deck is not None:
+            Written.append(put_in_deck(args, args.out))
+        return Written
+
+    Rows = complete_rows(read_batch(args.batch), Defaults)
+    Names = [row.get("Name", "CDP_" + str(i+1)) for i, row in enumerate(Rows)]
+
+    if not args.per_material:
+        if Cache is not None:
+            return [Cache.generate_batch(args.out, Rows, args.meter, Names=Names, FileName=args.library,
+                                         Tolerance=args.tolerance)[0]]
+        return [COMat_Generator.generate_batch(args.out, Rows, args.meter, Names=Names, FileName=args.library,
+                                               Tolerance=args.tolerance)]
+
+    # Folders are named after the materials, so a repeated name (also in another case, for
+    # case-insensitive file systems) would overwrite the files of an earlier row
+    COMat_Generator.check_names(Names, len(Rows))
+    for Name in Names:
+        if Name in ("", ".", "..") or os.sep in Name or (os.altsep and os.altsep in Name):
+            raise ValueError("Material name cannot be used as a folder name: " + repr(Name))
+
+    Written = []
+    for Name, row in zip(Names, Rows):
+        Path = os.path.join(args.out, Name)
+        os.makedirs(Path, exist_ok=True)
+        try:
+            Curves = generate(args, Cache, Path, [row[key] for key in COMat_Generator.BATCH_COLUMNS])
+        except ValueError as ve:
+            raise ValueError("Material " + Name + ": " + str(ve))
+        report(args, Name, Curves)
+        Written.append(os.path.join(Path, "CDP_Mat.inp"))
+        if args.deck is not None:
+            Written.append(put_in_deck(args, Path))
+    return Written
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="comat", description="Generate Abaqus CDP material cards without the GUI")
+    parser.add_argument("--out", default=".", help="Output directory (default: current directory)")
+    parser.add_argument("--meter", action="store_true", help="Dimension is in meter")
+    parser.add_argument("--batch", help="CSV, JSON or YAML file with one parameter set per row")
+    parser.add_argument("--library", default="CDP_Lib.inp", help="File name of the batch library")
+    parser.add_argument("--per-material", action="store_true",
+                        help="Write CDP_Mat.inp and SS curves into one folder per batch row")
+    parser.add_argument("--deck", help="Abaqus deck to copy into the output folder with the generated material")
+    parser.add_argument("--material-name", default="CDP", help="Name of the material in the deck (default: CDP)")
+    parser.add_argument("--tolerance", type=float,
+                        help="Max stress error in MPa: place the table points adaptively instead of the fixed grids")
+    parser.add_argument("--cache", nargs="?", const="", metavar="DIR",
+                        help="Reuse previously generated files (default DIR: $COMAT_CACHE or ~/.cache/comat)")
+    parser.add_argument("--cache-size", type=COMat_Cache.parse_size, default=COMat_Cache.DEFAULT_MAX_BYTES,
+                        help="Size limit of the cache, least recently used entries are evicted (default: 1G)")
+    parser.add_argument("--cache-link", action="store_true",
+                        help="Hard link cached files instead of copying them. Linked files share the cache entry and "
+                             "are read-only: copy one before editing it")
+    parser.add_argument("--profile", metavar="REPORT.json", help="Write stage timers and counters to a JSON report")
+    parser.add_argument("--profile-dump", metavar="FILE",
+                        help="Write a cProfile dump (pyinstrument HTML when FILE ends with .html)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not list written files")
+
+    group = parser.add_argument_group("material parameters (defaults for batch rows)")
+    group.add_argument("--E", type=float, default=DEFAULTS["E"], help="Elastic modulus in GPa")
+    group.add_argument("--S_cu", type=float, default=DEFAULTS["S_cu"], help="Max compressive stress in MPa")
+    group.add_argument("--e_cu", type=float, default=DEFAULTS["e_cu"], help="Strain at max compressive stress")
+    group.add_argument("--e_60", "--e_63", dest="e_60", type=float, default=DEFAULTS["e_60"], help="Weibull scale strain")
+    group.add_argument("--Alpha", type=float, default=DEFAULTS["Alpha"], help="Weibull shape exponent")
+    group.add_argument("--Tension_Recovery", type=float, default=DEFAULTS["Tension_Recovery"], help="w_t")
+    group.add_argument("--S_tu", type=float, default=DEFAULTS["S_tu"], help="Max tensile stress in MPa")
+    group.add_argument("--e_end", type=float, default=DEFAULTS["e_end"], help="End strain of tension stiffening")
+    group.add_argument("--Beta", type=float, default=DEFAULTS["Beta"], help="Power law exponent")
+    group.add_argument("--Compression_Recovory", "--Compression_Recovery", dest="Compression_Recovory",
+                       type=float, default=DEFAULTS["Compression_Recovory"], help="w_c")
+    group.add_argument("--Ref_Length", type=float, default=DEFAULTS["Ref_Length"], help="Reference length")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        if args.profile is None and args.profile_dump is None:
+            Written = run(args)
+        else:
+            with COMat_Profile.Session(COMat_Profile.generator_targets(), args.profile, args.profile_dump) as Session:
+                Written = run(args)
+            if not args.quiet:
+                print(Session.summary())
+    except ValueError as ve:
+        print("Error: " + str(ve), file=sys.stderr)
+        return 1
+    except OSError as e:
+        print("Error: " + str(e), file=sys.stderr)
+        return 1
+
+    if not args.quiet:
+        for FilePathName in Written:
+            print(FilePathName)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())